@@ -0,0 +1,167 @@
+"""
+Бенчмарк обращений к БД на типичных хендлерах: сколько SQL-запросов
+(= round trip до Postgres) делает каждый путь и сколько это стоит по времени.
+
+Сравнивает прежний доступ к данным (сначала get_user ради users.id, потом
+отдельные запросы) с текущим crud:
+    * /add                    — get_token + get_active_playlist против get_upload_context;
+    * выбор плейлиста         — set_active_playlist;
+    * создание плейлиста      — create_playlist_and_set_active;
+    * запись загруженного трека — add_track.
+
+Кеш токенов перед каждым вызовом сбрасывается, чтобы считать честный промах.
+
+Нужен живой Postgres: таблицы создаются во временной схеме и удаляются
+после прогона, данные бота не трогаются.
+
+Запуск:
+    DATABASE_URL=postgresql+asyncpg://... python -m benchmarks.db_queries [кол-во повторов]
+"""
+import os
+import sys
+import time
+import uuid
+import asyncio
+
+from sqlalchemy import event, select, update, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from src.database import crud
+from src.database.models import Base, User, Playlist, Track
+from src.utils.auth_cache import tokens
+from src.utils.crypto import decrypt_token
+
+TG_ID = 1
+
+
+# Прежняя реализация — для сравнения
+async def legacy_get_token(session: AsyncSession, tg_id: int):
+    encrypted = await session.scalar(select(User.token).where(User.tg_id == tg_id))
+    return decrypt_token(encrypted) if encrypted is not None else None
+
+
+async def legacy_get_active_playlist(session: AsyncSession, tg_id: int):
+    result = await session.execute(
+        select(Playlist).join(User).where(User.tg_id == tg_id, Playlist.is_active == True)
+    )
+    return result.scalar_one_or_none()
+
+
+async def legacy_set_active_playlist(session: AsyncSession, tg_id: int, playlist_id: int) -> None:
+    user = await crud.get_user(session, tg_id)
+    await session.execute(update(Playlist).where(Playlist.user_id == user.id).values(is_active=False))
+    await session.execute(
+        update(Playlist).where(Playlist.user_id == user.id, Playlist.id == playlist_id).values(is_active=True)
+    )
+    await session.commit()
+
+
+async def legacy_create_playlist_and_set_active(session: AsyncSession, tg_id: int, kind: str, title: str):
+    user = await crud.get_user(session, tg_id)
+    await session.execute(update(Playlist).where(Playlist.user_id == user.id).values(is_active=False))
+    playlist = Playlist(user_id=user.id, kind=kind, title=title, is_active=True)
+    session.add(playlist)
+    await session.commit()
+    await session.refresh(playlist)
+    return playlist
+
+
+async def legacy_add_track(session: AsyncSession, tg_id: int, artist: str, title: str, playlist_kind: str) -> None:
+    user = await crud.get_user(session, tg_id)
+    playlist_id = await session.scalar(
+        select(Playlist.id).where(Playlist.user_id == user.id, Playlist.kind == playlist_kind)
+    )
+    session.add(Track(user_id=user.id, playlist_id=playlist_id, artist=artist, title=title))
+    await session.execute(update(User).where(User.id == user.id).values(track_count=User.track_count + 1))
+    await session.commit()
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine.sync_engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args) -> None:
+        self.count += 1
+
+
+async def run_case(name: str, make_session, counter: QueryCounter, call, repeats: int) -> None:
+    queries = 0
+    started = time.perf_counter()
+    for i in range(repeats):
+        tokens.clear()
+        async with make_session() as session:
+            before = counter.count
+            await call(session, i)
+            queries += counter.count - before
+    elapsed = time.perf_counter() - started
+    print(f"{name:<40} {queries / repeats:5.1f} запросов  {elapsed * 1000 / repeats:7.2f} ms/вызов")
+
+
+async def main(repeats: int) -> None:
+    url = os.getenv("DATABASE_URL")
+    if not url:
+        sys.exit("Нужен DATABASE_URL с Postgres (таблицы создаются во временной схеме)")
+
+    schema = f"bench_{uuid.uuid4().hex[:8]}"
+    engine = create_async_engine(url, connect_args={"server_settings": {"search_path": schema}})
+    make_session = async_sessionmaker(engine)
+    counter = QueryCounter(engine)
+
+    async with engine.begin() as conn:
+        await conn.execute(text(f"CREATE SCHEMA {schema}"))
+        await conn.run_sync(Base.metadata.create_all)
+
+    try:
+        async with make_session() as session:
+            await crud.create_user(session, TG_ID, "bench")
+            await crud.set_token(session, TG_ID, "y0_benchmark_token")
+            first = await crud.create_playlist_and_set_active(session, TG_ID, "1000", "Загрузки")
+            second = await crud.create_playlist(session, TG_ID, "1001", "Второй")
+        playlist_ids = (first.id, second.id)
+
+        async def legacy_add(session, i):
+            await legacy_get_token(session, TG_ID)
+            await legacy_get_active_playlist(session, TG_ID)
+
+        async def current_add(session, i):
+            await crud.get_upload_context(session, TG_ID)
+
+        print(f"{repeats} повторов каждого пути\n")
+        await run_case("/add: прежний", make_session, counter, legacy_add, repeats)
+        await run_case("/add: get_upload_context", make_session, counter, current_add, repeats)
+
+        await run_case(
+            "выбор плейлиста: прежний", make_session, counter,
+            lambda session, i: legacy_set_active_playlist(session, TG_ID, playlist_ids[i % 2]), repeats,
+        )
+        await run_case(
+            "выбор плейлиста: set_active_playlist", make_session, counter,
+            lambda session, i: crud.set_active_playlist(session, TG_ID, playlist_ids[i % 2]), repeats,
+        )
+
+        await run_case(
+            "новый плейлист: прежний", make_session, counter,
+            lambda session, i: legacy_create_playlist_and_set_active(session, TG_ID, f"legacy-{i}", "x"), repeats,
+        )
+        await run_case(
+            "новый плейлист: create_playlist_and_set_active", make_session, counter,
+            lambda session, i: crud.create_playlist_and_set_active(session, TG_ID, f"current-{i}", "x"), repeats,
+        )
+
+        await run_case(
+            "запись трека: прежний", make_session, counter,
+            lambda session, i: legacy_add_track(session, TG_ID, "artist", f"legacy {i}", "1000"), repeats,
+        )
+        await run_case(
+            "запись трека: add_track", make_session, counter,
+            lambda session, i: crud.add_track(session, TG_ID, "artist", f"current {i}", playlist_kind="1000"), repeats,
+        )
+    finally:
+        async with engine.begin() as conn:
+            await conn.execute(text(f"DROP SCHEMA {schema} CASCADE"))
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200))
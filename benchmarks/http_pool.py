@@ -0,0 +1,136 @@
+"""
+Бенчмарк общего пула HTTP-соединений против новой сессии на каждый запрос.
+
+Поднимает локальный HTTPS-сервер (самоподписанный сертификат) вместо
+api.music.yandex.net и сравнивает:
+    * aiohttp.ClientSession() на каждый запрос (как было в uploader/oauth);
+    * yandex_music Request (aiohttp.request с force_close);
+    * общую сессию из src.utils.http_session;
+    * PooledRequest поверх общего пула.
+
+Сервер считает новые TCP-соединения — это и есть количество TLS-рукопожатий.
+
+Запуск:
+    python -m benchmarks.http_pool [кол-во запросов]
+"""
+import os
+import ssl
+import sys
+import time
+import asyncio
+import datetime
+import tempfile
+import ipaddress
+
+import aiohttp
+from aiohttp import web
+from cryptography import x509
+from cryptography.x509.oid import NameOID
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from yandex_music.utils.request_async import Request
+
+from src.utils.http_session import get_http_session, close_http_session, PooledRequest
+
+HOST = "127.0.0.1"
+
+
+def make_certificate(directory: str) -> tuple[str, str]:
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(x509.SubjectAlternativeName([x509.IPAddress(ipaddress.ip_address(HOST))]), critical=False)
+        .sign(key, hashes.SHA256())
+    )
+    cert_path = os.path.join(directory, "cert.pem")
+    key_path = os.path.join(directory, "key.pem")
+    with open(cert_path, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, "wb") as f:
+        f.write(key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        ))
+    return cert_path, key_path
+
+
+async def start_server(cert_path: str, key_path: str) -> tuple[web.AppRunner, str, set]:
+    connections = set()
+
+    async def handler(request: web.Request) -> web.Response:
+        connections.add(request.transport.get_extra_info("peername"))
+        return web.json_response({"result": "ok"})
+
+    app = web.Application()
+    app.router.add_route("*", "/{tail:.*}", handler)
+
+    server_ctx = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    server_ctx.load_cert_chain(cert_path, key_path)
+
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, HOST, 0, ssl_context=server_ctx)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"https://{HOST}:{port}/account/status", connections
+
+
+async def run_case(name: str, call, count: int, connections: set) -> None:
+    connections.clear()
+    started = time.perf_counter()
+    for _ in range(count):
+        await call()
+    elapsed = time.perf_counter() - started
+    print(
+        f"{name:<32} {elapsed * 1000:9.1f} ms total  "
+        f"{elapsed * 1000 / count:7.2f} ms/req  "
+        f"{len(connections):5d} handshakes"
+    )
+
+
+async def main(count: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        cert_path, key_path = make_certificate(tmp)
+        runner, url, connections = await start_server(cert_path, key_path)
+        client_ctx = ssl.create_default_context(cafile=cert_path)
+
+        async def fresh_session():
+            async with aiohttp.ClientSession() as session:
+                async with session.post(url, ssl=client_ctx) as resp:
+                    await resp.read()
+
+        async def shared_session():
+            async with get_http_session().post(url, ssl=client_ctx) as resp:
+                await resp.read()
+
+        plain_request = Request()
+        pooled_request = PooledRequest()
+
+        async def library_request():
+            await plain_request.retrieve(url, ssl=client_ctx)
+
+        async def library_pooled_request():
+            await pooled_request.retrieve(url, ssl=client_ctx)
+
+        print(f"{count} последовательных запросов к {url}\n")
+        try:
+            await run_case("ClientSession на запрос", fresh_session, count, connections)
+            await run_case("общая сессия", shared_session, count, connections)
+            await run_case("yandex_music Request", library_request, count, connections)
+            await run_case("PooledRequest", library_pooled_request, count, connections)
+        finally:
+            await close_http_session()
+            await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200))
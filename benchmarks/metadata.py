@@ -0,0 +1,100 @@
+"""
+Микро-бенчмарк чтения тегов: header-only ID3 против прежнего MP3()-пути.
+
+Генерирует набор синтетических MP3 (ID3v2 с крупной обложкой + MPEG-фреймы)
+и сравнивает:
+    * прежнюю реализацию: mutagen.mp3.MP3 (сканирует MPEG-фреймы ради
+      stream info), запись APIC в <file>.jpg, чтение обратно и удаление;
+    * текущую extract_metadata: только область ID3-тега, обложка в памяти.
+
+Запуск:
+    python -m benchmarks.metadata [кол-во файлов] [размер обложки, КБ] [длительность, сек]
+"""
+import io
+import os
+import sys
+import time
+import tempfile
+
+from mutagen.mp3 import MP3
+from mutagen.id3 import ID3, APIC, TIT2, TPE1
+
+from src.utils.metadata import extract_metadata
+
+# MPEG-1 Layer III, 128 kbps, 44.1 kHz, без padding: 417 байт, ~26 мс звука
+FRAME_HEADER = bytes.fromhex("FFFB9064")
+FRAME_SIZE = 417
+FRAMES_PER_SECOND = 38
+
+
+def make_corpus(directory: str, count: int, cover_kb: int, seconds: int) -> list[str]:
+    frame = FRAME_HEADER + bytes(FRAME_SIZE - len(FRAME_HEADER))
+    audio = frame * (FRAMES_PER_SECOND * seconds)
+    paths = []
+    for i in range(count):
+        tags = ID3()
+        tags.add(TIT2(encoding=3, text=f"Track {i}"))
+        tags.add(TPE1(encoding=3, text="Benchmark Artist"))
+        tags.add(APIC(encoding=3, mime="image/jpeg", type=3, desc="", data=os.urandom(cover_kb * 1024)))
+        header = io.BytesIO()
+        tags.save(header)
+
+        path = os.path.join(directory, f"track_{i}.mp3")
+        with open(path, "wb") as f:
+            f.write(header.getvalue())
+            f.write(audio)
+        paths.append(path)
+    return paths
+
+
+def legacy_extract(file_path: str) -> tuple[str, str, bytes | None]:
+    """Прежний путь, включая круг через диск, который делал uploader."""
+    audio = MP3(file_path, ID3=ID3)
+    title = str(audio.get("TIT2", os.path.basename(file_path)))
+    artist = str(audio.get("TPE1", "Unknown Artist"))
+    cover = None
+    if audio.tags:
+        for tag in audio.tags.values():
+            if isinstance(tag, APIC):
+                cover_path = file_path + ".jpg"
+                with open(cover_path, "wb") as img:
+                    img.write(tag.data)
+                with open(cover_path, "rb") as img:
+                    cover = img.read()
+                os.remove(cover_path)
+                break
+    return artist, title, cover
+
+
+def current_extract(file_path: str) -> tuple[str, str, bytes | None]:
+    artist, title, cover = extract_metadata(file_path)
+    return artist, title, cover.data if cover else None
+
+
+def run_case(name: str, func, paths: list[str], rounds: int = 3) -> float:
+    best = float("inf")
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for path in paths:
+            func(path)
+        best = min(best, time.perf_counter() - started)
+    print(f"{name:<28} {best * 1000:9.1f} ms  {best * 1000 / len(paths):7.2f} ms/file")
+    return best
+
+
+def main(count: int, cover_kb: int, seconds: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = make_corpus(tmp, count, cover_kb, seconds)
+        size_mb = os.path.getsize(paths[0]) / 1024 / 1024
+        print(f"{count} файлов по {size_mb:.1f} МБ, обложка {cover_kb} КБ, {seconds} с звука\n")
+
+        assert legacy_extract(paths[0]) == current_extract(paths[0])
+
+        legacy = run_case("MP3() + обложка через диск", legacy_extract, paths)
+        current = run_case("header-only ID3", current_extract, paths)
+        print(f"\nускорение: x{legacy / current:.1f}")
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:]]
+    main(*(args + [50, 2048, 240][len(args):]))
@@ -0,0 +1,242 @@
+"""
+Проверка и замер RespStorage (FSM в Redis-совместимом хранилище) без Redis.
+
+Поднимает локально минимальный RESP-сервер (PING, AUTH, SELECT, GET,
+SET с EX, DEL, TTL) и гоняет против него RespClient/RespStorage:
+    * состояние и данные FSM записываются и читаются обратно, очистка удаляет ключи;
+    * TTL: ключи получают срок жизни и после него читаются как пустые;
+    * переподключение: сервер рвёт соединения, следующая команда проходит;
+    * отмена: команду прерывают посреди ожидания ответа, следующая команда
+      получает свой ответ, а не чужой;
+    * пароль и номер базы из URL уходят в AUTH и SELECT.
+Затем печатает скорость set_state/get_state/set_data/get_data.
+
+Стенд — словарь в памяти на Python, он медленнее настоящего Redis; цифры
+показывают порядок накладных расходов клиента и round trip, а не сервера.
+
+Запуск:
+    python -m benchmarks.resp_storage [кол-во операций]
+"""
+import sys
+import time
+import asyncio
+
+from aiogram.fsm.storage.base import StorageKey
+
+from src.utils.fsm_storage import RespClient, RespStorage, RespError
+
+HOST = "127.0.0.1"
+
+
+class RespStandIn:
+    """Redis-подобный сервер в памяти: ровно те команды, что нужны RespStorage."""
+
+    def __init__(self, password: str | None = None):
+        self.password = password
+        self.data: dict[bytes, tuple[bytes, float | None]] = {}
+        self.commands: list[list[bytes]] = []
+        self.delay = 0.0  # задержка перед ответом на SET — для проверки отмены
+        self._writers: set[asyncio.StreamWriter] = set()
+        self._server: asyncio.AbstractServer | None = None
+
+    async def start(self) -> int:
+        self._server = await asyncio.start_server(self._serve, HOST, 0)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        self.drop_connections()
+        self._server.close()
+        await self._server.wait_closed()
+
+    def drop_connections(self) -> None:
+        for writer in list(self._writers):
+            writer.close()
+        self._writers.clear()
+
+    def _get(self, key: bytes) -> bytes | None:
+        item = self.data.get(key)
+        if item is None:
+            return None
+        value, expires = item
+        if expires is not None and time.monotonic() >= expires:
+            del self.data[key]
+            return None
+        return value
+
+    async def _read_command(self, reader: asyncio.StreamReader) -> list[bytes] | None:
+        line = await reader.readline()
+        if not line:
+            return None
+        count = int(line[1:-2])
+        args = []
+        for _ in range(count):
+            size = int((await reader.readline())[1:-2])
+            args.append((await reader.readexactly(size + 2))[:-2])
+        return args
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._writers.add(writer)
+        authed = self.password is None
+        try:
+            while (args := await self._read_command(reader)) is not None:
+                self.commands.append(args)
+                name = args[0].upper()
+                if name == b"AUTH":
+                    authed = args[-1].decode() == self.password
+                    reply = b"+OK\r\n" if authed else b"-WRONGPASS invalid password\r\n"
+                elif not authed:
+                    reply = b"-NOAUTH Authentication required\r\n"
+                elif name in (b"PING", b"SELECT"):
+                    reply = b"+PONG\r\n" if name == b"PING" else b"+OK\r\n"
+                elif name == b"SET":
+                    expires = None
+                    if len(args) >= 5 and args[3].upper() == b"EX":
+                        expires = time.monotonic() + int(args[4])
+                    self.data[args[1]] = (args[2], expires)
+                    if self.delay:
+                        await asyncio.sleep(self.delay)
+                    reply = b"+OK\r\n"
+                elif name == b"GET":
+                    value = self._get(args[1])
+                    reply = b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+                elif name == b"DEL":
+                    removed = sum(1 for key in args[1:] if self.data.pop(key, None) is not None)
+                    reply = b":%d\r\n" % removed
+                elif name == b"TTL":
+                    item = self.data.get(args[1])
+                    if item is None:
+                        reply = b":-2\r\n"
+                    elif item[1] is None:
+                        reply = b":-1\r\n"
+                    else:
+                        reply = b":%d\r\n" % round(item[1] - time.monotonic())
+                else:
+                    reply = b"-ERR unknown command\r\n"
+                writer.write(reply)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            # Клиент ушёл или стенд останавливается
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+
+def make_key(user_id: int) -> StorageKey:
+    return StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+
+
+class Checks:
+    def __init__(self):
+        self.failed = 0
+
+    def check(self, name: str, ok: bool, detail: str = "") -> None:
+        if not ok:
+            self.failed += 1
+        print(f"{'✓' if ok else '✗'} {name}{f' ({detail})' if detail and not ok else ''}")
+
+
+async def run_checks(checks: Checks) -> None:
+    server = RespStandIn()
+    port = await server.start()
+    client = RespClient(f"redis://{HOST}:{port}/0")
+    storage = RespStorage(client, ttl=1)
+    key = make_key(1)
+    try:
+        await storage.set_state(key, "UserSteps:uploading")
+        await storage.set_data(key, {"playlist_kind": "3", "n": 1})
+        state, data = await storage.get_state(key), await storage.get_data(key)
+        checks.check("состояние и данные читаются обратно",
+                     state == "UserSteps:uploading" and data == {"playlist_kind": "3", "n": 1}, f"{state!r} {data!r}")
+
+        ttl = await client.execute("TTL", storage.key_builder.build(key, "state"))
+        checks.check("ключи пишутся с TTL", ttl == 1, f"TTL={ttl}")
+
+        await asyncio.sleep(1.1)
+        state, data = await storage.get_state(key), await storage.get_data(key)
+        checks.check("после TTL запись читается пустой", state is None and data == {}, f"{state!r} {data!r}")
+
+        await storage.set_state(key, "UserSteps:uploading")
+        await storage.set_data(key, {"a": 1})
+        await storage.set_state(key, None)
+        await storage.set_data(key, {})
+        checks.check("очистка удаляет ключи", not server.data, f"{list(server.data)}")
+
+        await storage.set_state(key, "A")
+        server.drop_connections()
+        await asyncio.sleep(0.05)
+        state = await storage.get_state(key)
+        checks.check("после обрыва соединения команда повторяется", state == "A", f"{state!r}")
+
+        server.delay = 0.5
+        slow = asyncio.create_task(storage.set_state(key, "B"))
+        await asyncio.sleep(0.1)
+        slow.cancel()
+        await asyncio.gather(slow, return_exceptions=True)
+        server.delay = 0.0
+        await asyncio.sleep(0.5)
+        try:
+            state = await storage.get_state(key)
+            ok, detail = state == "B", f"{state!r}"
+        except Exception as e:
+            ok, detail = False, repr(e)
+        checks.check("после отмены команды ответы не сдвигаются", ok, detail)
+    finally:
+        await client.close()
+        await server.stop()
+
+    server = RespStandIn(password="secret")
+    port = await server.start()
+    client = RespClient(f"redis://:secret@{HOST}:{port}/2")
+    try:
+        await client.execute("PING")
+        sent = [args[0] for args in server.commands[:2]]
+        checks.check("пароль и база из URL уходят в AUTH и SELECT", sent == [b"AUTH", b"SELECT"], f"{sent}")
+        await client.close()
+
+        bad = RespClient(f"redis://:wrong@{HOST}:{port}/0")
+        try:
+            await bad.execute("PING")
+            ok = False
+        except RespError:
+            ok = bad._writer is None
+        checks.check("неверный пароль — ошибка, соединение не остаётся", ok)
+        await bad.close()
+    finally:
+        await server.stop()
+
+
+async def run_benchmark(count: int) -> None:
+    server = RespStandIn()
+    port = await server.start()
+    client = RespClient(f"redis://{HOST}:{port}/0")
+    storage = RespStorage(client)
+    try:
+        cases = [
+            ("set_state", lambda i: storage.set_state(make_key(i), "UserSteps:uploading")),
+            ("get_state", lambda i: storage.get_state(make_key(i))),
+            ("set_data", lambda i: storage.set_data(make_key(i), {"playlist_kind": "3"})),
+            ("get_data", lambda i: storage.get_data(make_key(i))),
+        ]
+        print(f"\n{count} операций каждого вида, по одной за раз\n")
+        for name, op in cases:
+            started = time.perf_counter()
+            for i in range(count):
+                await op(i % 100)
+            elapsed = time.perf_counter() - started
+            print(f"{name:<10} {count / elapsed:8.0f} оп/с  {elapsed * 1e6 / count:7.1f} мкс/оп")
+    finally:
+        await client.close()
+        await server.stop()
+
+
+async def main(count: int) -> None:
+    checks = Checks()
+    await run_checks(checks)
+    await run_benchmark(count)
+    if checks.failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000))
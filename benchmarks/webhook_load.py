@@ -0,0 +1,173 @@
+"""
+Нагрузочный тест приёма апдейтов через вебхук.
+
+Поднимает локально aiohttp-приложение из src.utils.webhook с диспетчером,
+в котором один хендлер сообщений имитирует работу (asyncio.sleep), и шлёт
+в него синтетические апдейты с нужным секретом — как Telegram, несколькими
+параллельными соединениями. Сравнивает:
+    * обработку прямо в запросе (SimpleRequestHandler без фона);
+    * BoundedRequestHandler — ответ сразу, очередь и пул обработчиков.
+
+Для каждого режима печатает пропускную способность, задержку ответа
+(p50/p95/max) и сколько апдейтов обработано; отдельно проверяется, что
+запрос с чужим секретом получает 401, а повторно доставленный апдейт
+не обрабатывается второй раз. В Telegram ничего не отправляется.
+
+Запуск:
+    python -m benchmarks.webhook_load [кол-во апдейтов] [соединений] [мс на апдейт] [лимит в обработке]
+"""
+import sys
+import time
+import asyncio
+import statistics
+
+import aiohttp
+from aiohttp import web
+from aiogram import Bot, Dispatcher, Router
+from aiogram.types import Message
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+from src.utils.webhook import BoundedRequestHandler, WEBHOOK_PATH
+
+HOST = "127.0.0.1"
+SECRET = "benchmark-secret"
+# Токен нужного формата: обращений к Bot API в тесте нет
+BOT_TOKEN = "123456:benchmark"
+
+
+def make_update(update_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": 1000 + update_id % 50, "type": "private"},
+            "from": {"id": 1000 + update_id % 50, "is_bot": False, "first_name": "Load"},
+            "text": f"track {update_id}",
+        },
+    }
+
+
+def make_dispatcher(delay: float, handled: list) -> Dispatcher:
+    router = Router()
+
+    @router.message()
+    async def on_message(message: Message) -> None:
+        await asyncio.sleep(delay)
+        handled.append(message.message_id)
+
+    dp = Dispatcher()
+    dp.include_router(router)
+    return dp
+
+
+async def start_app(handler: SimpleRequestHandler, dp: Dispatcher, bot: Bot) -> tuple[web.AppRunner, str]:
+    app = web.Application()
+    handler.register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, HOST, 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://{HOST}:{port}{WEBHOOK_PATH}"
+
+
+async def replay(url: str, count: int, connections: int) -> tuple[float, list[float], int]:
+    latencies: list[float] = []
+    errors = 0
+    ids = iter(range(1, count + 1))
+    headers = {"X-Telegram-Bot-Api-Secret-Token": SECRET}
+
+    async def sender(session: aiohttp.ClientSession) -> None:
+        nonlocal errors
+        for update_id in ids:
+            started = time.perf_counter()
+            async with session.post(url, json=make_update(update_id), headers=headers) as resp:
+                await resp.read()
+                if resp.status != 200:
+                    errors += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    connector = aiohttp.TCPConnector(limit=connections)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        started = time.perf_counter()
+        await asyncio.gather(*(sender(session) for _ in range(connections)))
+        elapsed = time.perf_counter() - started
+    return elapsed, latencies, errors
+
+
+async def check_secret(url: str) -> int:
+    async with aiohttp.ClientSession() as session:
+        headers = {"X-Telegram-Bot-Api-Secret-Token": "wrong"}
+        async with session.post(url, json=make_update(0), headers=headers) as resp:
+            return resp.status
+
+
+async def resend(url: str, update_id: int) -> int:
+    async with aiohttp.ClientSession() as session:
+        headers = {"X-Telegram-Bot-Api-Secret-Token": SECRET}
+        async with session.post(url, json=make_update(update_id), headers=headers) as resp:
+            return resp.status
+
+
+async def run_case(name: str, make_handler, count: int, connections: int, delay: float) -> None:
+    handled: list[int] = []
+    dp = make_dispatcher(delay, handled)
+    bot = Bot(BOT_TOKEN)
+    handler = make_handler(dp, bot)
+    runner, url = await start_app(handler, dp, bot)
+    try:
+        elapsed, latencies, errors = await replay(url, count, connections)
+        answered = len(handled)
+        # Фоновые обработчики дорабатывают после ответов
+        while len(handled) < count - errors:
+            await asyncio.sleep(0.01)
+        latencies.sort()
+        print(
+            f"{name:<28} {count / elapsed:8.0f} req/s  "
+            f"p50 {statistics.median(latencies):7.2f} ms  "
+            f"p95 {latencies[int(len(latencies) * 0.95) - 1]:7.2f} ms  "
+            f"max {latencies[-1]:7.2f} ms  "
+            f"обработано к концу отправки {answered}/{count}, ошибок {errors}"
+        )
+        if isinstance(handler, BoundedRequestHandler):
+            status = await check_secret(url)
+            before = len(handled)
+            resent = await resend(url, 1)
+            await asyncio.sleep(delay + 0.05)
+            print(
+                f"{'':<28} чужой секрет -> HTTP {status}, повтор апдейта -> HTTP {resent}, "
+                f"обработан заново: {'да' if len(handled) > before else 'нет'}"
+            )
+            print(f"{'':<28} счётчики: {handler.stats()}")
+    finally:
+        await runner.cleanup()
+
+
+async def main(count: int, connections: int, delay_ms: float, max_in_flight: int) -> None:
+    delay = delay_ms / 1000
+    print(
+        f"{count} апдейтов, {connections} соединений, {delay_ms:g} мс на апдейт, "
+        f"лимит в обработке {max_in_flight}\n"
+    )
+    await run_case(
+        "обработка в запросе",
+        lambda dp, bot: SimpleRequestHandler(dp, bot, handle_in_background=False, secret_token=SECRET),
+        count, connections, delay,
+    )
+    await run_case(
+        "фон с лимитом",
+        lambda dp, bot: BoundedRequestHandler(dp, bot, max_in_flight=max_in_flight, secret_token=SECRET),
+        count, connections, delay,
+    )
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    asyncio.run(main(
+        int(args[0]) if len(args) > 0 else 2000,
+        int(args[1]) if len(args) > 1 else 40,
+        float(args[2]) if len(args) > 2 else 50,
+        int(args[3]) if len(args) > 3 else 100,
+    ))
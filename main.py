@@ -6,13 +6,7 @@ import sys
 from dotenv import load_dotenv
 load_dotenv()
 
-from aiogram import Bot, Dispatcher
-from aiogram.client.default import DefaultBotProperties
-from aiogram.client.session.aiohttp import AiohttpSession
-from aiogram.client.telegram import TelegramAPIServer, SimpleFilesPathWrapper
-from aiogram.enums import ParseMode
-from aiogram.fsm.storage.memory import MemoryStorage
-import pathlib
+from aiogram import Dispatcher
 
 from src.database.models import async_main
 
@@ -25,6 +19,16 @@ from src.handlers.help import router as help_router
 from src.handlers.admin import router as admin_router
 
 from src.middlewares.auth_middleware import CheckTokenMiddleware
+from src.utils.bot_factory import create_bot
+from src.utils.http_session import init_http_session, close_http_session
+from src.utils.upload_queue import upload_scheduler
+from src.utils.track_finisher import track_finisher
+from src.utils.stats_reconciler import stats_reconciler
+from src.utils.broadcast import broadcast_engine
+from src.utils.fsm_storage import create_storage
+from src.utils.webhook import is_webhook_mode, run_webhook
+from src.utils.upload_worker import upload_watcher, upload_worker
+from src.utils.background import background_tasks
 
 async def main():
     logging.basicConfig(
@@ -38,32 +42,21 @@ async def main():
         logger.error("Установите BOT_TOKEN")
         sys.exit(1)
 
-    bot_kwargs = {
-        "token": bot_token,
-        "default": DefaultBotProperties(
-            parse_mode=ParseMode.HTML,
-            link_preview_is_disabled=True
-        )
-    }
-
-    server_url = os.getenv("TELEGRAM_API_URL")
-    if server_url:
-        local_path = pathlib.Path("/var/lib/telegram-bot-api")
-        bot_kwargs["session"] = AiohttpSession(
-            api=TelegramAPIServer.from_base(
-                server_url,
-                is_local=True,
-                wrap_local_file=SimpleFilesPathWrapper(
-                    server_path=local_path,
-                    local_path=local_path
-                )
-            )
-        )
-        logger.info(f"Используется локальный сервер Telegram API: {server_url}")
-
-    bot = Bot(**bot_kwargs)
-
-    dp = Dispatcher(storage=MemoryStorage())
+    bot = create_bot(bot_token)
+
+    try:
+        await async_main()
+    except Exception as e:
+        logger.error(f"Ошибка подключения к БД: {e}")
+        return
+
+    try:
+        storage = await create_storage()
+    except Exception as e:
+        logger.error(f"Не удалось подключить хранилище FSM: {e}")
+        return
+
+    dp = Dispatcher(storage=storage)
 
     dp.message.outer_middleware(CheckTokenMiddleware())
 
@@ -75,16 +68,31 @@ async def main():
     dp.include_router(help_router)
     dp.include_router(admin_router)
 
-    try:
-        await async_main()
-    except Exception as e:
-        logger.error(f"Ошибка подключения к БД: {e}")
-        return
+    await init_http_session()
+    upload_scheduler.start()
+    track_finisher.start()
+    stats_reconciler.start()
 
-    await bot.delete_webhook(drop_pending_updates=True)
-    
-    logger.info("Бот запущен...")
-    await dp.start_polling(bot)
+    try:
+        if is_webhook_mode():
+            logger.info("Бот запущен (webhook)...")
+            await run_webhook(bot, dp)
+        else:
+            await bot.delete_webhook(drop_pending_updates=True)
+
+            logger.info("Бот запущен...")
+            await dp.start_polling(bot)
+    finally:
+        await background_tasks.stop()
+        await upload_scheduler.stop()
+        await track_finisher.stop()
+        # UPLOAD_BACKEND=local: недоделанные задачи сразу достаются другим репликам
+        await upload_worker.stop()
+        await upload_worker.release()
+        await stats_reconciler.stop()
+        await broadcast_engine.stop()
+        await upload_watcher.stop()
+        await close_http_session()
 
 if __name__ == "__main__":
     try:    
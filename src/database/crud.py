@@ -1,30 +1,74 @@
-from sqlalchemy import select, update, delete, func, desc
+from sqlalchemy import select, insert, update, delete, func, desc, or_, and_, case, literal, values, column, String, Integer
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
-from src.database.models import User, Track, Playlist
+from sqlalchemy.orm import joinedload
+from src.database.models import (
+    User, Track, Playlist, PhotoCache, UploadJob, Counter, Broadcast, BroadcastDelivery, FsmRecord,
+    JOB_FINAL_STAGES, JOB_FAILED, JOB_ERROR_EXHAUSTED, COUNTER_USERS, COUNTER_TRACKS,
+    BROADCAST_RUNNING, BROADCAST_CANCELLED, DELIVERY_SENT, DELIVERY_FAILED, DELIVERY_BLOCKED,
+)
 from src.utils.crypto import encrypt_token, decrypt_token
+from src.utils.auth_cache import invalidate_token_status, tokens
+from src.utils.ttl_cache import MISSING
+from src.database.metrics import labeled
 
+from dataclasses import dataclass
+from datetime import datetime, timedelta
 from typing import List
 
 
+@dataclass
+class UploadContext:
+    """Всё, что нужно /add: токен и активный плейлист пользователя."""
+    token: str | None
+    playlist_kind: str | None
+    playlist_title: str | None
+
+
+def _bump_counter(name: str, delta: int):
+    """UPSERT счётчика: выполняется в транзакции, которая меняет сами данные."""
+    return (
+        pg_insert(Counter)
+        .values(name=name, value=delta)
+        .on_conflict_do_update(index_elements=[Counter.name], set_={"value": Counter.value + delta})
+    )
+
+
+def _user_id(tg_id: int):
+    """Подзапрос users.id по tg_id — чтобы не делать отдельный SELECT перед изменением."""
+    return select(User.id).where(User.tg_id == tg_id).scalar_subquery()
+
+
+@labeled
 async def create_user(session: AsyncSession, tg_id: int, username: str = None) -> User:
     user = await get_user(session, tg_id)
     if user:
+        changed = False
         if username and user.username != username:
             user.username = username
+            changed = True
+        if user.blocked_at is not None:
+            # Пользователь снова написал боту — значит, разблокировал, рассылки ему снова доходят
+            user.blocked_at = None
+            changed = True
+        if changed:
             await session.commit()
         return user
 
     user = User(tg_id=tg_id, username=username)
     session.add(user)
+    await session.execute(_bump_counter(COUNTER_USERS, 1))
     await session.commit()
     await session.refresh(user)
     return user
 
+@labeled
 async def get_user(session: AsyncSession, tg_id: int) -> User | None:
     query = select(User).where(User.tg_id == tg_id)
     result = await session.execute(query)
     return result.scalar_one_or_none()
 
+@labeled
 async def set_token(session: AsyncSession, tg_id: int, token: str) -> None:
     """Шифрует токен и сохраняет в базу данных."""
     encrypted = encrypt_token(token)
@@ -35,76 +79,117 @@ async def set_token(session: AsyncSession, tg_id: int, token: str) -> None:
     )
     await session.execute(stmt)
     await session.commit()
+    invalidate_token_status(tg_id)
+
+@labeled
+async def has_token(session: AsyncSession, tg_id: int) -> bool:
+    """Есть ли у пользователя сохранённый токен (без загрузки и расшифровки самого токена)."""
+    query = select(User.id).where(User.tg_id == tg_id, User.token.isnot(None), User.token != "")
+    result = await session.execute(query)
+    return result.scalar_one_or_none() is not None
+
+def _decrypt_cached(tg_id: int, encrypted: str | None) -> str | None:
+    """Расшифровка с кешем: запись годится, только пока шифротекст в БД тот же (см. src/utils/auth_cache.py)."""
+    if encrypted is None:
+        tokens.invalidate(tg_id)
+        return None
+    cached = tokens.get(tg_id)
+    if cached is not MISSING and cached[0] == encrypted:
+        return cached[1]
+    token = decrypt_token(encrypted)
+    tokens.set(tg_id, (encrypted, token))
+    return token
 
+@labeled
 async def get_token(session: AsyncSession, tg_id: int) -> str | None:
-    """Читает токен из базы и расшифровывает его."""
+    """Читает токен из базы и расшифровывает его (расшифровка кешируется)."""
     query = select(User.token).where(User.tg_id == tg_id)
     result = await session.execute(query)
-    encrypted = result.scalar_one_or_none()
-    if encrypted is None:
+    return _decrypt_cached(tg_id, result.scalar_one_or_none())
+
+@labeled
+async def get_upload_context(session: AsyncSession, tg_id: int) -> UploadContext | None:
+    """Токен и активный плейлист одним запросом (None — пользователя нет в базе)."""
+    query = (
+        select(User.token, Playlist.kind, Playlist.title)
+        .outerjoin(Playlist, and_(Playlist.user_id == User.id, Playlist.is_active == True))
+        .where(User.tg_id == tg_id)
+    )
+    row = (await session.execute(query)).first()
+    if row is None:
         return None
-    return decrypt_token(encrypted)
 
-async def create_playlist(session: AsyncSession, tg_id: int, kind: str, title: str) -> Playlist:
-    user = await get_user(session, tg_id)
-    if not user:
-        raise ValueError("User not found")
+    token = _decrypt_cached(tg_id, row.token)
+    return UploadContext(token=token, playlist_kind=row.kind, playlist_title=row.title)
 
+@labeled
+async def _insert_playlist(session: AsyncSession, tg_id: int, kind: str, title: str, is_active: bool) -> Playlist:
     await session.execute(
-        update(Playlist).where(Playlist.user_id == user.id).values(is_active=False)
+        update(Playlist).where(Playlist.user_id == _user_id(tg_id)).values(is_active=False)
+    )
+
+    # INSERT ... SELECT из users: id пользователя берётся в том же запросе
+    stmt = (
+        insert(Playlist)
+        .from_select(
+            ["user_id", "kind", "title", "is_active"],
+            select(User.id, literal(kind), literal(title), literal(is_active)).where(User.tg_id == tg_id),
+        )
+        .returning(Playlist)
     )
+    new_playlist = await session.scalar(stmt)
+    if new_playlist is None:
+        await session.rollback()
+        raise ValueError("User not found")
 
-    new_playlist = Playlist(user_id=user.id, kind=kind, title=title, is_active=False)
-    session.add(new_playlist)
+    # Отвязываем от сессии, чтобы commit не сбросил загруженные поля (и не понадобился refresh)
+    session.expunge(new_playlist)
     await session.commit()
-    await session.refresh(new_playlist)
     return new_playlist
 
+@labeled
+async def create_playlist(session: AsyncSession, tg_id: int, kind: str, title: str) -> Playlist:
+    return await _insert_playlist(session, tg_id, kind, title, is_active=False)
+
+@labeled
 async def create_playlist_and_set_active(session: AsyncSession, tg_id: int, kind: str, title: str) -> Playlist:
     """Создаёт плейлист в БД и сразу делает его активным"""
-    user = await get_user(session, tg_id)
-    if not user:
-        raise ValueError("User not found")
-
-    await session.execute(
-        update(Playlist).where(Playlist.user_id == user.id).values(is_active=False)
-    )
-
-    new_playlist = Playlist(user_id=user.id, kind=kind, title=title, is_active=True)
-    session.add(new_playlist)
-    await session.commit()
-    await session.refresh(new_playlist)
-    return new_playlist
+    return await _insert_playlist(session, tg_id, kind, title, is_active=True)
 
 
+@labeled
 async def sync_playlists(session: AsyncSession, tg_id: int, yandex_playlists: list) -> None:
     """
     yandex_playlists: список объектов Playlist из библиотеки yandex_music
     """
-    user = await get_user(session, tg_id)
-    if not user:
-        return
-
     # Один запрос вместо N: загружаем все плейлисты пользователя сразу
     result = await session.execute(
-        select(Playlist).where(Playlist.user_id == user.id)
+        select(Playlist).join(User).where(User.tg_id == tg_id)
     )
     existing = {pl.kind: pl for pl in result.scalars().all()}
 
+    new_rows = []
     for pl in yandex_playlists:
         kind_str = str(pl.kind)
         if kind_str in existing:
             existing[kind_str].title = pl.title
         else:
-            session.add(Playlist(
-                user_id=user.id,
-                kind=kind_str,
-                title=pl.title,
-                is_active=False
-            ))
+            new_rows.append((kind_str, pl.title))
+
+    if new_rows:
+        # Все новые плейлисты одним INSERT ... SELECT: id пользователя берётся из users
+        # в том же запросе (пользователя нет — ничего не вставится)
+        rows = values(column("kind", String), column("title", String), name="new_playlists").data(new_rows)
+        await session.execute(
+            insert(Playlist).from_select(
+                ["user_id", "kind", "title", "is_active"],
+                select(User.id, rows.c.kind, rows.c.title, literal(False)).where(User.tg_id == tg_id),
+            )
+        )
 
     await session.commit()
 
+@labeled
 async def get_user_playlists(session: AsyncSession, tg_id: int) -> List[Playlist]:
     query = (
         select(Playlist)
@@ -115,6 +200,7 @@ async def get_user_playlists(session: AsyncSession, tg_id: int) -> List[Playlist
     result = await session.execute(query)
     return list(result.scalars().all())
 
+@labeled
 async def get_active_playlist(session: AsyncSession, tg_id: int) -> Playlist | None:
     query = (
         select(Playlist)
@@ -124,6 +210,7 @@ async def get_active_playlist(session: AsyncSession, tg_id: int) -> Playlist | N
     result = await session.execute(query)
     return result.scalar_one_or_none()
 
+@labeled
 async def update_playlist_title(session: AsyncSession, playlist_id: int, new_title: str) -> None:
     stmt = (
         update(Playlist)
@@ -133,68 +220,627 @@ async def update_playlist_title(session: AsyncSession, playlist_id: int, new_tit
     await session.execute(stmt)
     await session.commit()
 
+@labeled
 async def delete_playlist(session: AsyncSession, playlist_id: int) -> None:
     stmt = delete(Playlist).where(Playlist.id == playlist_id)
     await session.execute(stmt)
     await session.commit()
     
+@labeled
 async def set_active_playlist(session: AsyncSession, tg_id: int, playlist_id: int) -> None:
-    user = await get_user(session, tg_id)
-    if not user:
-        return
+    user_id = _user_id(tg_id)
 
     # Сначала снимаем активность со всех плейлистов пользователя,
     # потом ставим нужный — иначе partial unique index нарушается
+    # (он проверяется построчно, поэтому одним UPDATE не обойтись)
     await session.execute(
         update(Playlist)
-        .where(Playlist.user_id == user.id)
+        .where(Playlist.user_id == user_id, Playlist.is_active == True, Playlist.id != playlist_id)
         .values(is_active=False)
     )
     await session.execute(
         update(Playlist)
-        .where(Playlist.user_id == user.id, Playlist.id == playlist_id)
+        .where(Playlist.user_id == user_id, Playlist.id == playlist_id)
         .values(is_active=True)
     )
 
     await session.commit()
     
-async def add_track(session: AsyncSession, tg_id: int, artist: str, title: str) -> None:
-    user = await get_user(session, tg_id)
-    if not user:
-        return
+@labeled
+async def add_track(
+    session: AsyncSession,
+    tg_id: int,
+    artist: str,
+    title: str,
+    playlist_kind: str | None = None,
+    content_hash: str | None = None,
+    tg_file_unique_id: str | None = None,
+) -> None:
+    playlist_id = None
+    if playlist_kind is not None:
+        playlist_id = (
+            select(Playlist.id)
+            .where(Playlist.user_id == User.id, Playlist.kind == playlist_kind)
+            .limit(1)
+            .scalar_subquery()
+        )
 
-    track = Track(user_id=user.id, artist=artist, title=title)
-    session.add(track)
+    # INSERT ... SELECT: id пользователя и плейлиста находятся в том же запросе
+    result = await session.execute(
+        insert(Track).from_select(
+            ["user_id", "playlist_id", "artist", "title", "content_hash", "tg_file_unique_id"],
+            select(
+                User.id,
+                playlist_id if playlist_id is not None else literal(None, Integer),
+                literal(artist),
+                literal(title),
+                literal(content_hash, String),
+                literal(tg_file_unique_id, String),
+            ).where(User.tg_id == tg_id),
+        )
+    )
+
+    if not result.rowcount:
+        # Пользователя нет — трек не вставился, счётчики не трогаем
+        return
 
     await session.execute(
         update(User)
-        .where(User.id == user.id)
+        .where(User.tg_id == tg_id)
         .values(track_count=User.track_count + 1)
     )
+    await session.execute(_bump_counter(COUNTER_TRACKS, 1))
     
     await session.commit()
 
+@labeled
+async def find_duplicate_track(
+    session: AsyncSession,
+    tg_id: int,
+    playlist_kind: str,
+    content_hash: str | None = None,
+    tg_file_unique_id: str | None = None,
+) -> Track | None:
+    """Ищет уже загруженный в этот плейлист трек по хешу содержимого или file_unique_id."""
+    conditions = []
+    if content_hash:
+        conditions.append(Track.content_hash == content_hash)
+    if tg_file_unique_id:
+        conditions.append(Track.tg_file_unique_id == tg_file_unique_id)
+    if not conditions:
+        return None
+
+    query = (
+        select(Track)
+        .join(Playlist, Track.playlist_id == Playlist.id)
+        .join(User, Playlist.user_id == User.id)
+        .where(User.tg_id == tg_id, Playlist.kind == playlist_kind, or_(*conditions))
+        .limit(1)
+    )
+    result = await session.execute(query)
+    return result.scalar_one_or_none()
+
+@labeled
 async def get_global_stats(session: AsyncSession):
-    """Возвращает (количество юзеров, количество загруженных треков)"""
-    users_count = await session.scalar(select(func.count(User.id)))
-    tracks_count = await session.scalar(select(func.count(Track.id)))
-    return users_count, tracks_count
-
-async def get_top_users(session: AsyncSession, limit: int = 10, offset: int = 0):
-    """Возвращает топ юзеров по количеству загрузок"""
-    query = select(User).where(User.track_count > 0).order_by(User.track_count.desc()).offset(offset).limit(limit)
+    """Возвращает (количество юзеров, количество загруженных треков) из таблицы counters"""
+    result = await session.execute(
+        select(Counter.name, Counter.value).where(Counter.name.in_((COUNTER_USERS, COUNTER_TRACKS)))
+    )
+    counters = dict(result.all())
+    if len(counters) < 2:
+        # Счётчиков ещё нет (первый запуск после обновления) — считаем по таблицам
+        await reconcile_counters(session)
+        return await get_global_stats(session)
+    return counters[COUNTER_USERS], counters[COUNTER_TRACKS]
+
+@labeled
+async def reconcile_counters(session: AsyncSession) -> dict[str, int]:
+    """
+    Пересчитывает счётчики по таблицам и исправляет расхождение.
+
+    Строки счётчиков блокируются до подсчёта: параллельный add_track, чей трек
+    COUNT(*) ещё не видит, прибавит свою единицу уже после нашей записи.
+
+    Returns:
+        Расхождение по каждому счётчику (было - стало), пусто — всё сходилось.
+    """
+    result = await session.execute(
+        select(Counter.name, Counter.value)
+        .where(Counter.name.in_((COUNTER_USERS, COUNTER_TRACKS)))
+        .with_for_update()
+    )
+    stored = dict(result.all())
+
+    actual = {
+        COUNTER_USERS: await session.scalar(select(func.count(User.id))),
+        COUNTER_TRACKS: await session.scalar(select(func.count(Track.id))),
+    }
+    drift = {}
+    for name, value in actual.items():
+        if stored.get(name) != value:
+            drift[name] = (stored.get(name) or 0) - value
+            await session.execute(
+                pg_insert(Counter)
+                .values(name=name, value=value)
+                .on_conflict_do_update(index_elements=[Counter.name], set_={"value": value})
+            )
+    await session.commit()
+    return drift
+
+@labeled
+async def get_top_users(
+    session: AsyncSession,
+    limit: int = 10,
+    after: tuple[int, int] | None = None,
+    before: tuple[int, int] | None = None,
+):
+    """
+    Возвращает топ юзеров по количеству загрузок (keyset-пагинация).
+
+    Порядок — track_count по убыванию, при равенстве id по возрастанию.
+    after / before — ключ (track_count, id) последнего / первого юзера
+    соседней страницы; страница читается по индексу ix_users_top с этого
+    места, сколько бы страниц ни было до неё.
+    """
+    query = select(User).where(User.track_count > 0)
+    if before is not None:
+        count, user_id = before
+        query = (
+            query.where(or_(User.track_count > count, and_(User.track_count == count, User.id < user_id)))
+            .order_by(User.track_count.asc(), User.id.desc())
+        )
+    else:
+        if after is not None:
+            count, user_id = after
+            query = query.where(or_(User.track_count < count, and_(User.track_count == count, User.id > user_id)))
+        query = query.order_by(User.track_count.desc(), User.id.asc())
+
+    result = await session.execute(query.limit(limit))
+    users = list(result.scalars().all())
+    if before is not None:
+        users.reverse()
+    return users
+
+@labeled
+async def get_last_tracks(
+    session: AsyncSession,
+    limit: int = 10,
+    after: int | None = None,
+    before: int | None = None,
+):
+    """
+    Возвращает последние загруженные треки вместе с инфой о юзере (keyset-пагинация).
+
+    after / before — id последнего / первого трека соседней страницы;
+    страница читается по первичному ключу с этого места.
+    """
+    query = select(Track).options(joinedload(Track.user))
+    if before is not None:
+        query = query.where(Track.id > before).order_by(Track.id.asc())
+    else:
+        if after is not None:
+            query = query.where(Track.id < after)
+        query = query.order_by(Track.id.desc())
+
+    result = await session.execute(query.limit(limit))
+    tracks = list(result.scalars().all())
+    if before is not None:
+        tracks.reverse()
+    return tracks
+
+@labeled
+async def count_broadcast_recipients(session: AsyncSession) -> int:
+    """Сколько пользователей получит рассылку (не заблокировавшие бота)"""
+    return await session.scalar(select(func.count(User.id)).where(User.blocked_at.is_(None)))
+
+@labeled
+async def create_broadcast(session: AsyncSession, **fields) -> Broadcast:
+    broadcast = Broadcast(**fields)
+    session.add(broadcast)
+    await session.commit()
+    await session.refresh(broadcast)
+    return broadcast
+
+@labeled
+async def get_broadcast(session: AsyncSession, broadcast_id: int) -> Broadcast | None:
+    return await session.get(Broadcast, broadcast_id)
+
+@labeled
+async def claim_broadcasts(
+    session: AsyncSession, owner_id: str, lease: float, exclude_ids: list[int]
+) -> list[Broadcast]:
+    """
+    Забирает идущие рассылки без живого владельца реплике owner_id.
+
+    Свободны рассылки без владельца, рассылки прошлого запуска этой же
+    реплики и рассылки, чей владелец не продлевал аренду дольше lease секунд.
+    exclude_ids — рассылки, которые реплика уже ведёт.
+    """
+    expired_at = func.now() - timedelta(seconds=lease)
+    stmt = (
+        update(Broadcast)
+        .where(
+            Broadcast.status == BROADCAST_RUNNING,
+            or_(Broadcast.owner_id.is_(None), Broadcast.owner_id == owner_id, Broadcast.heartbeat_at < expired_at),
+            Broadcast.id.notin_(exclude_ids),
+        )
+        .values(owner_id=owner_id, heartbeat_at=func.now())
+        .returning(Broadcast)
+        .execution_options(synchronize_session=False)
+    )
+    broadcasts = list((await session.execute(stmt)).scalars().all())
+    for broadcast in broadcasts:
+        session.expunge(broadcast)
+    await session.commit()
+    return sorted(broadcasts, key=lambda broadcast: broadcast.id)
+
+@labeled
+async def heartbeat_broadcasts(session: AsyncSession, owner_id: str, broadcast_ids: list[int]) -> dict[int, str]:
+    """Продлевает аренду; возвращает статусы рассылок, которые всё ещё за репликой."""
+    result = await session.execute(
+        update(Broadcast)
+        .where(Broadcast.id.in_(broadcast_ids), Broadcast.owner_id == owner_id)
+        .values(heartbeat_at=func.now())
+        .returning(Broadcast.id, Broadcast.status)
+    )
+    statuses = {broadcast_id: status for broadcast_id, status in result.all()}
+    await session.commit()
+    return statuses
+
+@labeled
+async def release_broadcasts(session: AsyncSession, owner_id: str, broadcast_ids: list[int]) -> int:
+    """Отпускает идущие рассылки (останов реплики), чтобы их сразу подхватили другие."""
+    result = await session.execute(
+        update(Broadcast)
+        .where(Broadcast.id.in_(broadcast_ids), Broadcast.owner_id == owner_id, Broadcast.status == BROADCAST_RUNNING)
+        .values(owner_id=None)
+    )
+    await session.commit()
+    return result.rowcount
+
+@labeled
+async def cancel_broadcast(session: AsyncSession, broadcast_id: int) -> bool:
+    """Помечает рассылку остановленной; реплика-владелец увидит это при продлении аренды."""
+    result = await session.execute(
+        update(Broadcast)
+        .where(Broadcast.id == broadcast_id, Broadcast.status == BROADCAST_RUNNING)
+        .values(status=BROADCAST_CANCELLED, finished_at=func.now())
+    )
+    await session.commit()
+    return result.rowcount > 0
+
+@labeled
+async def get_broadcast_recipients(
+    session: AsyncSession, broadcast_id: int, after_user_id: int, limit: int
+) -> list[tuple[int, int]]:
+    """
+    Следующая пачка получателей (users.id, tg_id) после after_user_id.
+
+    Пропускает заблокировавших бота и тех, кому эта рассылка уже доставлялась
+    (так рассылка продолжается после рестарта без повторов).
+    """
+    delivered = (
+        select(BroadcastDelivery.user_id)
+        .where(BroadcastDelivery.broadcast_id == broadcast_id, BroadcastDelivery.user_id == User.id)
+        .exists()
+    )
+    query = (
+        select(User.id, User.tg_id)
+        .where(User.id > after_user_id, User.blocked_at.is_(None), ~delivered)
+        .order_by(User.id)
+        .limit(limit)
+    )
     result = await session.execute(query)
-    return result.scalars().all()
+    return [tuple(row) for row in result.all()]
+
+@labeled
+async def record_broadcast_deliveries(
+    session: AsyncSession, broadcast_id: int, deliveries: list[tuple[int, str, str | None]]
+) -> tuple[int, int, int] | None:
+    """
+    Записывает итоги пачки (users.id, статус, ошибка) одной транзакцией:
+    строки доставки, счётчики рассылки и пометку заблокировавших бота.
+
+    Счётчики растут только на впервые записанные строки: пачка, повторно
+    отправленная после смены владельца рассылки, второй раз не считается.
+    Возвращает итоговые (sent, failed, blocked) рассылки.
+    """
+    if not deliveries:
+        return None
+    result = await session.execute(
+        pg_insert(BroadcastDelivery)
+        .values([
+            {"broadcast_id": broadcast_id, "user_id": user_id, "status": status, "error": error}
+            for user_id, status, error in deliveries
+        ])
+        .on_conflict_do_nothing()
+        .returning(BroadcastDelivery.status)
+    )
 
-async def get_last_tracks(session: AsyncSession, limit: int = 10, offset: int = 0):
-    """Возвращает последние загруженные треки вместе с инфой о юзере"""
-    from sqlalchemy.orm import selectinload
-    query = select(Track).options(selectinload(Track.user)).order_by(Track.id.desc()).offset(offset).limit(limit)
+    counts = {DELIVERY_SENT: 0, DELIVERY_FAILED: 0, DELIVERY_BLOCKED: 0}
+    for status in result.scalars().all():
+        counts[status] += 1
+    totals = await session.execute(
+        update(Broadcast)
+        .where(Broadcast.id == broadcast_id)
+        .values(
+            sent=Broadcast.sent + counts[DELIVERY_SENT],
+            failed=Broadcast.failed + counts[DELIVERY_FAILED],
+            blocked=Broadcast.blocked + counts[DELIVERY_BLOCKED],
+        )
+        .returning(Broadcast.sent, Broadcast.failed, Broadcast.blocked)
+    )
+    sent, failed, blocked = totals.one()
+
+    blocked_ids = [user_id for user_id, status, _ in deliveries if status == DELIVERY_BLOCKED]
+    if blocked_ids:
+        await session.execute(
+            update(User).where(User.id.in_(blocked_ids)).values(blocked_at=func.now())
+        )
+    await session.commit()
+    return sent, failed, blocked
+
+@labeled
+async def finish_broadcast(session: AsyncSession, broadcast_id: int, owner_id: str, status: str) -> None:
+    """Закрывает рассылку, если она всё ещё за репликой owner_id."""
+    await session.execute(
+        update(Broadcast)
+        .where(Broadcast.id == broadcast_id, Broadcast.owner_id == owner_id)
+        .values(status=status, finished_at=func.now())
+    )
+    await session.commit()
+
+@labeled
+async def get_photo_file_id(session: AsyncSession, content_hash: str) -> str | None:
+    query = select(PhotoCache.file_id).where(PhotoCache.content_hash == content_hash)
     result = await session.execute(query)
-    return result.scalars().all()
+    return result.scalar_one_or_none()
+
+@labeled
+async def set_photo_file_id(session: AsyncSession, content_hash: str, file_id: str) -> None:
+    stmt = (
+        pg_insert(PhotoCache)
+        .values(content_hash=content_hash, file_id=file_id)
+        .on_conflict_do_update(index_elements=[PhotoCache.content_hash], set_={"file_id": file_id})
+    )
+    await session.execute(stmt)
+    await session.commit()
+
+@labeled
+async def delete_photo_file_id(session: AsyncSession, content_hash: str) -> None:
+    await session.execute(delete(PhotoCache).where(PhotoCache.content_hash == content_hash))
+    await session.commit()
+
+@labeled
+async def create_upload_job(session: AsyncSession, **fields) -> UploadJob:
+    job = UploadJob(**fields)
+    session.add(job)
+    await session.commit()
+    await session.refresh(job)
+    return job
+
+@labeled
+async def update_upload_job(session: AsyncSession, job_id: int, commit: bool = True, **values) -> None:
+    """Обновляет поля задачи; commit=False — чтобы закоммитить вместе со следующим шагом."""
+    await session.execute(update(UploadJob).where(UploadJob.id == job_id).values(**values))
+    if commit:
+        await session.commit()
+
+@labeled
+async def fail_stale_upload_jobs(session: AsyncSession, older_than: datetime, error: str) -> int:
+    """Помечает проваленными незавершённые задачи, созданные раньше older_than."""
+    result = await session.execute(
+        update(UploadJob)
+        .where(UploadJob.stage.notin_(JOB_FINAL_STAGES), UploadJob.created_at < older_than)
+        .values(stage=JOB_FAILED, error=error)
+    )
+    await session.commit()
+    return result.rowcount
+
+@labeled
+async def get_unfinished_upload_jobs(session: AsyncSession) -> list[UploadJob]:
+    query = select(UploadJob).where(UploadJob.stage.notin_(JOB_FINAL_STAGES)).order_by(UploadJob.id)
+    result = await session.execute(query)
+    return list(result.scalars().all())
+
+@labeled
+async def count_queued_upload_jobs(session: AsyncSession) -> int:
+    """Незавершённые задачи, которые ещё не взял ни один воркер."""
+    query = select(func.count()).select_from(UploadJob).where(
+        UploadJob.stage.notin_(JOB_FINAL_STAGES), UploadJob.worker_id.is_(None)
+    )
+    return await session.scalar(query)
+
+@labeled
+async def get_upload_jobs(session: AsyncSession, job_ids: list[int]) -> list[UploadJob]:
+    result = await session.execute(select(UploadJob).where(UploadJob.id.in_(job_ids)))
+    return list(result.scalars().all())
+
+@labeled
+async def fail_exhausted_upload_jobs(session: AsyncSession, lease: float, max_attempts: int) -> list[UploadJob]:
+    """
+    Помечает проваленными брошенные задачи, которые брали уже max_attempts раз.
+
+    Возвращает их, чтобы сообщить пользователю. Параллельные воркеры
+    получают каждую такую задачу ровно один раз.
+    """
+    expired_at = func.now() - timedelta(seconds=lease)
+    stmt = (
+        update(UploadJob)
+        .where(UploadJob.stage.notin_(JOB_FINAL_STAGES), UploadJob.worker_id.isnot(None),
+               UploadJob.heartbeat_at < expired_at, UploadJob.attempts >= max_attempts)
+        .values(stage=JOB_FAILED, error=JOB_ERROR_EXHAUSTED, worker_id=None)
+        .returning(UploadJob)
+        .execution_options(synchronize_session=False)
+    )
+    jobs = list((await session.execute(stmt)).scalars().all())
+    for job in jobs:
+        session.expunge(job)
+    await session.commit()
+    return jobs
+
+@labeled
+async def claim_upload_jobs(
+    session: AsyncSession,
+    worker_id: str,
+    limit: int,
+    lease: float,
+    per_user_limit: int,
+    max_attempts: int,
+) -> list[UploadJob]:
+    """
+    Забирает до limit задач из общей очереди для воркера worker_id.
+
+    Свободны задачи без воркера и задачи, чей воркер не продлевал аренду дольше
+    lease секунд (упал или потерял связь), если их брали меньше max_attempts раз
+    (остальные проваливает fail_exhausted_upload_jobs).
+
+    Лимит на пользователя общий для всех воркеров: свободные задачи каждого
+    пользователя нумеруются по порядку (row_number), и берутся только первые
+    per_user_limit минус уже взятые в работу. Нумерация идёт до блокировки,
+    поэтому задачи, которые прямо сейчас забирает другой воркер, занимают свои
+    номера: FOR UPDATE SKIP LOCKED их пропускает, но следующие задачи того же
+    пользователя за лимит не пролезают. Порядок — сначала первые задачи каждого
+    пользователя, так один пользователь с сотней файлов не занимает всю выборку.
+    """
+    expired_at = func.now() - timedelta(seconds=lease)
+    unfinished = UploadJob.stage.notin_(JOB_FINAL_STAGES)
+    free = or_(
+        UploadJob.worker_id.is_(None),
+        and_(UploadJob.heartbeat_at < expired_at, UploadJob.attempts < max_attempts),
+    )
+
+    leased = (
+        select(UploadJob.tg_id, func.count().label("leased"))
+        .where(unfinished, UploadJob.worker_id.isnot(None), UploadJob.heartbeat_at >= expired_at)
+        .group_by(UploadJob.tg_id)
+        .subquery()
+    )
+    ranked = (
+        select(
+            UploadJob.id,
+            func.row_number().over(partition_by=UploadJob.tg_id, order_by=UploadJob.id).label("rn"),
+        )
+        .where(unfinished, free)
+        .subquery()
+    )
+    candidates = (
+        select(UploadJob.id)
+        .join(ranked, ranked.c.id == UploadJob.id)
+        .outerjoin(leased, leased.c.tg_id == UploadJob.tg_id)
+        .where(ranked.c.rn <= per_user_limit - func.coalesce(leased.c.leased, 0))
+        .order_by(ranked.c.rn, UploadJob.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True, of=UploadJob)
+    )
+    stmt = (
+        update(UploadJob)
+        .where(UploadJob.id.in_(candidates))
+        .values(worker_id=worker_id, heartbeat_at=func.now(), attempts=UploadJob.attempts + 1)
+        .returning(UploadJob)
+        .execution_options(synchronize_session=False)
+    )
+    jobs = list((await session.execute(stmt)).scalars().all())
+    # Задачи живут дольше сессии — отвязываем их до коммита, чтобы атрибуты не истекли
+    for job in jobs:
+        session.expunge(job)
+    await session.commit()
+    return sorted(jobs, key=lambda job: job.id)
 
-async def get_all_tg_ids(session: AsyncSession) -> list[int]:
-    """Возвращает список всех tg_id пользователей"""
-    query = select(User.tg_id)
+@labeled
+async def adopt_upload_jobs(
+    session: AsyncSession, worker_id: str, lease: float, exclude_ids: list[int]
+) -> list[UploadJob]:
+    """
+    Забирает незавершённые задачи без живого владельца боту worker_id (UPLOAD_BACKEND=local).
+
+    Свободны задачи без владельца, задачи прошлого запуска этого же бота
+    и задачи, чей владелец не продлевал аренду дольше lease секунд.
+    exclude_ids — задачи, которые бот уже выполняет. Задача, которую
+    в ту же секунду забирает другая реплика, достаётся одной из них:
+    UPDATE перепроверяет условие после чужого коммита.
+    """
+    expired_at = func.now() - timedelta(seconds=lease)
+    stmt = (
+        update(UploadJob)
+        .where(
+            UploadJob.stage.notin_(JOB_FINAL_STAGES),
+            or_(UploadJob.worker_id.is_(None), UploadJob.worker_id == worker_id, UploadJob.heartbeat_at < expired_at),
+            UploadJob.id.notin_(exclude_ids),
+        )
+        .values(worker_id=worker_id, heartbeat_at=func.now())
+        .returning(UploadJob)
+        .execution_options(synchronize_session=False)
+    )
+    jobs = list((await session.execute(stmt)).scalars().all())
+    for job in jobs:
+        session.expunge(job)
+    await session.commit()
+    return sorted(jobs, key=lambda job: job.id)
+
+@labeled
+async def heartbeat_upload_jobs(session: AsyncSession, worker_id: str, job_ids: list[int]) -> list[int]:
+    """Продлевает аренду; возвращает задачи, которые всё ещё за воркером и не завершены."""
+    result = await session.execute(
+        update(UploadJob)
+        .where(UploadJob.id.in_(job_ids), UploadJob.worker_id == worker_id, UploadJob.stage.notin_(JOB_FINAL_STAGES))
+        .values(heartbeat_at=func.now())
+        .returning(UploadJob.id)
+    )
+    alive = list(result.scalars().all())
+    await session.commit()
+    return alive
+
+@labeled
+async def release_upload_jobs(session: AsyncSession, worker_id: str, job_ids: list[int]) -> int:
+    """Возвращает незавершённые задачи в очередь (останов воркера), не засчитывая попытку."""
+    result = await session.execute(
+        update(UploadJob)
+        .where(UploadJob.id.in_(job_ids), UploadJob.worker_id == worker_id, UploadJob.stage.notin_(JOB_FINAL_STAGES))
+        .values(worker_id=None, heartbeat_at=None, attempts=func.greatest(UploadJob.attempts - 1, 0))
+    )
+    await session.commit()
+    return result.rowcount
+
+@labeled
+async def get_fsm_record(session: AsyncSession, key: str) -> FsmRecord | None:
+    """Запись FSM, если она ещё не истекла."""
+    query = select(FsmRecord).where(FsmRecord.key == key, FsmRecord.expires_at > func.now())
     result = await session.execute(query)
-    return list(result.scalars().all())
\ No newline at end of file
+    return result.scalar_one_or_none()
+
+@labeled
+async def set_fsm_state(session: AsyncSession, key: str, state: str | None, expires_at: datetime) -> None:
+    """Меняет состояние, продлевая запись; данные истёкшей записи сбрасываются."""
+    stmt = pg_insert(FsmRecord).values(key=key, state=state, data={}, expires_at=expires_at)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[FsmRecord.key],
+        set_={
+            "state": state,
+            "data": case((FsmRecord.expires_at > func.now(), FsmRecord.data), else_=stmt.excluded.data),
+            "expires_at": expires_at,
+        },
+    )
+    await session.execute(stmt)
+    await session.commit()
+
+@labeled
+async def set_fsm_data(session: AsyncSession, key: str, data: dict, expires_at: datetime) -> None:
+    """Заменяет данные, продлевая запись; состояние истёкшей записи сбрасывается."""
+    stmt = pg_insert(FsmRecord).values(key=key, state=None, data=data, expires_at=expires_at)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[FsmRecord.key],
+        set_={
+            "state": case((FsmRecord.expires_at > func.now(), FsmRecord.state), else_=None),
+            "data": data,
+            "expires_at": expires_at,
+        },
+    )
+    await session.execute(stmt)
+    await session.commit()
+
+@labeled
+async def delete_expired_fsm_records(session: AsyncSession) -> int:
+    result = await session.execute(delete(FsmRecord).where(FsmRecord.expires_at <= func.now()))
+    await session.commit()
+    return result.rowcount
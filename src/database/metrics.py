@@ -0,0 +1,166 @@
+"""
+Метрики работы с БД: сколько времени уходит на запросы и на ожидание пула.
+
+Каждый SQL-запрос попадает в гистограмму латентности под именем функции
+crud, которая его выполнила (функции помечены `@labeled`; запросы вне crud
+идут под именем «other»). Время получения соединения из пула (ожидание
+свободного, pre-ping, новое подключение) — в отдельную гистограмму
+`pool_checkout`. Запросы дольше DB_SLOW_QUERY_MS пишутся в лог.
+
+Снимок метрик отдаёт `db_metrics.snapshot()` — его показывает админка.
+
+Переменные окружения:
+    DB_SLOW_QUERY_MS — порог медленного запроса в миллисекундах (по умолчанию 200, 0 — не логировать)
+"""
+import os
+import time
+import bisect
+import logging
+import functools
+from contextvars import ContextVar
+from typing import Awaitable, Callable, TypeVar
+
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "200"))
+
+# Верхние границы корзин гистограммы, мс
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+UNLABELED = "other"
+
+_current_label: ContextVar[str] = ContextVar("db_query_label", default=UNLABELED)
+
+
+def labeled(func: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+    """Запросы внутри функции учитываются в метриках под её именем."""
+    name = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        token = _current_label.set(name)
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            _current_label.reset(token)
+
+    return wrapper
+
+
+class Histogram:
+    def __init__(self, buckets: tuple = BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q: float) -> float:
+        """Верхняя граница корзины, в которую попал q-й перцентиль (для последней — max)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.buckets[i] if i < len(self.buckets) else self.max
+        return self.max
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "total_ms": self.total,
+            "avg_ms": self.total / self.count if self.count else 0.0,
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "max_ms": self.max,
+        }
+
+
+class DbMetrics:
+    def __init__(self, slow_query_ms: float = SLOW_QUERY_MS):
+        self.slow_query_ms = slow_query_ms
+        self.statements: dict[str, Histogram] = {}
+        self.pool_checkout = Histogram()
+        self.slow_queries = 0
+        self.errors = 0
+        self._engines = []
+
+    def instrument(self, engine) -> None:
+        """Подписывается на события движка (AsyncEngine или обычного)."""
+        sync_engine = getattr(engine, "sync_engine", engine)
+        event.listen(sync_engine, "before_cursor_execute", self._before_execute)
+        event.listen(sync_engine, "after_cursor_execute", self._after_execute)
+        event.listen(sync_engine, "handle_error", self._on_error)
+        self._engines.append(sync_engine)
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        started = conn.info["query_started"].pop()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        label = _current_label.get()
+        histogram = self.statements.get(label)
+        if histogram is None:
+            histogram = self.statements[label] = Histogram()
+        histogram.observe(elapsed_ms)
+
+        if self.slow_query_ms and elapsed_ms >= self.slow_query_ms:
+            self.slow_queries += 1
+            logger.warning(f"Slow query in {label}: {elapsed_ms:.0f} ms: {' '.join(statement.split())[:500]}")
+
+    def _on_error(self, context) -> None:
+        self.errors += 1
+        stack = context.connection.info.get("query_started") if context.connection is not None else None
+        if stack:
+            stack.pop()
+
+    def observe_checkout(self, elapsed_ms: float) -> None:
+        self.pool_checkout.observe(elapsed_ms)
+
+    def pool_status(self) -> dict:
+        # engine.pool читаем каждый раз: после dispose() пул пересоздаётся
+        pools = [engine.pool for engine in self._engines if hasattr(engine.pool, "checkedout")]
+        return {
+            "size": sum(pool.size() for pool in pools),
+            "checked_out": sum(pool.checkedout() for pool in pools),
+            "overflow": sum(pool.overflow() for pool in pools),
+        }
+
+    def snapshot(self) -> dict:
+        """Текущее состояние метрик — для админки и внешнего мониторинга."""
+        return {
+            "statements": {name: h.summary() for name, h in self.statements.items()},
+            "pool_checkout": self.pool_checkout.summary(),
+            "pool": self.pool_status(),
+            "slow_queries": self.slow_queries,
+            "errors": self.errors,
+        }
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Пул, который замеряет в db_metrics, сколько ждали соединение."""
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            db_metrics.observe_checkout((time.perf_counter() - started) * 1000)
+
+
+db_metrics = DbMetrics()
@@ -1,10 +1,31 @@
 import os
-from sqlalchemy import BigInteger, String, Integer, ForeignKey, Boolean, Index
+from datetime import datetime
+from sqlalchemy import BigInteger, String, Integer, ForeignKey, Boolean, Index, DateTime, func, text
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.asyncio import AsyncAttrs, async_sessionmaker, create_async_engine
 
+from src.database.metrics import TimedQueuePool, db_metrics
+
 db_url = os.getenv("DATABASE_URL")
-engine = create_async_engine(url=db_url)
+
+# Настройки пула соединений
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+
+engine = create_async_engine(
+    url=db_url,
+    poolclass=TimedQueuePool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+)
+db_metrics.instrument(engine)
 
 async_session = async_sessionmaker(engine)
 
@@ -22,11 +43,23 @@ class User(Base):
     token: Mapped[str] = mapped_column(String, nullable=True)
     playlist_kind: Mapped[str] = mapped_column(String, nullable=True)
     track_count: Mapped[int] = mapped_column(Integer, default=0)
+    # Когда рассылка узнала, что пользователь заблокировал бота (None — доступен)
+    blocked_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=True)
     
     playlists: Mapped[list["Playlist"]] = relationship(back_populates="user", cascade="all, delete-orphan")
     
     tracks: Mapped[list["Track"]] = relationship(back_populates="user", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # Топ по загрузкам в админке: порядок индекса совпадает с ORDER BY, страницы читаются с курсора
+        Index(
+            "ix_users_top",
+            track_count.desc(),
+            "id",
+            postgresql_where=(track_count > 0),
+        ),
+    )
+
 
 class Playlist(Base):
     __tablename__ = 'playlists'
@@ -55,12 +88,159 @@ class Track(Base):
     __tablename__ = 'tracks'
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
+    playlist_id: Mapped[int] = mapped_column(ForeignKey("playlists.id", ondelete="SET NULL"), nullable=True)
     artist: Mapped[str] = mapped_column(String, nullable=False)
     title: Mapped[str] = mapped_column(String, nullable=False)
     cover: Mapped[str] = mapped_column(String(256), nullable=True)
+    # SHA-256 содержимого и file_unique_id из Telegram — для поиска повторных загрузок
+    content_hash: Mapped[str] = mapped_column(String(64), nullable=True)
+    tg_file_unique_id: Mapped[str] = mapped_column(String(64), nullable=True)
     
     user: Mapped["User"] = relationship(back_populates="tracks")
 
+    __table_args__ = (
+        Index("ix_tracks_playlist_hash", "playlist_id", "content_hash"),
+        Index("ix_tracks_playlist_file_uid", "playlist_id", "tg_file_unique_id"),
+    )
+
+class PhotoCache(Base):
+    """Соответствие SHA-256 картинки и file_id, который Telegram вернул при первой отправке."""
+    __tablename__ = 'photo_cache'
+    content_hash: Mapped[str] = mapped_column(String(64), primary_key=True)
+    file_id: Mapped[str] = mapped_column(String, nullable=False)
+
+# Имена счётчиков в таблице counters
+COUNTER_USERS = "users"
+COUNTER_TRACKS = "tracks"
+
+
+class Counter(Base):
+    """Предпосчитанные итоги для админки: меняются в той же транзакции, что и сами данные."""
+    __tablename__ = 'counters'
+    name: Mapped[str] = mapped_column(String(32), primary_key=True)
+    value: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+
+# Стадии UploadJob по порядку; done и failed — конечные
+JOB_QUEUED = "queued"
+JOB_DOWNLOADED = "downloaded"
+JOB_UPLOADED = "uploaded"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_FINAL_STAGES = (JOB_DONE, JOB_FAILED)
+# Ошибка задачи, которую воркеры бросили UPLOAD_WORKER_MAX_ATTEMPTS раз
+JOB_ERROR_EXHAUSTED = "upload worker attempts exhausted"
+
+
+class UploadJob(Base):
+    """Журнал загрузки одного файла: стадия и всё, что нужно, чтобы продолжить после рестарта."""
+    __tablename__ = 'upload_jobs'
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    tg_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    chat_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    playlist_kind: Mapped[str] = mapped_column(String, nullable=False)
+    force: Mapped[bool] = mapped_column(Boolean, default=False)
+
+    # Файл в Telegram и то, что о нём известно из сообщения
+    tg_file_id: Mapped[str] = mapped_column(String, nullable=False)
+    tg_file_unique_id: Mapped[str] = mapped_column(String(64), nullable=True)
+    file_name: Mapped[str] = mapped_column(String, nullable=False)
+    file_size: Mapped[int] = mapped_column(BigInteger, nullable=True)
+    performer: Mapped[str] = mapped_column(String, nullable=True)
+    audio_title: Mapped[str] = mapped_column(String, nullable=True)
+
+    stage: Mapped[str] = mapped_column(String(16), default=JOB_QUEUED)
+    local_path: Mapped[str] = mapped_column(String, nullable=True)
+    content_hash: Mapped[str] = mapped_column(String(64), nullable=True)
+    artist: Mapped[str] = mapped_column(String, nullable=True)
+    title: Mapped[str] = mapped_column(String, nullable=True)
+    ugc_track_id: Mapped[str] = mapped_column(String, nullable=True)
+    # Шаг выполнен (или не требовался); ошибки шагов — в error
+    renamed: Mapped[bool] = mapped_column(Boolean, default=False)
+    cover_set: Mapped[bool] = mapped_column(Boolean, default=False)
+    error: Mapped[str] = mapped_column(String, nullable=True)
+
+    # Отдельные воркеры загрузок (worker.py): сообщение со статусом (нет — файл из пакета),
+    # кто держит задачу, когда последний раз подтвердил аренду и сколько раз её брали
+    status_message_id: Mapped[int] = mapped_column(BigInteger, nullable=True)
+    worker_id: Mapped[str] = mapped_column(String(128), nullable=True)
+    heartbeat_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=True)
+    attempts: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        Index(
+            "ix_upload_jobs_unfinished",
+            "id",
+            postgresql_where=stage.notin_(JOB_FINAL_STAGES),
+        ),
+    )
+
+# Статусы рассылки и доставки конкретному пользователю
+BROADCAST_RUNNING = "running"
+BROADCAST_DONE = "done"
+BROADCAST_CANCELLED = "cancelled"
+DELIVERY_SENT = "sent"
+DELIVERY_FAILED = "failed"
+DELIVERY_BLOCKED = "blocked"
+
+
+class Broadcast(Base):
+    """Рассылка: что копировать, кто запустил и сводные счётчики доставки."""
+    __tablename__ = 'broadcasts'
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    admin_chat_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    src_chat_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    src_message_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    status: Mapped[str] = mapped_column(String(16), default=BROADCAST_RUNNING)
+    total: Mapped[int] = mapped_column(Integer, default=0)
+    sent: Mapped[int] = mapped_column(Integer, default=0)
+    failed: Mapped[int] = mapped_column(Integer, default=0)
+    blocked: Mapped[int] = mapped_column(Integer, default=0)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    finished_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=True)
+    # Реплика, которая ведёт рассылку, и её последняя отметка (аренда, см. broadcast.py)
+    owner_id: Mapped[str] = mapped_column(String(128), nullable=True)
+    heartbeat_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+
+class BroadcastDelivery(Base):
+    """Итог доставки рассылки одному пользователю: по этим строкам рассылка продолжается после рестарта."""
+    __tablename__ = 'broadcast_deliveries'
+    broadcast_id: Mapped[int] = mapped_column(ForeignKey("broadcasts.id", ondelete="CASCADE"), primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    status: Mapped[str] = mapped_column(String(16), nullable=False)
+    error: Mapped[str] = mapped_column(String, nullable=True)
+
+class FsmRecord(Base):
+    """Состояние и данные FSM aiogram для одного ключа (бот, чат, пользователь) — общие для всех реплик."""
+    __tablename__ = 'fsm_states'
+    key: Mapped[str] = mapped_column(String, primary_key=True)
+    state: Mapped[str] = mapped_column(String, nullable=True)
+    data: Mapped[dict] = mapped_column(JSONB, nullable=False, default=dict)
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+
+# create_all не меняет существующие таблицы — новые колонки и индексы докатываем сами.
+# Каждая команда идемпотентна и безопасна для повторного запуска.
+MIGRATIONS = [
+    "ALTER TABLE tracks ADD COLUMN IF NOT EXISTS playlist_id INTEGER REFERENCES playlists(id) ON DELETE SET NULL",
+    "ALTER TABLE tracks ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64)",
+    "ALTER TABLE tracks ADD COLUMN IF NOT EXISTS tg_file_unique_id VARCHAR(64)",
+    "CREATE INDEX IF NOT EXISTS ix_tracks_playlist_hash ON tracks (playlist_id, content_hash)",
+    "CREATE INDEX IF NOT EXISTS ix_tracks_playlist_file_uid ON tracks (playlist_id, tg_file_unique_id)",
+    "CREATE INDEX IF NOT EXISTS ix_users_top ON users (track_count DESC, id) WHERE track_count > 0",
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS blocked_at TIMESTAMP WITH TIME ZONE",
+    "ALTER TABLE upload_jobs ADD COLUMN IF NOT EXISTS status_message_id BIGINT",
+    "ALTER TABLE upload_jobs ADD COLUMN IF NOT EXISTS worker_id VARCHAR(128)",
+    "ALTER TABLE upload_jobs ADD COLUMN IF NOT EXISTS heartbeat_at TIMESTAMP WITH TIME ZONE",
+    "ALTER TABLE upload_jobs ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE broadcasts ADD COLUMN IF NOT EXISTS owner_id VARCHAR(128)",
+    "ALTER TABLE broadcasts ADD COLUMN IF NOT EXISTS heartbeat_at TIMESTAMP WITH TIME ZONE DEFAULT now()",
+]
+
 async def async_main():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        for statement in MIGRATIONS:
+            await conn.execute(text(statement))
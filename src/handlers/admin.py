@@ -1,23 +1,26 @@
 import os
 import html
-import asyncio
 import logging
 from aiogram import Router, F, Bot
 from aiogram.filters import Command, BaseFilter
 from aiogram.types import Message, CallbackQuery
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.fsm.context import FSMContext
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
 from src.database import crud
 from src.database.models import async_session
 from src.utils.states import BroadcastStates
+from src.utils.broadcast import broadcast_engine, stop_keyboard
+from src.utils.disk_budget import disk_budget
+from src.utils.auth_cache import token_status, tokens
+from src.database.metrics import db_metrics
 
 router = Router()
 logger = logging.getLogger(__name__)
 
 ADMIN_IDS = [int(x) for x in os.getenv("ADMIN_IDS", "").split(",") if x.strip()]
 PAGE_SIZE = 10
-MAX_PAGE = 100
 
 
 class AdminFilter(BaseFilter):
@@ -26,22 +29,52 @@ class AdminFilter(BaseFilter):
         return user_id in ADMIN_IDS
 
 
+def _gb(size: int) -> str:
+    return f"{size / 1024 ** 3:.1f}"
+
+
+def _disk_stats_text() -> str:
+    stats = disk_budget.stats()
+    quota = f" из {_gb(stats['quota'])}" if stats["quota"] else ""
+    return (
+        f"💽 Диск: свободно <b>{_gb(stats['disk_free'])}</b> из {_gb(stats['disk_total'])} ГБ\n"
+        f"📥 Резерв под загрузки: <b>{_gb(stats['reserved'])}</b>{quota} ГБ "
+        f"({stats['reservations']} файлов, не докачано {_gb(stats['pending'])} ГБ)"
+    )
+
+
+def _auth_cache_text() -> str:
+    status = token_status.stats()
+    token = tokens.stats()
+    return (
+        f"🔐 Кеш авторизации: {status['size']} польз., "
+        f"попаданий <b>{status['hits']}</b> / промахов {status['misses']}\n"
+        f"🔑 Кеш токенов: {token['size']} польз., "
+        f"попаданий <b>{token['hits']}</b> / промахов {token['misses']}"
+    )
+
+
 def get_admin_keyboard():
     builder = InlineKeyboardBuilder()
-    builder.button(text="🏆 Топ пользователей", callback_data="admin_top:0")
-    builder.button(text="🎵 Последние треки", callback_data="admin_tracks:0")
+    builder.button(text="🏆 Топ пользователей", callback_data="admin_top:n:0:")
+    builder.button(text="🎵 Последние треки", callback_data="admin_tracks:n:0:")
+    builder.button(text="🗄 Метрики БД", callback_data="admin_db")
     builder.button(text="📢 Бродкаст", callback_data="admin_broadcast")
     builder.button(text="🔄 Обновить стату", callback_data="admin_refresh")
     builder.adjust(1)
     return builder.as_markup()
 
 
-def get_pagination_keyboard(prefix: str, page: int, has_more: bool):
+def get_pagination_keyboard(prefix: str, page: int, first_key: str, last_key: str, has_more: bool):
+    """
+    Кнопки keyset-пагинации: в callback_data лежит ключ крайней записи страницы,
+    соседняя страница читается от него — «{prefix}:n|p:{номер}:{ключ}».
+    """
     builder = InlineKeyboardBuilder()
     if page > 0:
-        builder.button(text="⬅️ Назад", callback_data=f"{prefix}:{page - 1}")
+        builder.button(text="⬅️ Назад", callback_data=f"{prefix}:p:{page - 1}:{first_key}")
     if has_more:
-        builder.button(text="Вперёд ➡️", callback_data=f"{prefix}:{page + 1}")
+        builder.button(text="Вперёд ➡️", callback_data=f"{prefix}:n:{page + 1}:{last_key}")
     builder.button(text="🔙 В меню", callback_data="admin_refresh")
     builder.adjust(2, 1)
     return builder.as_markup()
@@ -55,7 +88,9 @@ async def cmd_admin(message: Message):
     text = (
         f"<b>👮‍♂️ Панель администратора</b>\n\n"
         f"👥 Всего пользователей: <b>{users_count}</b>\n"
-        f"💾 Всего загружено треков: <b>{tracks_count}</b>"
+        f"💾 Всего загружено треков: <b>{tracks_count}</b>\n\n"
+        f"{_disk_stats_text()}\n"
+        f"{_auth_cache_text()}"
     )
 
     await message.answer(text, reply_markup=get_admin_keyboard(), parse_mode="HTML")
@@ -69,7 +104,9 @@ async def cb_refresh(callback: CallbackQuery):
     text = (
         f"<b>👮‍♂️ Панель администратора</b>\n\n"
         f"👥 Всего пользователей: <b>{users_count}</b>\n"
-        f"💾 Всего загружено треков: <b>{tracks_count}</b>"
+        f"💾 Всего загружено треков: <b>{tracks_count}</b>\n\n"
+        f"{_disk_stats_text()}\n"
+        f"{_auth_cache_text()}"
     )
 
     try:
@@ -79,32 +116,60 @@ async def cb_refresh(callback: CallbackQuery):
     await callback.answer("Обновлено")
 
 
+def _parse_page(data: str) -> tuple[bool, int, str] | None:
+    """«prefix:n|p:номер:ключ» → (назад ли, номер страницы, ключ); None — битые данные."""
+    try:
+        _, direction, page, key = data.split(":")
+        page = int(page)
+    except ValueError:
+        return None
+    if direction not in ("n", "p") or page < 0:
+        return None
+    return direction == "p", page, key
+
+
+def _user_key(user) -> str:
+    return f"{user.track_count}_{user.id}"
+
+
 @router.callback_query(F.data.startswith("admin_top:"), AdminFilter())
 async def cb_top_users(callback: CallbackQuery):
-    page = int(callback.data.split(":")[1])
-    if page < 0 or page > MAX_PAGE:
-        await callback.answer("Недопустимый номер страницы", show_alert=True)
+    parsed = _parse_page(callback.data)
+    if parsed is None:
+        await callback.answer("Недопустимая страница", show_alert=True)
         return
-    offset = page * PAGE_SIZE
-    
+    backward, page, key = parsed
+    try:
+        cursor = tuple(int(part) for part in key.split("_")) if key else None
+    except ValueError:
+        cursor = ()
+    # Ключ пользователя — ровно пара (track_count, id)
+    if cursor is not None and len(cursor) != 2:
+        await callback.answer("Недопустимая страница", show_alert=True)
+        return
+
     async with async_session() as session:
-        users = await crud.get_top_users(session, limit=PAGE_SIZE + 1, offset=offset)
+        if backward:
+            users = await crud.get_top_users(session, limit=PAGE_SIZE, before=cursor)
+        else:
+            users = await crud.get_top_users(session, limit=PAGE_SIZE + 1, after=cursor)
 
-    if not users and page == 0:
+    if not users:
         await callback.answer("Пусто...", show_alert=True)
         return
 
-    has_more = len(users) > PAGE_SIZE
+    # Назад листаем только туда, откуда пришли, так что дальше страницы точно есть
+    has_more = backward or len(users) > PAGE_SIZE
     users = users[:PAGE_SIZE]
 
     text = f"<b>🏆 Топ пользователей по загрузкам (стр. {page + 1}):</b>\n\n"
-    for i, user in enumerate(users, start=offset + 1):
+    for i, user in enumerate(users, start=page * PAGE_SIZE + 1):
         username = f"@{user.username}" if hasattr(user, 'username') and user.username else f"ID: <code>{user.tg_id}</code>"
         text += f"{i}. {username} — <b>{user.track_count}</b> треков\n"
 
     await callback.message.edit_text(
         text, 
-        reply_markup=get_pagination_keyboard("admin_top", page, has_more), 
+        reply_markup=get_pagination_keyboard("admin_top", page, _user_key(users[0]), _user_key(users[-1]), has_more),
         parse_mode="HTML"
     )
     await callback.answer()
@@ -112,20 +177,27 @@ async def cb_top_users(callback: CallbackQuery):
 
 @router.callback_query(F.data.startswith("admin_tracks:"), AdminFilter())
 async def cb_last_tracks(callback: CallbackQuery):
-    page = int(callback.data.split(":")[1])
-    if page < 0 or page > MAX_PAGE:
-        await callback.answer("Недопустимый номер страницы", show_alert=True)
+    parsed = _parse_page(callback.data)
+    if parsed is None:
+        await callback.answer("Недопустимая страница", show_alert=True)
         return
-    offset = page * PAGE_SIZE
-    
+    backward, page, key = parsed
+    if key and not key.isdigit():
+        await callback.answer("Недопустимая страница", show_alert=True)
+        return
+    cursor = int(key) if key else None
+
     async with async_session() as session:
-        tracks = await crud.get_last_tracks(session, limit=PAGE_SIZE + 1, offset=offset)
+        if backward:
+            tracks = await crud.get_last_tracks(session, limit=PAGE_SIZE, before=cursor)
+        else:
+            tracks = await crud.get_last_tracks(session, limit=PAGE_SIZE + 1, after=cursor)
 
-    if not tracks and page == 0:
+    if not tracks:
         await callback.answer("Треков пока нет...", show_alert=True)
         return
 
-    has_more = len(tracks) > PAGE_SIZE
+    has_more = backward or len(tracks) > PAGE_SIZE
     tracks = tracks[:PAGE_SIZE]
 
     text = f"<b>🎵 Последние загрузки (стр. {page + 1}):</b>\n\n"
@@ -139,12 +211,48 @@ async def cb_last_tracks(callback: CallbackQuery):
 
     await callback.message.edit_text(
         text, 
-        reply_markup=get_pagination_keyboard("admin_tracks", page, has_more), 
+        reply_markup=get_pagination_keyboard("admin_tracks", page, str(tracks[0].id), str(tracks[-1].id), has_more),
         parse_mode="HTML"
     )
     await callback.answer()
 
 
+def _db_metrics_text(limit: int = 10) -> str:
+    snapshot = db_metrics.snapshot()
+    pool = snapshot["pool"]
+    checkout = snapshot["pool_checkout"]
+    text = (
+        f"<b>🗄 Метрики БД</b>\n\n"
+        f"🔌 Пул: занято <b>{pool['checked_out']}</b> из {pool['size']} (+{pool['overflow']} overflow)\n"
+        f"⏳ Ожидание соединения: p50 {checkout['p50_ms']:.0f} / p95 {checkout['p95_ms']:.0f} / "
+        f"max {checkout['max_ms']:.0f} мс\n"
+        f"🐢 Медленных запросов: <b>{snapshot['slow_queries']}</b>, ошибок: {snapshot['errors']}\n\n"
+        f"<b>Запросы по суммарному времени</b> (кол-во, p50 / p95 / max, мс):\n"
+    )
+    statements = sorted(snapshot["statements"].items(), key=lambda item: item[1]["total_ms"], reverse=True)
+    for name, stats in statements[:limit]:
+        text += (
+            f"<code>{html.escape(name)}</code> — {stats['count']}, "
+            f"{stats['p50_ms']:.0f} / {stats['p95_ms']:.0f} / {stats['max_ms']:.0f}\n"
+        )
+    if not statements:
+        text += "запросов ещё не было\n"
+    return text
+
+
+@router.callback_query(F.data == "admin_db", AdminFilter())
+async def cb_db_metrics(callback: CallbackQuery):
+    builder = InlineKeyboardBuilder()
+    builder.button(text="🔄 Обновить", callback_data="admin_db")
+    builder.button(text="🔙 В меню", callback_data="admin_refresh")
+    builder.adjust(2)
+    try:
+        await callback.message.edit_text(_db_metrics_text(), reply_markup=builder.as_markup(), parse_mode="HTML")
+    except TelegramBadRequest:
+        pass
+    await callback.answer()
+
+
 # ─── Broadcast ───────────────────────────────────────
 
 @router.callback_query(F.data == "admin_broadcast", AdminFilter())
@@ -175,7 +283,7 @@ async def cb_broadcast_cancel(callback: CallbackQuery, state: FSMContext):
 async def handle_broadcast_message(message: Message, state: FSMContext, bot: Bot):
     """Шаг 1: получаем сообщение для рассылки, показываем превью и запрашиваем подтверждение."""
     async with async_session() as session:
-        total = len(await crud.get_all_tg_ids(session))
+        total = await crud.count_broadcast_recipients(session)
 
     # Сохраняем идентификаторы сообщения в FSM для последующей рассылки
     await state.update_data(
@@ -200,7 +308,7 @@ async def handle_broadcast_message(message: Message, state: FSMContext, bot: Bot
 
 @router.callback_query(F.data == "admin_broadcast_confirm", AdminFilter())
 async def cb_broadcast_confirm(callback: CallbackQuery, state: FSMContext, bot: Bot):
-    """Шаг 2: выполняем рассылку после подтверждения."""
+    """Шаг 2: запускаем рассылку в фоне после подтверждения."""
     data = await state.get_data()
     await state.clear()
 
@@ -214,50 +322,39 @@ async def cb_broadcast_confirm(callback: CallbackQuery, state: FSMContext, bot:
     await callback.answer()
 
     async with async_session() as session:
-        tg_ids = await crud.get_all_tg_ids(session)
-
-    total = len(tg_ids)
-    success = 0
-    failed = 0
+        total = await crud.count_broadcast_recipients(session)
+        broadcast = await crud.create_broadcast(
+            session,
+            admin_chat_id=callback.message.chat.id,
+            src_chat_id=src_chat_id,
+            src_message_id=src_message_id,
+            total=total,
+            owner_id=broadcast_engine.owner_id,
+        )
 
     status_msg = await callback.message.answer(
-        f"📢 <b>Рассылка запущена...</b>\n\n"
+        f"📢 <b>Рассылка #{broadcast.id} запущена...</b>\n\n"
         f"👥 Всего: {total}\n"
         f"⏳ Отправлено: 0/{total}",
+        reply_markup=stop_keyboard(broadcast.id),
         parse_mode="HTML",
     )
+    await broadcast_engine.start(bot, broadcast, status_msg, done_markup=get_admin_keyboard())
 
-    for i, tg_id in enumerate(tg_ids):
-        try:
-            await bot.copy_message(
-                chat_id=tg_id,
-                from_chat_id=src_chat_id,
-                message_id=src_message_id,
-            )
-            success += 1
-        except Exception as e:
-            failed += 1
-            logger.warning(f"Broadcast failed for {tg_id}: {e}")
-
-        # Telegram rate limit: ~30 msg/sec
-        if (i + 1) % 25 == 0:
-            await asyncio.sleep(1)
-            try:
-                await status_msg.edit_text(
-                    f"📢 <b>Рассылка...</b>\n\n"
-                    f"✅ Доставлено: {success}\n"
-                    f"❌ Не доставлено: {failed}\n"
-                    f"⏳ Прогресс: {i + 1}/{total}",
-                    parse_mode="HTML",
-                )
-            except Exception:
-                pass
-
-    await status_msg.edit_text(
-        f"📢 <b>Рассылка завершена!</b>\n\n"
-        f"✅ Доставлено: <b>{success}</b>\n"
-        f"❌ Не доставлено: <b>{failed}</b>\n"
-        f"👥 Всего: <b>{total}</b>",
-        reply_markup=get_admin_keyboard(),
-        parse_mode="HTML",
-    )
+
+@router.callback_query(F.data.startswith("admin_broadcast_stop:"), AdminFilter())
+async def cb_broadcast_stop(callback: CallbackQuery):
+    broadcast_id = int(callback.data.split(":")[1])
+    # Рассылку может вести другая реплика — она увидит статус при продлении аренды
+    async with async_session() as session:
+        cancelled = await crud.cancel_broadcast(session, broadcast_id)
+    if broadcast_engine.cancel(broadcast_id) or cancelled:
+        await callback.answer("Останавливаю после текущей пачки...")
+    else:
+        await callback.answer("Эта рассылка уже не идёт", show_alert=True)
+
+
+@router.startup()
+async def resume_broadcasts(bot: Bot):
+    """Продолжает рассылки без живого владельца: после рестарта и за упавшими репликами."""
+    await broadcast_engine.resume(bot, done_markup=get_admin_keyboard())
@@ -2,13 +2,14 @@ from aiogram import Router, F
 from aiogram.filters import Command
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
-from yandex_music import ClientAsync
 
 from src.database import crud
 from src.database.models import async_session
 from src.utils.texts import set_active_playlist, welcome_with_auth, welcome_no_auth
 from src.utils.keyboards import get_playlists_keyboard, PlaylistCallback
 from src.handlers.auth import get_auth_keyboard
+from src.utils.yandex_clients import get_client, invalidate_client, is_auth_error
+from src.utils.auth_cache import invalidate_token_status
 
 router = Router()
 
@@ -26,7 +27,7 @@ async def cmd_set_playlist(message: Message, state: FSMContext):
     wait_message = await message.answer("⏳ Подключаюсь к Яндексу и получаю список плейлистов...")
 
     try:
-        client = await ClientAsync(token).init()
+        client = await get_client(token)
         yandex_playlists = await client.users_playlists_list()
         
         if not yandex_playlists:
@@ -51,6 +52,9 @@ async def cmd_set_playlist(message: Message, state: FSMContext):
         )
 
     except Exception as e:
+        if is_auth_error(e):
+            invalidate_client(token)
+            invalidate_token_status(tg_id)
         await wait_message.edit_text(f"Произошла ошибка при получении данных от Яндекса: {e}")
 
 
@@ -1,47 +1,88 @@
 import os
 import html
 import asyncio
+import logging
+import functools
+from dataclasses import dataclass
+from typing import Optional
 from aiogram import Router, F, Bot
 from aiogram.filters import Command
-from aiogram.types import Message, ReplyKeyboardRemove, FSInputFile
+from aiogram.enums import ChatType
+from aiogram.types import Chat, Message, ReplyKeyboardRemove
 from aiogram.fsm.context import FSMContext
 
 from src.database import crud
-from src.database.models import async_session
+from src.database.models import (
+    async_session, Track, UploadJob, JOB_DOWNLOADED, JOB_UPLOADED, JOB_FAILED, JOB_ERROR_EXHAUSTED,
+)
 from src.utils.states import UserSteps
-from src.utils.metadata import extract_metadata
+from src.utils.metadata import CoverImage, extract_metadata, extract_metadata_from_header
 from src.utils.async_uploader import upload_track_async
+from src.utils.streaming import AsyncFilePayload
+from src.utils.track_finisher import FinishJob, FinishResult, STEP_RENAME, STEP_COVER, finish_track, make_full_title
+from src.utils.upload_queue import upload_scheduler, QueueFullError, QUEUE_SIZE
+from src.utils.local_files import fetch_audio
+from src.utils.photo_cache import answer_cached_photo
+from src.utils.stream_pipe import is_streaming_available, open_telegram_stream, PipedAudioPayload
+from src.utils.upload_batch import BatchProgress, batch_collector
+from src.utils.progress import ProgressCallback, ProgressReporter, format_bytes_progress
+from src.utils import upload_journal
+from src.utils.retry_policy import CircuitOpenError
+from src.utils.disk_budget import DiskBudgetError, disk_budget
+from src.utils.yandex_clients import is_auth_error
+from src.utils.auth_cache import invalidate_token_status
+from src.utils.upload_worker import is_remote_uploads, upload_watcher, upload_worker
+from src.utils.background import background_tasks
 
 router = Router()
+logger = logging.getLogger(__name__)
 
-DOWNLOAD_DIR = "downloads"
-os.makedirs(DOWNLOAD_DIR, exist_ok=True)
+os.makedirs(upload_journal.DOWNLOAD_DIR, exist_ok=True)
 MAX_FILE_SIZE = 2 * 1024 * 1024 * 1024  # 2 GB
 
+DISK_FULL_TEXT = "❌ На сервере сейчас не хватает места под этот файл. Попробуй позже."
+EXHAUSTED_TEXT = "загрузка несколько раз прерывалась"
+
+FINISH_STEP_NAMES = {STEP_RENAME: "переименовать трек", STEP_COVER: "поставить обложку"}
+
+# Сколько строк каждого списка показывать в итоге пакета (лимит сообщения — 4096 символов)
+SUMMARY_LIST_LIMIT = 15
+
+AD_FOOTER = (
+    "——————————————\n"
+    "<a href=\"https://t.me/internet_connected_bot?start=ref_AKW7U53A\">Ускоритель интернета</a>"
+)
+
 AD_COVER_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "templates", "bot_fallback_cover.png")
 
+
+@functools.cache
+def _fallback_cover() -> bytes:
+    with open(AD_COVER_PATH, "rb") as f:
+        return f.read()
+
 @router.message(Command("add"))
 async def cmd_add_track(message: Message, state: FSMContext):
     tg_id = message.from_user.id
 
     async with async_session() as session:
-        token = await crud.get_token(session, tg_id)
-        playlist = await crud.get_active_playlist(session, tg_id)
+        context = await crud.get_upload_context(session, tg_id)
 
-    if not token:
+    if not context or not context.token:
         await message.answer("Сначала авторизуйся через /auth")
         return
 
-    if not playlist:
+    if not context.playlist_kind:
         await message.answer("Сначала выбери плейлист: /set_playlist")
         return
 
     await state.set_state(UserSteps.uploading)
-    await state.update_data(token=token, playlist_kind=playlist.kind)
+    # Токен в FSM не кладём: хранилище может быть внешним (см. src/utils/fsm_storage.py)
+    await state.update_data(playlist_kind=context.playlist_kind)
 
     await message.answer(
         f"📂 <b>Режим загрузки включен!</b>\n"
-        f"Выбран плейлист: <b>{playlist.title}</b>\n\n"
+        f"Выбран плейлист: <b>{context.playlist_title}</b>\n\n"
         f"Кидай мне .mp3 файлы, а я буду их загружать.\n"
         f"Для выхода тыкни /end",
         parse_mode="HTML"
@@ -53,86 +94,557 @@ async def cmd_end_upload(message: Message, state: FSMContext):
     await message.answer("✅ Вышли из режима загрузки", reply_markup=ReplyKeyboardRemove())
 
 
+def _finish_warning(finish: FinishResult) -> str:
+    """Строка-предупреждение, если переименование или обложка не удались."""
+    failed = [FINISH_STEP_NAMES.get(step, step) for step in finish.errors]
+    if not failed:
+        return ""
+    return f"⚠️ Не удалось {' и '.join(failed)} — трек загружен как есть.\n\n"
+
+
+def _is_forced(message: Message) -> bool:
+    """Подпись /force к файлу — загрузить даже если такой трек уже есть."""
+    return bool(message.caption) and "/force" in message.caption.lower().split()
+
+
+def _duplicate_text(track: Track) -> str:
+    return (
+        f"♻️ Этот трек уже есть в плейлисте: <b>{html.escape(track.artist)} - {html.escape(track.title)}</b>\n\n"
+        f"Чтобы загрузить заново, отправь файл с подписью /force"
+    )
+
+
+def _display_name(performer: Optional[str], title: Optional[str], file_name: Optional[str]) -> str:
+    if performer and title:
+        return f"{performer} - {title}"
+    return title or file_name or "track.mp3"
+
+
+def _job_name(job: UploadJob) -> str:
+    return _display_name(job.performer, job.audio_title, job.file_name)
+
+
+@dataclass
+class TrackOutcome:
+    """Результат обработки одного файла: загруженный трек или найденный дубликат."""
+    artist: str = ""
+    title: str = ""
+    cover: Optional[CoverImage] = None
+    finish: Optional[FinishResult] = None
+    duplicate: Optional[Track] = None
+
+
 @router.message(UserSteps.uploading, F.audio)
 async def process_audio_upload(message: Message, state: FSMContext, bot: Bot):
     data = await state.get_data()
     tg_id = message.from_user.id
-    token = data.get("token")
     playlist_kind = data.get("playlist_kind")
 
+    async with async_session() as session:
+        token = await crud.get_token(session, tg_id)
+    if not token:
+        await state.clear()
+        await message.reply("Сначала авторизуйся через /auth")
+        return
+
     if message.audio.file_size and message.audio.file_size > MAX_FILE_SIZE:
         await message.reply("❌ Файл слишком большой. Максимальный размер — 2 ГБ.")
         return
 
-    status_msg = await message.reply("⏳ Скачиваю файл...")
+    if not is_remote_uploads():
+        # С воркерами файлы на диске бота не лежат — место проверяет воркер
+        try:
+            disk_budget.check(message.audio.file_size or 0)
+        except DiskBudgetError:
+            await message.reply(DISK_FULL_TEXT)
+            return
+
+    # Альбом или пачка файлов приходит отдельными апдейтами — собираем их в один пакет.
+    # Файл, попавший в открытый пакет, обработает задача пакета
+    batch = batch_collector.add(tg_id, message)
+    if batch is None:
+        return
+
+    # Отвечаем сразу, не дожидаясь окна пакета; это сообщение станет статусом файла или пакета
+    status_msg = await message.reply("📥 Принял, ставлю в очередь...")
+    background_tasks.spawn(
+        _handle_collected(batch, bot, status_msg, tg_id, token, playlist_kind),
+        name=f"upload-batch-{tg_id}",
+    )
+
+
+async def _handle_collected(batch, bot: Bot, status_msg: Message, tg_id: int, token: str, playlist_kind: str):
+    """Фоновая часть приёма: дождаться пакета и поставить его файлы в очередь."""
+    messages = await batch_collector.wait(tg_id, batch)
+    if len(messages) > 1:
+        await _run_batch(messages, bot, status_msg, tg_id, token, playlist_kind)
+    else:
+        await _start_single(messages[0], bot, status_msg, tg_id, token, playlist_kind)
+
+
+async def _start_single(message: Message, bot: Bot, status_msg: Message, tg_id: int, token: str, playlist_kind: str):
+    force = _is_forced(message)
+    if not force:
+        # Тот же файл Telegram уже загружали в этот плейлист — не качаем его вовсе
+        async with async_session() as session:
+            duplicate = await crud.find_duplicate_track(
+                session, tg_id, playlist_kind, tg_file_unique_id=message.audio.file_unique_id
+            )
+        if duplicate:
+            await status_msg.edit_text(_duplicate_text(duplicate), parse_mode="HTML")
+            return
+
+    if is_remote_uploads():
+        await _enqueue_remote(message, status_msg, playlist_kind, force)
+        return
+
+    if upload_scheduler.is_full:
+        await status_msg.edit_text("❌ Очередь загрузок переполнена. Попробуй отправить файл чуть позже.")
+        return
+
+    job = await _create_local_job(message, playlist_kind, force)
 
-    file_id = message.audio.file_id
-    file_name = message.audio.file_name or "track.mp3"
-    safe_filename = "".join([c for c in file_name if c.isalpha() or c.isdigit() or c in (' ', '.', '_')]).rstrip()
+    position = upload_scheduler.estimate_position(tg_id)
+    if position:
+        await status_msg.edit_text(f"🕒 В очереди, перед тобой: {position}")
+    else:
+        await status_msg.edit_text("⏳ Скачиваю файл...")
 
-    file_dir = os.path.join(DOWNLOAD_DIR, file_id)
-    os.makedirs(file_dir, exist_ok=True)
-    file_path = os.path.join(file_dir, safe_filename)
+    async def run():
+        await _run_upload(message, bot, status_msg, job, token, queued=bool(position))
 
-    cover_path = None
     try:
-        await bot.download(message.audio, destination=file_path)
+        await upload_scheduler.submit(tg_id, run)
+    except QueueFullError:
+        await upload_journal.mark_failed(job, "upload queue is full")
+        await status_msg.edit_text("❌ Очередь загрузок переполнена. Попробуй отправить файл чуть позже.")
 
-        await status_msg.edit_text("🎵 Читаю метаданные...")
 
-        artist_fallback = message.audio.performer or "Unknown Artist"
-        title_fallback = message.audio.title or None
-        artist, title, cover_path = await asyncio.to_thread(
-            extract_metadata, file_path, artist_fallback, title_fallback
-        )
+async def _create_local_job(message: Message, playlist_kind: str, force: bool) -> UploadJob:
+    """Задача, которую выполняет этот бот: он её владелец и держит на неё аренду."""
+    job = await upload_journal.create_job(message, playlist_kind, force, owner=upload_worker.worker_id)
+    upload_worker.hold(job.id)
+    return job
+
+
+async def _enqueue_remote(message: Message, status_msg: Message, playlist_kind: str, force: bool):
+    """Ставит файл в общую очередь воркеров (worker.py); статус и результат пришлёт воркер."""
+    async with async_session() as session:
+        queued = await crud.count_queued_upload_jobs(session)
+    if queued >= QUEUE_SIZE:
+        await status_msg.edit_text("❌ Очередь загрузок переполнена. Попробуй отправить файл чуть позже.")
+        return
+
+    if queued:
+        await status_msg.edit_text(f"🕒 В очереди, перед тобой: {queued}")
+    else:
+        await status_msg.edit_text("⏳ Скачиваю файл...")
+    await upload_journal.create_job(message, playlist_kind, force, status_message_id=status_msg.message_id)
+
+
+def _job_status_message(bot: Bot, job: UploadJob) -> Optional[Message]:
+    """Сообщение со статусом одиночного файла; у файлов из пакета его нет."""
+    if job.status_message_id is None:
+        return None
+    # Сообщение отправил бот — воркеру достаточно его id и чата
+    return Message(
+        message_id=job.status_message_id,
+        date=job.created_at,
+        chat=Chat(id=job.chat_id, type=ChatType.PRIVATE),
+    ).as_(bot)
+
+
+async def run_claimed_job(bot: Bot, job: UploadJob):
+    """Задача, которую воркер загрузок (worker.py) взял из общей очереди."""
+    status_msg = _job_status_message(bot, job)
+
+    async with async_session() as session:
+        token = await crud.get_token(session, job.tg_id)
+    if not token:
+        await upload_journal.mark_failed(job, "no token")
+        if status_msg is not None:
+            await status_msg.edit_text("Сначала авторизуйся через /auth")
+        return
+
+    if status_msg is None:
+        # Файл из пакета: итог бот соберёт по строке задачи
+        await _process_track(bot, job, token)
+        return
+    await _run_upload(status_msg, bot, status_msg, job, token, queued=True)
+
+
+async def notify_exhausted_job(bot: Bot, job: UploadJob):
+    """Воркеры бросили задачу UPLOAD_WORKER_MAX_ATTEMPTS раз — показываем провал в её статусе."""
+    status_msg = _job_status_message(bot, job)
+    if status_msg is None:
+        # Файл из пакета: провал попадёт в итог пакета
+        return
+    await status_msg.edit_text(
+        f"❌ Не удалось загрузить <b>{html.escape(_job_name(job))}</b>: {EXHAUSTED_TEXT}. Отправь файл ещё раз.",
+        parse_mode="HTML",
+    )
+
+
+@router.startup()
+async def resume_interrupted_uploads(bot: Bot):
+    """После рестарта продолжает незавершённые загрузки, у которых нет живого владельца."""
+    if is_remote_uploads():
+        # Брошенные задачи подхватят воркеры, когда истечёт аренда
+        return
+
+    # Каталоги всех незавершённых задач, в том числе чужих, остаются на месте
+    jobs = await upload_journal.unfinished_jobs()
+    await upload_journal.reclaim_orphans(jobs)
+    upload_worker.start_local(functools.partial(_resume_jobs, bot))
+
+
+async def _resume_jobs(bot: Bot, jobs: list[UploadJob]):
+    """Продолжает задачи, забранные у прошлого запуска или упавшей реплики."""
+    for job in jobs:
+        async with async_session() as session:
+            token = await crud.get_token(session, job.tg_id)
+        if not token:
+            await upload_journal.mark_failed(job, "no token on resume")
+            continue
+
+        try:
+            status_msg = await bot.send_message(
+                job.chat_id,
+                f"♻️ Бот перезапускался, продолжаю загрузку: <b>{html.escape(_job_name(job))}</b>",
+                parse_mode="HTML",
+            )
+        except Exception as e:
+            await upload_journal.mark_failed(job, f"cannot notify user on resume: {e}")
+            continue
+
+        async def run(job=job, status_msg=status_msg, token=token):
+            await _run_upload(status_msg, bot, status_msg, job, token)
+
+        try:
+            await upload_scheduler.submit(job.tg_id, run)
+        except QueueFullError:
+            await upload_journal.mark_failed(job, "upload queue is full on resume")
+            await status_msg.edit_text("❌ Не удалось продолжить загрузку: очередь переполнена. Отправь файл ещё раз.")
+
+    logger.info(f"Resumed {len(jobs)} interrupted upload jobs")
+
+
+async def _reload_cover(bot: Bot, job: UploadJob) -> Optional[CoverImage]:
+    """Обложка для задачи, продолжаемой после загрузки файла: из скачанного файла или начала потока."""
+    if job.local_path and os.path.exists(job.local_path):
+        _, _, cover = await asyncio.to_thread(extract_metadata, job.local_path)
+        return cover
+    if is_streaming_available(bot):
+        stream, _ = await open_telegram_stream(bot, job.tg_file_id)
+        try:
+            header = await stream.read_header()
+        finally:
+            await stream.aclose()
+        _, _, cover = await asyncio.to_thread(extract_metadata_from_header, header)
+        return cover
+    return None
+
+
+async def _finish(job: UploadJob, token: str, cover: Optional[CoverImage]) -> FinishResult:
+    """Переименование и обложка (параллельно или в фоне, см. track_finisher) с отметкой в журнале."""
+    if not job.ugc_track_id:
+        result = FinishResult(track_id=None)
+        await upload_journal.finish(job, result)
+        return result
+
+    return await finish_track(FinishJob(
+        token=token,
+        track_id=job.ugc_track_id,
+        full_title=None if job.renamed else make_full_title(job.title, job.artist),
+        cover=None if job.cover_set else cover,
+        on_done=functools.partial(upload_journal.finish, job),
+    ))
+
+
+async def _process_track(
+    bot: Bot,
+    job: UploadJob,
+    token: str,
+    reporter: Optional[ProgressReporter] = None,
+) -> TrackOutcome:
+    """
+    Скачать, прочитать теги и залить в Яндекс один файл, отмечая стадии в журнале.
+    Задача продолжается с последней пройденной стадии (после рестарта).
+    Стадии и побайтовый прогресс идут в reporter (в пакетном режиме его нет).
+    """
+    def report(text: str) -> None:
+        if reporter is not None:
+            reporter.update(text)
+
+    def bytes_progress(stage: str) -> Optional[ProgressCallback]:
+        if reporter is None:
+            return None
+        return lambda done, total: reporter.update(f"{stage}\n{format_bytes_progress(done, total)}")
+
+    if job.stage == JOB_UPLOADED:
+        # Файл уже в Яндексе — остались только переименование и обложка
+        report(f"🎨 Дооформляю трек: <b>{html.escape(job.artist)} - {html.escape(job.title)}</b>...")
+        cover = await _reload_cover(bot, job)
+        finish = await _finish(job, token, cover)
+        return TrackOutcome(artist=job.artist, title=job.title, cover=cover, finish=finish)
+
+    safe_filename = "".join([c for c in job.file_name if c.isalpha() or c.isdigit() or c in (' ', '.', '_')]).rstrip()
+    artist_fallback = job.performer or "Unknown Artist"
+    title_fallback = job.audio_title or safe_filename
+
+    source_path = None
+    content_hash = None
+    piped_payload = None
+    try:
+        if job.stage == JOB_DOWNLOADED and job.local_path and os.path.exists(job.local_path):
+            # Файл скачан до рестарта — не качаем заново
+            source_path, content_hash = job.local_path, job.content_hash
+
+            report("🎵 Читаю метаданные...")
+
+            artist, title, cover = await asyncio.to_thread(
+                extract_metadata, source_path, artist_fallback, title_fallback
+            )
+        elif is_streaming_available(bot):
+            # Файл идёт из Telegram прямо в Яндекс, теги читаются из начала потока
+            stream, size = await open_telegram_stream(bot, job.tg_file_id)
+            piped_payload = PipedAudioPayload(stream, size or job.file_size)
+            header = await stream.read_header()
+
+            report("🎵 Читаю метаданные...")
+
+            artist, title, cover = await asyncio.to_thread(
+                extract_metadata_from_header, header, artist_fallback, title_fallback
+            )
+        else:
+            # Место под файл резервируется до скачивания; если его нет — ждём, пока освободится
+            size = job.file_size or 0
+            if disk_budget.waiting_needed(size):
+                report("💾 Жду, пока освободится место на диске...")
+            await disk_budget.reserve(job.id, size)
+
+            file_dir = upload_journal.job_dir(job.id)
+            os.makedirs(file_dir, exist_ok=True)
+            file_path = os.path.join(file_dir, safe_filename)
+
+            # С локальным Bot API сервером файл не копируется, а линкуется или читается на месте
+            fetched = await fetch_audio(
+                bot, job.tg_file_id, file_path,
+                file_size=job.file_size,
+                on_progress=bytes_progress("⏳ Скачиваю файл..."),
+            )
+            source_path, content_hash = fetched.path, fetched.content_hash
+            await disk_budget.settle(job.id, source_path)
+            await upload_journal.mark_downloaded(job, source_path, content_hash)
+
+            # Без хеша (файл локального Bot API) повтор уже проверен по file_unique_id
+            if content_hash and not job.force:
+                async with async_session() as session:
+                    duplicate = await crud.find_duplicate_track(
+                        session, job.tg_id, job.playlist_kind, content_hash=content_hash
+                    )
+                if duplicate:
+                    await upload_journal.finish(job)
+                    return TrackOutcome(duplicate=duplicate)
+
+            report("🎵 Читаю метаданные...")
+
+            artist, title, cover = await asyncio.to_thread(
+                extract_metadata, source_path, artist_fallback, title_fallback
+            )
 
-        await status_msg.edit_text(f"🚀 Загружаю в Яндекс: <b>{html.escape(artist)} - {html.escape(title)}</b>...", parse_mode="HTML")
+        stage = f"🚀 Загружаю в Яндекс: <b>{html.escape(artist)} - {html.escape(title)}</b>..."
+        report(stage)
 
-        await upload_track_async(
+        # Отпечаток, если его ещё нет, считается по ходу отправки тела
+        payload = piped_payload or await AsyncFilePayload.open(source_path)
+        track_id = await upload_track_async(
             token=token,
-            playlist_kind=playlist_kind,
-            file_path=file_path,
+            playlist_kind=job.playlist_kind,
+            file_path=source_path,
             yandex_filename=safe_filename,
-            title=title,
-            artist=artist,
-            cover_path=cover_path
+            file_payload=payload,
+            on_progress=bytes_progress(stage),
         )
 
-        async with async_session() as session:
-            await crud.add_track(session, tg_id, artist, title)
+        # ugc-track-id и запись о треке сохраняются до шагов оформления:
+        # после рестарта файл повторно не заливается
+        content_hash = content_hash or payload.content_hash
+        await upload_journal.mark_uploaded(job, track_id, artist, title, content_hash)
+
+        finish = await _finish(job, token, cover)
+        return TrackOutcome(artist=artist, title=title, cover=cover, finish=finish)
+
+    except Exception as e:
+        if is_auth_error(e):
+            # Токен отозван — мидлварь должна перечитать его из БД, а не верить кешу
+            invalidate_token_status(job.tg_id)
+        await upload_journal.mark_failed(job, str(e) or type(e).__name__)
+        raise
+
+    finally:
+        if piped_payload is not None:
+            await piped_payload.release()
+
+
+async def _run_upload(
+    message: Message,
+    bot: Bot,
+    status_msg: Message,
+    job: UploadJob,
+    token: str,
+    queued: bool = False,
+):
+    """Задача воркера: скачать, прочитать теги, залить в Яндекс и ответить пользователю."""
+    # Правки статуса склеиваются и уходят не чаще раза в PROGRESS_EDIT_INTERVAL
+    reporter = ProgressReporter(status_msg, parse_mode="HTML")
+    if queued:
+        reporter.update("⏳ Скачиваю файл...")
+
+    try:
+        outcome = await _process_track(bot, job, token, reporter)
+        if outcome.duplicate:
+            await reporter.close(_duplicate_text(outcome.duplicate))
+            return
 
         success_text = (
             f"✅ <b>Загружено!</b>\n\n"
-            f"👤 Артист: {html.escape(artist)}\n"
-            f"🎼 Трек: {html.escape(title)}\n\n"
+            f"👤 Артист: {html.escape(outcome.artist)}\n"
+            f"🎼 Трек: {html.escape(outcome.title)}\n\n"
+            f"{_finish_warning(outcome.finish)}"
             f"кидай еще или тыкай /end для выхода.\n\n"
-            f"——————————————\n"
-            f"<a href=\"https://t.me/internet_connected_bot?start=ref_AKW7U53A\">Ускоритель интернета</a>"
+            f"{AD_FOOTER}"
         )
 
+        await reporter.close()
         await status_msg.delete()
 
-        if cover_path:
-            photo = FSInputFile(cover_path)
+        # Одинаковые картинки уходят по сохранённому file_id, а не загружаются заново
+        if outcome.cover:
+            await answer_cached_photo(message, outcome.cover.data, caption=success_text, parse_mode="HTML")
         else:
-            photo = FSInputFile(AD_COVER_PATH)
-        await message.answer_photo(photo, caption=success_text, parse_mode="HTML")
+            await answer_cached_photo(
+                message, _fallback_cover(), filename="cover.png", caption=success_text, parse_mode="HTML"
+            )
+
+    except DiskBudgetError:
+        await reporter.close(DISK_FULL_TEXT)
+
+    except CircuitOpenError:
+        await reporter.close("❌ Яндекс сейчас отвечает с ошибками, загрузки приостановлены. Попробуй через минуту.")
 
     except Exception as e:
         import traceback
         tb = traceback.format_exc()
-        await status_msg.edit_text(f"❌ Ошибка при загрузке: {e}")
+        await reporter.close(f"❌ Ошибка при загрузке: {html.escape(str(e))}")
         print(f"--- UPLOAD ERROR TRACEBACK ---\n{tb}\n-----------------------------")
 
-    finally:
-        if os.path.exists(file_path):
-            os.remove(file_path)
-        if cover_path and os.path.exists(cover_path):
-            os.remove(cover_path)
 
-        file_dir = os.path.dirname(file_path)
-        if os.path.exists(file_dir) and file_dir != DOWNLOAD_DIR:
+def _limited_lines(items: list[str], limit: int = SUMMARY_LIST_LIMIT) -> str:
+    lines = [f"• {item}" for item in items[:limit]]
+    if len(items) > limit:
+        lines.append(f"…и ещё {len(items) - limit}")
+    return "\n".join(lines)
+
+
+def _batch_progress_text(progress: BatchProgress) -> str:
+    return (
+        f"📦 <b>Загружаю пакет:</b> {progress.done}/{progress.total}\n\n"
+        f"✅ Загружено: {len(progress.uploaded)}\n"
+        f"♻️ Уже в плейлисте: {len(progress.duplicates)}\n"
+        f"❌ Ошибок: {len(progress.failed)}\n"
+        f"⏳ В работе: {progress.running}, в очереди: {progress.queued}"
+    )
+
+
+def _batch_summary_text(progress: BatchProgress) -> str:
+    text = f"📦 <b>Пакет обработан:</b> {progress.total} файлов\n\n"
+    if progress.uploaded:
+        text += f"✅ <b>Загружено ({len(progress.uploaded)}):</b>\n{_limited_lines(progress.uploaded)}\n\n"
+    if progress.warnings:
+        text += (
+            f"⚠️ Не удалось переименовать или поставить обложку ({len(progress.warnings)}), "
+            f"эти треки загружены как есть.\n\n"
+        )
+    if progress.duplicates:
+        text += (
+            f"♻️ <b>Уже были в плейлисте ({len(progress.duplicates)}):</b>\n{_limited_lines(progress.duplicates)}\n"
+            f"Чтобы загрузить заново, отправь файл с подписью /force\n\n"
+        )
+    if progress.failed:
+        failed = [f"{name} — {error}" for name, error in progress.failed]
+        text += f"❌ <b>Ошибки ({len(progress.failed)}):</b>\n{_limited_lines(failed)}\n\n"
+    text += f"кидай еще или тыкай /end для выхода.\n\n{AD_FOOTER}"
+    return text
+
+
+async def _wait_remote(job: UploadJob, name: str, progress: BatchProgress):
+    """Файл пакета у воркера: ждём конечную стадию и записываем итог по строке задачи."""
+    job = await upload_watcher.wait(job.id, on_claimed=progress.started)
+    if job.stage == JOB_FAILED:
+        error = EXHAUSTED_TEXT if job.error == JOB_ERROR_EXHAUSTED else job.error or "ошибка загрузки"
+        progress.add_failed(name, html.escape(error))
+    elif job.artist is None:
+        # Задача завершена без заливки — найден дубликат
+        progress.add_duplicate(name)
+    else:
+        errors = {step: "" for step, ok in ((STEP_RENAME, job.renamed), (STEP_COVER, job.cover_set)) if not ok}
+        finish = FinishResult(track_id=job.ugc_track_id, errors=errors)
+        progress.add_uploaded(html.escape(f"{job.artist} - {job.title}"), warning=_finish_warning(finish))
+
+
+async def _run_batch(messages: list[Message], bot: Bot, status_msg: Message, tg_id: int, token: str, playlist_kind: str):
+    """Загружает пакет файлов параллельно (в пределах лимита пользователя) с одним общим статусом."""
+    await status_msg.edit_text(f"📦 Принял пакет: {len(messages)} файлов, ставлю в очередь...")
+    progress = BatchProgress(status_msg=status_msg, total=len(messages), render=_batch_progress_text)
+    loop = asyncio.get_running_loop()
+    waiters = []
+
+    for msg in messages:
+        force = _is_forced(msg)
+        if not force:
+            async with async_session() as session:
+                duplicate = await crud.find_duplicate_track(
+                    session, tg_id, playlist_kind, tg_file_unique_id=msg.audio.file_unique_id
+                )
+            if duplicate:
+                progress.add_duplicate(html.escape(_display_name(msg.audio.performer, msg.audio.title, msg.audio.file_name)), was_running=False)
+                continue
+
+        if is_remote_uploads():
+            # Задачу без владельца сразу может забрать любой воркер
+            job = await upload_journal.create_job(msg, playlist_kind, force)
+            waiters.append(asyncio.ensure_future(_wait_remote(job, html.escape(_job_name(job)), progress)))
+            continue
+
+        job = await _create_local_job(msg, playlist_kind, force)
+        name = html.escape(_job_name(job))
+
+        done = loop.create_future()
+
+        async def run(job=job, name=name, done=done):
+            progress.started()
             try:
-                os.rmdir(file_dir)
-            except Exception:
-                pass
+                outcome = await _process_track(bot, job, token)
+                if outcome.duplicate:
+                    progress.add_duplicate(name)
+                else:
+                    uploaded = html.escape(f"{outcome.artist} - {outcome.title}")
+                    progress.add_uploaded(uploaded, warning=_finish_warning(outcome.finish))
+            except Exception as e:
+                logger.exception(f"Batch upload of '{name}' for user {tg_id} failed")
+                progress.add_failed(name, html.escape(str(e) or type(e).__name__))
+            finally:
+                if not done.done():
+                    done.set_result(None)
+
+        try:
+            await upload_scheduler.submit(tg_id, run)
+        except QueueFullError:
+            await upload_journal.mark_failed(job, "upload queue is full")
+            progress.add_failed(name, "очередь загрузок переполнена", was_running=False)
+            continue
+        waiters.append(done)
+
+    await asyncio.gather(*waiters)
+    await progress.close(_batch_summary_text(progress))
@@ -4,6 +4,8 @@ from aiogram.types import Message
 
 from src.database import crud
 from src.database.models import async_session
+from src.utils.auth_cache import token_status
+from src.utils.ttl_cache import MISSING
 
 
 class CheckTokenMiddleware(BaseMiddleware):
@@ -28,13 +30,15 @@ class CheckTokenMiddleware(BaseMiddleware):
                 return await handler(event, data)
 
         tg_id = user.id
-        has_token = False
 
-        async with async_session() as session:
-            db_user = await crud.get_user(session, tg_id)
-            
-            if db_user and db_user.token:
-                has_token = True
+        # В БД идём только при промахе кеша; «нет» не кешируется — /auth могли пройти
+        # на другой реплике (см. src/utils/auth_cache.py)
+        has_token = token_status.get(tg_id)
+        if has_token is MISSING:
+            async with async_session() as session:
+                has_token = await crud.has_token(session, tg_id)
+            if has_token:
+                token_status.set(tg_id, True)
 
         if has_token:
             return await handler(event, data)
@@ -0,0 +1,45 @@
+"""
+Кеши авторизации пользователей по tg_id.
+
+`token_status` — ответ «у пользователя есть токен» для CheckTokenMiddleware.
+Без кеша это запрос в БД на каждое сообщение, включая каждый файл в пачке
+из 100 треков. Кешируется только «да»: токен не удаляется, поэтому такой
+ответ не устаревает, а «нет» могло стать «да» на другой реплике, пока
+пользователь проходил /auth там.
+
+`tokens` — расшифрованные токены для `crud.get_token` и
+`crud.get_upload_context`: запись хранит и шифротекст из БД, и токен,
+и годится, только пока шифротекст в БД тот же. Сам шифротекст читается
+из БД при каждом обращении (один запрос по индексу), а AES+HMAC тратится
+только на новый токен. Так /auth на одной реплике сразу виден остальным
+и worker.py: Fernet даёт новый шифротекст при каждом сохранении. Срок
+жизни и размер кеша ограничены.
+
+Обе записи пользователя сбрасываются вместе (`invalidate_token_status`):
+при сохранении нового токена (`crud.set_token`) и при ошибке авторизации
+Яндекса. Вытесненный или сброшенный токен больше нигде в кеше не держится.
+
+Переменные окружения:
+    AUTH_CACHE_SIZE  — максимум пользователей в кеше проверки (по умолчанию 10000)
+    AUTH_CACHE_TTL   — время жизни записи проверки в секундах (по умолчанию 300)
+    TOKEN_CACHE_SIZE — максимум расшифрованных токенов в памяти (по умолчанию 1000)
+    TOKEN_CACHE_TTL  — время жизни расшифрованного токена в секундах (по умолчанию 600)
+"""
+import os
+
+from src.utils.ttl_cache import TTLCache
+
+CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "300"))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "1000"))
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", "600"))
+
+token_status: TTLCache[bool] = TTLCache(CACHE_SIZE, CACHE_TTL)
+# tg_id -> (шифротекст из БД, расшифрованный токен)
+tokens: TTLCache[tuple[str, str]] = TTLCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL)
+
+
+def invalidate_token_status(tg_id: int) -> None:
+    """Забывает всё, что известно о токене пользователя."""
+    token_status.invalidate(tg_id)
+    tokens.invalidate(tg_id)
@@ -0,0 +1,42 @@
+"""
+Фоновые задачи, запущенные из хендлеров.
+
+Хендлер апдейта должен отрабатывать быстро: долгую часть (ожидание пакета
+файлов, сбор итогов загрузки) он отдаёт сюда и сразу возвращается.
+Задачи держатся в наборе, чтобы их не собрал сборщик мусора, ошибки пишутся
+в лог, а при останове бота незавершённые задачи отменяются — загрузки
+из журнала продолжатся после рестарта (см. upload_journal.py).
+"""
+import asyncio
+import logging
+from typing import Coroutine
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundTasks:
+    def __init__(self):
+        self._tasks: set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    def spawn(self, coro: Coroutine, name: str | None = None) -> asyncio.Task:
+        task = asyncio.create_task(coro, name=name)
+        self._tasks.add(task)
+        task.add_done_callback(self._done)
+        return task
+
+    def _done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Background task {task.get_name()} failed", exc_info=task.exception())
+
+    async def stop(self) -> None:
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+background_tasks = BackgroundTasks()
@@ -0,0 +1,45 @@
+"""
+Создание Bot с настройками по умолчанию — общее для бота (main.py) и воркеров загрузок (worker.py).
+
+Переменные окружения:
+    TELEGRAM_API_URL — адрес локального Bot API сервера (если не задан — облачный API)
+"""
+import os
+import logging
+import pathlib
+
+from aiogram import Bot
+from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer, SimpleFilesPathWrapper
+from aiogram.enums import ParseMode
+
+logger = logging.getLogger(__name__)
+
+LOCAL_API_PATH = pathlib.Path("/var/lib/telegram-bot-api")
+
+
+def create_bot(token: str) -> Bot:
+    bot_kwargs = {
+        "token": token,
+        "default": DefaultBotProperties(
+            parse_mode=ParseMode.HTML,
+            link_preview_is_disabled=True
+        )
+    }
+
+    server_url = os.getenv("TELEGRAM_API_URL")
+    if server_url:
+        bot_kwargs["session"] = AiohttpSession(
+            api=TelegramAPIServer.from_base(
+                server_url,
+                is_local=True,
+                wrap_local_file=SimpleFilesPathWrapper(
+                    server_path=LOCAL_API_PATH,
+                    local_path=LOCAL_API_PATH
+                )
+            )
+        )
+        logger.info(f"Используется локальный сервер Telegram API: {server_url}")
+
+    return Bot(**bot_kwargs)
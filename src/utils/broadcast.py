@@ -0,0 +1,375 @@
+"""
+Рассылка сообщения всем пользователям.
+
+Получатели читаются из БД пачками по BROADCAST_CHUNK_SIZE (keyset по
+users.id), а не списком всех tg_id в памяти. Внутри пачки до
+BROADCAST_CONCURRENCY `copy_message` идут параллельно, общий темп задаёт
+`TokenBucket` — не больше BROADCAST_RATE сообщений в секунду.
+На `TelegramRetryAfter` ведро замолкает на указанное время и вдвое снижает
+темп, затем понемногу возвращает его к BROADCAST_RATE; сообщение
+отправляется повторно.
+
+Итог по каждому получателю пишется в `broadcast_deliveries` после каждой
+пачки, поэтому после рестарта рассылка продолжается с того, что не успела
+(повторно может уйти не больше одной пачки). Заблокировавшие бота
+помечаются в users.blocked_at и в следующие рассылки не попадают.
+
+Рассылку ведёт одна реплика — владелец (broadcasts.owner_id). Он продлевает
+аренду (heartbeat_at) перед каждой пачкой и раз в треть BROADCAST_LEASE.
+Каждая реплика раз в треть аренды забирает идущие рассылки без живого
+владельца: рассылки упавшей реплики продолжает другая, а стартующая реплика
+не запускает второй раз то, что ведут живые. Кнопка «Остановить» пишет
+статус в БД, и владелец останавливает рассылку, на какой бы реплике её
+ни нажали.
+
+Статус рассылки с живой скоростью отправки показывается админу одним
+сообщением (через ProgressReporter).
+
+Переменные окружения:
+    BROADCAST_RATE        — максимум сообщений в секунду (по умолчанию 25)
+    BROADCAST_CONCURRENCY — одновременных отправок (по умолчанию 10)
+    BROADCAST_CHUNK_SIZE  — получателей в пачке из БД (по умолчанию 100)
+    BROADCAST_LEASE       — через сколько секунд без продления рассылка считается брошенной (по умолчанию 60)
+"""
+import os
+import time
+import socket
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+from aiogram.types import InlineKeyboardMarkup, Message
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+from src.database import crud
+from src.database.models import (
+    async_session, Broadcast,
+    BROADCAST_DONE, BROADCAST_CANCELLED, DELIVERY_SENT, DELIVERY_FAILED, DELIVERY_BLOCKED,
+)
+from src.utils.progress import ProgressReporter
+
+logger = logging.getLogger(__name__)
+
+RATE = float(os.getenv("BROADCAST_RATE", "25"))
+CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "10"))
+CHUNK_SIZE = int(os.getenv("BROADCAST_CHUNK_SIZE", "100"))
+LEASE = float(os.getenv("BROADCAST_LEASE", "60"))
+
+# Сколько раз повторять сообщение одному получателю после flood-wait
+SEND_ATTEMPTS = 5
+# Минимальный темп после снижений и шаг восстановления: +1 сообщение/с за каждые N успешных
+MIN_RATE = 1.0
+RECOVERY_STEP = 50
+
+
+class TokenBucket:
+    """Ведро токенов: не больше rate операций в секунду, с паузой и снижением темпа на flood-wait."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated: Optional[float] = None
+        self._paused_until = 0.0
+        self._successes = 0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            while True:
+                now = loop.time()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def _refill(self, now: float) -> None:
+        if self._updated is not None:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def on_success(self) -> None:
+        self._successes += 1
+        if self.rate < self.max_rate and self._successes >= RECOVERY_STEP:
+            self._successes = 0
+            self.rate = min(self.max_rate, self.rate + 1)
+
+    def on_retry_after(self, seconds: float) -> None:
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        # Несколько параллельных отправок получают один и тот же flood-wait — темп снижаем один раз
+        if now >= self._paused_until:
+            self.rate = max(MIN_RATE, self.rate / 2)
+        self._paused_until = max(self._paused_until, now + seconds)
+        self._tokens = 0
+        self._updated = self._paused_until
+        self._successes = 0
+
+
+@dataclass
+class _Run:
+    broadcast: Broadcast
+    reporter: ProgressReporter
+    bucket: TokenBucket
+    done_markup: Optional[InlineKeyboardMarkup] = None
+    started: float = field(default_factory=time.monotonic)
+    sent_now: int = 0  # отправлено в этом запуске — для скорости
+    cancelled: bool = False
+    lost: bool = False  # аренду забрала другая реплика
+
+
+def stop_keyboard(broadcast_id: int) -> InlineKeyboardMarkup:
+    builder = InlineKeyboardBuilder()
+    builder.button(text="⏹ Остановить", callback_data=f"admin_broadcast_stop:{broadcast_id}")
+    return builder.as_markup()
+
+
+def _progress_text(run: _Run, title: str) -> str:
+    b = run.broadcast
+    done = b.sent + b.failed + b.blocked
+    elapsed = max(time.monotonic() - run.started, 1e-6)
+    return (
+        f"📢 <b>{title}</b> #{b.id}\n\n"
+        f"✅ Доставлено: {b.sent}\n"
+        f"❌ Не доставлено: {b.failed}\n"
+        f"🚫 Заблокировали бота: {b.blocked}\n"
+        f"⏳ Прогресс: {done}/{b.total}\n"
+        f"⚡ Скорость: {run.sent_now / elapsed:.1f} сообщ./с (лимит {run.bucket.rate:.0f}/с)"
+    )
+
+
+class BroadcastEngine:
+    def __init__(
+        self,
+        rate: float = RATE,
+        concurrency: int = CONCURRENCY,
+        chunk_size: int = CHUNK_SIZE,
+        lease: float = LEASE,
+    ):
+        self.rate = rate
+        self.concurrency = concurrency
+        self.chunk_size = chunk_size
+        self.lease = lease
+        self.owner_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._runs: dict[int, _Run] = {}
+        self._tasks: dict[int, asyncio.Task] = {}
+        self._bot: Optional[Bot] = None
+        self._done_markup: Optional[InlineKeyboardMarkup] = None
+        self._lease_task: Optional[asyncio.Task] = None
+        # Упавшие здесь рассылки этот процесс не подбирает — после аренды их возьмёт другая реплика
+        self._crashed: set[int] = set()
+
+    async def start(
+        self,
+        bot: Bot,
+        broadcast: Broadcast,
+        status_msg: Message,
+        done_markup: Optional[InlineKeyboardMarkup] = None,
+    ) -> None:
+        """
+        Запускает рассылку в фоне; статус пишется в status_msg, по окончании к нему ставится done_markup.
+
+        Рассылка должна быть за этой репликой (owner_id при создании или claim_broadcasts).
+        """
+        reporter = ProgressReporter(status_msg, parse_mode="HTML", reply_markup=stop_keyboard(broadcast.id))
+        run = _Run(broadcast=broadcast, reporter=reporter, bucket=TokenBucket(self.rate), done_markup=done_markup)
+        self._runs[broadcast.id] = run
+        self._tasks[broadcast.id] = asyncio.create_task(self._run(bot, run), name=f"broadcast-{broadcast.id}")
+
+    async def resume(self, bot: Bot, done_markup: Optional[InlineKeyboardMarkup] = None) -> None:
+        """Продолжает рассылки без живого владельца и дальше следит за арендой."""
+        self._bot, self._done_markup = bot, done_markup
+        await self._adopt()
+        if self._lease_task is None:
+            self._lease_task = asyncio.create_task(self._lease_loop(), name="broadcast-lease")
+
+    def cancel(self, broadcast_id: int) -> bool:
+        """Останавливает рассылку этой реплики после текущей пачки. False — здесь такой рассылки не идёт."""
+        run = self._runs.get(broadcast_id)
+        if run is None:
+            return False
+        run.cancelled = True
+        return True
+
+    async def stop(self) -> None:
+        """Останов бота: рассылки прерываются и отпускаются — их сразу продолжат другие реплики или этот бот при старте."""
+        if self._lease_task is not None:
+            self._lease_task.cancel()
+            await asyncio.gather(self._lease_task, return_exceptions=True)
+            self._lease_task = None
+        ids = list(self._tasks)
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if ids:
+            try:
+                async with async_session() as session:
+                    await crud.release_broadcasts(session, self.owner_id, ids)
+            except Exception:
+                logger.exception(f"Failed to release broadcasts {ids}")
+
+    def stats(self) -> dict:
+        """Идущие рассылки и их скорость — для админки."""
+        return {
+            broadcast_id: {
+                "done": run.broadcast.sent + run.broadcast.failed + run.broadcast.blocked,
+                "total": run.broadcast.total,
+                "rate": run.bucket.rate,
+                "throughput": run.sent_now / max(time.monotonic() - run.started, 1e-6),
+            }
+            for broadcast_id, run in self._runs.items()
+        }
+
+    async def _adopt(self) -> None:
+        async with async_session() as session:
+            broadcasts = await crud.claim_broadcasts(
+                session, self.owner_id, self.lease, [*self._tasks, *self._crashed]
+            )
+        for broadcast in broadcasts:
+            try:
+                status_msg = await self._bot.send_message(
+                    broadcast.admin_chat_id,
+                    f"♻️ Бот перезапускался, продолжаю рассылку #{broadcast.id}...",
+                )
+            except Exception as e:
+                # Рассылка остаётся за нами и без статуса не запускается — попробуем на следующем круге
+                logger.warning(f"Cannot notify admin about broadcast {broadcast.id}: {e}")
+                continue
+            logger.info(f"Resuming broadcast {broadcast.id}")
+            await self.start(self._bot, broadcast, status_msg, self._done_markup)
+
+    async def _heartbeat(self, broadcast_ids: list[int]) -> None:
+        """Продлевает аренду и переносит в запуски остановку из БД и потерю аренды."""
+        async with async_session() as session:
+            statuses = await crud.heartbeat_broadcasts(session, self.owner_id, broadcast_ids)
+        for broadcast_id in broadcast_ids:
+            run = self._runs.get(broadcast_id)
+            if run is None:
+                continue
+            status = statuses.get(broadcast_id)
+            if status is None:
+                run.lost = True
+            elif status == BROADCAST_CANCELLED:
+                run.cancelled = True
+
+    async def _lease_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                # Пачка может идти дольше аренды (flood-wait) — продлеваем и между пачками
+                if self._runs:
+                    await self._heartbeat(list(self._runs))
+                await self._adopt()
+            except Exception:
+                logger.exception("Broadcast lease loop failed")
+
+    async def _run(self, bot: Bot, run: _Run) -> None:
+        broadcast = run.broadcast
+        try:
+            after_user_id = 0
+            while True:
+                await self._heartbeat([broadcast.id])
+                if run.cancelled or run.lost:
+                    break
+                async with async_session() as session:
+                    recipients = await crud.get_broadcast_recipients(
+                        session, broadcast.id, after_user_id, self.chunk_size
+                    )
+                if not recipients:
+                    break
+                await self._send_chunk(bot, run, recipients)
+                after_user_id = recipients[-1][0]
+
+            if run.lost:
+                # Продолжает новый владелец, итог он и покажет
+                logger.warning(f"Broadcast {broadcast.id} was taken over by another replica")
+                await run.reporter.close(_progress_text(run, "Рассылку продолжает другая реплика"))
+                return
+
+            status = BROADCAST_CANCELLED if run.cancelled else BROADCAST_DONE
+            async with async_session() as session:
+                await crud.finish_broadcast(session, broadcast.id, self.owner_id, status)
+            title = "Рассылка остановлена" if run.cancelled else "Рассылка завершена!"
+            await run.reporter.close(_progress_text(run, title), reply_markup=run.done_markup)
+            logger.info(
+                f"Broadcast {broadcast.id} {status}: sent={broadcast.sent} "
+                f"failed={broadcast.failed} blocked={broadcast.blocked}"
+            )
+        except asyncio.CancelledError:
+            await run.reporter.close()
+            raise
+        except Exception:
+            self._crashed.add(broadcast.id)
+            logger.exception(f"Broadcast {broadcast.id} crashed, another replica or a restart will resume it")
+            await run.reporter.close(_progress_text(run, "Рассылка прервана ошибкой"), reply_markup=run.done_markup)
+        finally:
+            self._runs.pop(broadcast.id, None)
+            self._tasks.pop(broadcast.id, None)
+
+    async def _send_chunk(self, bot: Bot, run: _Run, recipients: list[tuple[int, int]]) -> None:
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results: list[tuple[int, str, Optional[str]]] = []
+
+        async def deliver(user_id: int, tg_id: int) -> None:
+            async with semaphore:
+                status, error = await self._send(bot, run, tg_id)
+            results.append((user_id, status, error))
+            if status == DELIVERY_SENT:
+                run.broadcast.sent += 1
+                run.sent_now += 1
+            elif status == DELIVERY_BLOCKED:
+                run.broadcast.blocked += 1
+            else:
+                run.broadcast.failed += 1
+            run.reporter.update(_progress_text(run, "Рассылка..."))
+
+        try:
+            await asyncio.gather(*(deliver(user_id, tg_id) for user_id, tg_id in recipients))
+        finally:
+            # Записываем и то, что успело уйти до отмены — иначе после рестарта уйдёт повторно
+            async with async_session() as session:
+                totals = await crud.record_broadcast_deliveries(session, run.broadcast.id, results)
+            # Счётчики в памяти могли посчитать пачку, которую уже отправил прежний владелец
+            if totals is not None:
+                run.broadcast.sent, run.broadcast.failed, run.broadcast.blocked = totals
+
+    async def _send(self, bot: Bot, run: _Run, tg_id: int) -> tuple[str, Optional[str]]:
+        broadcast = run.broadcast
+        for _ in range(SEND_ATTEMPTS):
+            await run.bucket.acquire()
+            try:
+                await bot.copy_message(
+                    chat_id=tg_id,
+                    from_chat_id=broadcast.src_chat_id,
+                    message_id=broadcast.src_message_id,
+                )
+            except TelegramRetryAfter as e:
+                logger.warning(f"Broadcast {broadcast.id}: flood-wait {e.retry_after}s")
+                run.bucket.on_retry_after(e.retry_after)
+                continue
+            except TelegramForbiddenError as e:
+                return DELIVERY_BLOCKED, str(e)[:500]
+            except TelegramBadRequest as e:
+                # Чат удалён или пользователь никогда не писал боту — больше не пытаемся
+                if "chat not found" in str(e).lower():
+                    return DELIVERY_BLOCKED, str(e)[:500]
+                return DELIVERY_FAILED, str(e)[:500]
+            except Exception as e:
+                logger.warning(f"Broadcast {broadcast.id} failed for {tg_id}: {e}")
+                return DELIVERY_FAILED, str(e)[:500]
+            run.bucket.on_success()
+            return DELIVERY_SENT, None
+        return DELIVERY_FAILED, "flood-wait retries exhausted"
+
+
+broadcast_engine = BroadcastEngine()
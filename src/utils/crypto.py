@@ -2,14 +2,21 @@
 Утилиты для шифрования/дешифрования чувствительных данных (токены пользователей).
 
 Использует симметричное шифрование Fernet (AES-128-CBC + HMAC-SHA256).
+Ключи разбираются один раз за процесс (`MultiFernet`).
+
+Ротация ключа: новый ключ ставится первым через запятую, старые остаются
+после него. Шифруется всегда первым ключом, расшифровываются записи любым
+из перечисленных; старый ключ можно убрать, когда все пользователи
+переавторизуются.
 
 Переменные окружения:
-    ENCRYPTION_KEY — Fernet-ключ, сгенерированный командой:
+    ENCRYPTION_KEY — Fernet-ключ (или несколько через запятую, текущий первым), сгенерированный командой:
                      python3 -c "from cryptography.fernet import Fernet; print(Fernet.generate_key().decode())"
 """
 import os
 import logging
-from cryptography.fernet import Fernet, InvalidToken
+from functools import lru_cache
+from cryptography.fernet import Fernet, MultiFernet, InvalidToken
 
 logger = logging.getLogger(__name__)
 
@@ -17,15 +24,16 @@ logger = logging.getLogger(__name__)
 _FERNET_PREFIX = "gAAAAA"
 
 
-def _get_fernet() -> Fernet:
-    """Возвращает инициализированный Fernet из переменной окружения."""
-    key = os.getenv("ENCRYPTION_KEY")
-    if not key:
+@lru_cache(maxsize=1)
+def _get_fernet() -> MultiFernet:
+    """Возвращает MultiFernet по ключам из переменной окружения (создаётся один раз)."""
+    keys = [key.strip() for key in os.getenv("ENCRYPTION_KEY", "").split(",") if key.strip()]
+    if not keys:
         raise RuntimeError(
             "ENCRYPTION_KEY не задан в переменных окружения. "
             "Сгенерируйте ключ: python3 -c \"from cryptography.fernet import Fernet; print(Fernet.generate_key().decode())\""
         )
-    return Fernet(key.encode())
+    return MultiFernet([Fernet(key.encode()) for key in keys])
 
 
 def encrypt_token(token: str) -> str:
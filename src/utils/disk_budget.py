@@ -0,0 +1,162 @@
+"""
+Бюджет диска для `downloads/`.
+
+Перед скачиванием задача резервирует место по `file_size` из Telegram.
+Резерв выдаётся, только если после него:
+    * сумма всех резервов не превысит DOWNLOAD_QUOTA;
+    * занятая доля файловой системы (вместе с ещё не докачанными резервами)
+      не поднимется выше DOWNLOAD_DISK_HIGH_WATER.
+Иначе задача ждёт, пока другие освободят место, а если не дождалась за
+DOWNLOAD_DISK_WAIT секунд или файл не влезет никогда — получает `DiskBudgetError`.
+
+После скачивания резерв пересчитывается по реальному расходу: жёсткая ссылка
+на файл Bot API сервера и чтение на месте место не занимают. Резерв живёт,
+пока файлы задачи не удалены (см. upload_journal.remove_job_files).
+
+Переменные окружения:
+    DOWNLOAD_QUOTA           — максимум байт под загрузки одновременно (по умолчанию 10 ГБ, 0 — без лимита)
+    DOWNLOAD_DISK_HIGH_WATER — максимальная занятая доля диска, 0..1 (по умолчанию 0.9)
+    DOWNLOAD_DISK_WAIT       — сколько секунд ждать места перед отказом (по умолчанию 600)
+"""
+import os
+import shutil
+import asyncio
+import logging
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+DOWNLOAD_DIR = "downloads"
+
+QUOTA = int(os.getenv("DOWNLOAD_QUOTA", str(10 * 1024 ** 3)))
+HIGH_WATER = float(os.getenv("DOWNLOAD_DISK_HIGH_WATER", "0.9"))
+WAIT_TIMEOUT = float(os.getenv("DOWNLOAD_DISK_WAIT", "600"))
+
+# Как часто перепроверять диск во время ожидания: место могут освободить и не мы
+RECHECK_INTERVAL = 5.0
+
+
+class DiskBudgetError(Exception):
+    """Места под файл нет и не появится (или не появилось за отведённое время)."""
+
+
+@dataclass
+class _Reservation:
+    size: int
+    landed: bool = False  # файл уже на диске и учтён в disk_usage
+
+
+class DiskBudget:
+    def __init__(self, path: str, quota: int = QUOTA, high_water: float = HIGH_WATER, wait_timeout: float = WAIT_TIMEOUT):
+        self.path = path
+        self.quota = quota
+        self.high_water = high_water
+        self.wait_timeout = wait_timeout
+        self._reservations: dict[int, _Reservation] = {}
+        self._cond: asyncio.Condition | None = None
+
+    @property
+    def reserved(self) -> int:
+        return sum(r.size for r in self._reservations.values())
+
+    @property
+    def pending(self) -> int:
+        """Зарезервировано, но ещё не записано на диск."""
+        return sum(r.size for r in self._reservations.values() if not r.landed)
+
+    def waiting_needed(self, size: int) -> bool:
+        """True, если резерв под size сейчас придётся ждать."""
+        return not self._fits(size)
+
+    def _disk_usage(self):
+        os.makedirs(self.path, exist_ok=True)
+        return shutil.disk_usage(self.path)
+
+    def _fits(self, size: int) -> bool:
+        if self.quota and self.reserved + size > self.quota:
+            return False
+        usage = self._disk_usage()
+        return usage.used + self.pending + size <= usage.total * self.high_water
+
+    def _ever_fits(self, size: int) -> bool:
+        """Влезет ли файл, если все остальные резервы освободятся."""
+        if self.quota and size > self.quota:
+            return False
+        usage = self._disk_usage()
+        ours = sum(r.size for r in self._reservations.values() if r.landed)
+        return usage.used - ours + size <= usage.total * self.high_water
+
+    def check(self, size: int) -> None:
+        """Быстрый отказ до постановки в очередь, если файл не влезет никогда."""
+        if not self._ever_fits(size):
+            raise DiskBudgetError(f"File of {size} bytes exceeds the download disk budget")
+
+    async def reserve(self, job_id: int, size: int) -> None:
+        """
+        Резервирует size байт под задачу, при нехватке места ждёт освобождения.
+
+        Raises:
+            DiskBudgetError: файл не влезет никогда или место не освободилось за wait_timeout.
+        """
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        self.check(size)
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.wait_timeout
+        async with self._cond:
+            while not self._fits(size):
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise DiskBudgetError(f"No disk space for {size} bytes after {self.wait_timeout:.0f}s")
+                try:
+                    await asyncio.wait_for(self._cond.wait(), min(remaining, RECHECK_INTERVAL))
+                except asyncio.TimeoutError:
+                    pass
+            self._reservations[job_id] = _Reservation(size)
+
+    async def adopt(self, job_id: int, path: str) -> None:
+        """Учитывает файл, оставшийся на диске с прошлого запуска (продолжаемая задача)."""
+        self._reservations[job_id] = _Reservation(0)
+        await self.settle(job_id, path)
+
+    async def settle(self, job_id: int, path: str) -> None:
+        """Файл скачан: резерв заменяется реальным расходом места."""
+        reservation = self._reservations.get(job_id)
+        if reservation is None:
+            return
+        try:
+            stat = await asyncio.to_thread(os.stat, path)
+        except OSError:
+            stat = None
+        inside = os.path.abspath(path).startswith(os.path.abspath(self.path) + os.sep)
+        # Жёсткая ссылка и чтение файла сервера на месте новое место не занимают
+        reservation.size = stat.st_size if stat and inside and stat.st_nlink == 1 else 0
+        reservation.landed = True
+        await self._notify()
+
+    async def release(self, job_id: int) -> None:
+        if self._reservations.pop(job_id, None) is not None:
+            await self._notify()
+
+    async def _notify(self) -> None:
+        if self._cond is None:
+            return
+        async with self._cond:
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        """Текущее состояние бюджета — для мониторинга и админки."""
+        usage = self._disk_usage()
+        return {
+            "reservations": len(self._reservations),
+            "reserved": self.reserved,
+            "pending": self.pending,
+            "quota": self.quota,
+            "disk_total": usage.total,
+            "disk_free": usage.free,
+            "high_water": self.high_water,
+        }
+
+
+disk_budget = DiskBudget(DOWNLOAD_DIR)
@@ -0,0 +1,24 @@
+"""
+Отпечаток содержимого трека (SHA-256) для поиска повторных загрузок.
+
+Хеш считается потоково — по тем же кускам, что пишутся на диск или уходят
+в Яндекс, поэтому отдельного прохода по файлу обычно не требуется.
+"""
+import hashlib
+
+import aiofiles
+
+from src.utils.streaming import CHUNK_SIZE
+
+
+def new_hasher():
+    return hashlib.sha256()
+
+
+async def hash_file(path: str, chunk_size: int = CHUNK_SIZE) -> str:
+    """SHA-256 файла, читаемого кусками через aiofiles."""
+    hasher = new_hasher()
+    async with aiofiles.open(path, "rb") as f:
+        while chunk := await f.read(chunk_size):
+            hasher.update(chunk)
+    return hasher.hexdigest()
@@ -0,0 +1,259 @@
+"""
+Хранилище FSM aiogram, выбираемое настройкой.
+
+С MemoryStorage состояние (режим загрузки, шаги рассылки) живёт в одном
+процессе: вторую реплику не запустить, а рестарт выкидывает всех из режима
+загрузки. Поэтому есть два внешних хранилища:
+
+    * postgres — таблица fsm_states через общий async_session;
+    * redis    — любой сервер с протоколом Redis (RESP): Redis, KeyDB, Valkey
+                 и т.п. Клиент встроенный, без лишних зависимостей.
+
+У каждой записи есть срок жизни FSM_STATE_TTL: любое изменение его
+продлевает, истёкшая запись читается как пустая. В postgres истёкшие строки
+удаляются при старте, в redis ключи истекают сами (SET ... EX).
+
+Токен Яндекса в данных FSM не хранится — хендлеры берут его через
+crud.get_token (с кешем расшифрованных токенов).
+
+Переменные окружения:
+    FSM_STORAGE   — memory | postgres | redis (по умолчанию memory)
+    FSM_REDIS_URL — адрес для redis: redis://[:пароль@]хост:порт/номер_базы (по умолчанию redis://localhost:6379/0)
+    FSM_STATE_TTL — время жизни состояния в секундах (по умолчанию 604800 — неделя)
+"""
+import os
+import json
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Mapping, Optional
+from urllib.parse import urlparse
+
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from src.database import crud
+from src.database.models import async_session
+
+logger = logging.getLogger(__name__)
+
+STORAGE = os.getenv("FSM_STORAGE", "memory").lower()
+REDIS_URL = os.getenv("FSM_REDIS_URL", "redis://localhost:6379/0")
+STATE_TTL = int(os.getenv("FSM_STATE_TTL", str(7 * 24 * 3600)))
+
+
+def _state_name(state: StateType) -> Optional[str]:
+    return state.state if isinstance(state, State) else state
+
+
+def _check_data(data: Mapping[str, Any]) -> dict[str, Any]:
+    if not isinstance(data, dict):
+        raise DataNotDictLikeError(f"Data must be a dict or dict-like object, got {type(data).__name__}")
+    return data
+
+
+class PostgresStorage(BaseStorage):
+    """FSM в таблице fsm_states: одна строка на ключ, состояние и данные вместе."""
+
+    def __init__(self, ttl: int = STATE_TTL):
+        self.ttl = ttl
+        self.key_builder = DefaultKeyBuilder(with_destiny=True)
+
+    def _key(self, key: StorageKey) -> str:
+        return self.key_builder.build(key)
+
+    def _expires_at(self) -> datetime:
+        return datetime.now(timezone.utc) + timedelta(seconds=self.ttl)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        async with async_session() as session:
+            await crud.set_fsm_state(session, self._key(key), _state_name(state), self._expires_at())
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        async with async_session() as session:
+            record = await crud.get_fsm_record(session, self._key(key))
+        return record.state if record else None
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        data = _check_data(data)
+        async with async_session() as session:
+            await crud.set_fsm_data(session, self._key(key), dict(data), self._expires_at())
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        async with async_session() as session:
+            record = await crud.get_fsm_record(session, self._key(key))
+        return dict(record.data) if record else {}
+
+    async def purge_expired(self) -> int:
+        async with async_session() as session:
+            return await crud.delete_expired_fsm_records(session)
+
+    async def close(self) -> None:
+        pass
+
+
+class RespError(Exception):
+    """Сервер ответил ошибкой (-ERR ...)."""
+
+
+class RespClient:
+    """
+    Минимальный клиент протокола Redis (RESP2) на asyncio.
+
+    Одно соединение, команды идут по очереди под замком; при обрыве
+    соединение переоткрывается и команда повторяется один раз. Если команду
+    прервали (отмена, таймаут) посреди обмена, соединение закрывается:
+    непрочитанный ответ иначе достался бы следующей команде.
+    """
+
+    def __init__(self, url: str):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.username = parsed.username or None
+        self.password = parsed.password or None
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._lock = asyncio.Lock()
+
+    async def _connect(self) -> None:
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            if self.password:
+                auth = ("AUTH", self.username, self.password) if self.username else ("AUTH", self.password)
+                await self._roundtrip(*auth)
+            if self.db:
+                await self._roundtrip("SELECT", self.db)
+        except BaseException:
+            # Без AUTH/SELECT соединение не годится — не оставляем его для следующих команд
+            self._abort()
+            raise
+
+    @staticmethod
+    def _encode(args: tuple) -> bytes:
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            value = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(value), value))
+        return b"".join(parts)
+
+    async def _read_reply(self) -> Any:
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError("RESP server closed the connection")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode()
+        if kind == b"-":
+            raise RespError(payload.decode())
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            size = int(payload)
+            if size < 0:
+                return None
+            return (await self._reader.readexactly(size + 2))[:-2]
+        if kind == b"*":
+            size = int(payload)
+            if size < 0:
+                return None
+            return [await self._read_reply() for _ in range(size)]
+        raise RespError(f"Unexpected RESP reply: {line!r}")
+
+    async def _roundtrip(self, *args) -> Any:
+        self._writer.write(self._encode(args))
+        await self._writer.drain()
+        return await self._read_reply()
+
+    async def execute(self, *args) -> Any:
+        async with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._writer is None:
+                        await self._connect()
+                    return await self._roundtrip(*args)
+                except (ConnectionError, asyncio.IncompleteReadError, OSError):
+                    await self._drop()
+                    if attempt:
+                        raise
+                except RespError:
+                    # Ответ-ошибка прочитан целиком — соединение в порядке
+                    raise
+                except BaseException:
+                    self._abort()
+                    raise
+
+    def _abort(self) -> None:
+        """Закрывает соединение без ожидания — можно звать и из отменённой задачи."""
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def _drop(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+        self._reader = self._writer = None
+
+    async def close(self) -> None:
+        async with self._lock:
+            await self._drop()
+
+
+class RespStorage(BaseStorage):
+    """FSM в Redis-совместимом хранилище: ключи fsm:...:state и fsm:...:data с TTL."""
+
+    def __init__(self, client: RespClient, ttl: int = STATE_TTL):
+        self.client = client
+        self.ttl = ttl
+        self.key_builder = DefaultKeyBuilder(with_destiny=True)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        redis_key = self.key_builder.build(key, "state")
+        state = _state_name(state)
+        if state is None:
+            await self.client.execute("DEL", redis_key)
+        else:
+            await self.client.execute("SET", redis_key, state, "EX", self.ttl)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        value = await self.client.execute("GET", self.key_builder.build(key, "state"))
+        return value.decode() if value is not None else None
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        redis_key = self.key_builder.build(key, "data")
+        data = _check_data(data)
+        if not data:
+            await self.client.execute("DEL", redis_key)
+        else:
+            await self.client.execute("SET", redis_key, json.dumps(data), "EX", self.ttl)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        value = await self.client.execute("GET", self.key_builder.build(key, "data"))
+        return json.loads(value) if value is not None else {}
+
+    async def close(self) -> None:
+        await self.client.close()
+
+
+async def create_storage(kind: str = STORAGE) -> BaseStorage:
+    """Хранилище FSM по настройке FSM_STORAGE."""
+    if kind == "postgres":
+        storage = PostgresStorage()
+        purged = await storage.purge_expired()
+        if purged:
+            logger.info(f"Purged {purged} expired FSM records")
+        return storage
+    if kind == "redis":
+        client = RespClient(REDIS_URL)
+        await client.execute("PING")
+        return RespStorage(client)
+    if kind != "memory":
+        logger.warning(f"Unknown FSM_STORAGE={kind!r}, falling back to memory")
+    return MemoryStorage()
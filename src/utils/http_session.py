@@ -0,0 +1,85 @@
+"""
+Общий пул HTTP-соединений для запросов к Яндексу (API, загрузка, OAuth).
+
+Одна долгоживущая `aiohttp.ClientSession` с keep-alive, лимитами на хост
+и кешем DNS: соединения с `api.music.yandex.net` и хостом загрузки
+переиспользуются между треками вместо нового TCP+TLS рукопожатия.
+Создаётся в `main.py` при старте и закрывается при остановке.
+
+Переменные окружения:
+    HTTP_POOL_LIMIT          — всего соединений в пуле (по умолчанию 100)
+    HTTP_POOL_LIMIT_PER_HOST — соединений на один хост (по умолчанию 20)
+    HTTP_KEEPALIVE_TIMEOUT   — сколько секунд держать простаивающее соединение (по умолчанию 30)
+    HTTP_DNS_CACHE_TTL       — время жизни кеша DNS в секундах (по умолчанию 300)
+"""
+import os
+import logging
+import aiohttp
+from yandex_music.utils.request_async import Request
+
+logger = logging.getLogger(__name__)
+
+POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", "100"))
+POOL_LIMIT_PER_HOST = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", "20"))
+KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "30"))
+DNS_CACHE_TTL = int(os.getenv("HTTP_DNS_CACHE_TTL", "300"))
+
+_session: aiohttp.ClientSession | None = None
+
+
+def _create_session() -> aiohttp.ClientSession:
+    connector = aiohttp.TCPConnector(
+        limit=POOL_LIMIT,
+        limit_per_host=POOL_LIMIT_PER_HOST,
+        keepalive_timeout=KEEPALIVE_TIMEOUT,
+        ttl_dns_cache=DNS_CACHE_TTL,
+        use_dns_cache=True,
+    )
+    return aiohttp.ClientSession(connector=connector)
+
+
+async def init_http_session() -> aiohttp.ClientSession:
+    """Создаёт общую сессию (вызывается один раз при старте бота)."""
+    global _session
+    if _session is None or _session.closed:
+        _session = _create_session()
+        logger.info(
+            f"HTTP pool started (limit={POOL_LIMIT}, per_host={POOL_LIMIT_PER_HOST}, "
+            f"keepalive={KEEPALIVE_TIMEOUT}s, dns_ttl={DNS_CACHE_TTL}s)"
+        )
+    return _session
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    """
+    Возвращает общую сессию.
+
+    Если бот запущен без `init_http_session()` (скрипты, отладка),
+    сессия создаётся лениво — вызывать нужно внутри работающего event loop.
+    """
+    global _session
+    if _session is None or _session.closed:
+        _session = _create_session()
+    return _session
+
+
+async def close_http_session() -> None:
+    """Закрывает общую сессию и все соединения пула."""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+class PooledRequest(Request):
+    """
+    `Request` библиотеки yandex_music, работающий через общий пул соединений.
+
+    Библиотека на каждый запрос вызывает `aiohttp.request()`, который создаёт
+    коннектор с `force_close=True`. Передаём ему наш коннектор — временная
+    сессия не владеет им и не закрывает соединения.
+    """
+
+    async def _request_wrapper(self, *args, **kwargs):
+        kwargs.setdefault("connector", get_http_session().connector)
+        return await super()._request_wrapper(*args, **kwargs)
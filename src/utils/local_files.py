@@ -0,0 +1,117 @@
+"""
+Получение файла от Telegram без лишнего копирования.
+
+С локальным Bot API сервером (`TELEGRAM_API_URL`) файл уже лежит на диске
+в `/var/lib/telegram-bot-api`, и `bot.download` лишь копирует его в `downloads/`.
+Вместо этого:
+    1. делаем жёсткую ссылку в `downloads/` — ноль копирования, а файл
+       переживёт чистку на стороне сервера, пока мы его не удалим;
+    2. если ссылка невозможна (другая ФС, например отдельный docker volume) —
+       читаем файл прямо с пути сервера, ничего не удаляя;
+    3. если файл сервера недоступен локально — обычное скачивание.
+При скачивании попутно считается SHA-256 содержимого для поиска дубликатов
+(см. fingerprint.py). Файл локального сервера ради отпечатка заново не
+читается, если не попросить need_hash: хеш посчитается при отправке в Яндекс
+(AsyncFilePayload), а повторы до загрузки ловятся по file_unique_id.
+"""
+import os
+import asyncio
+import logging
+from dataclasses import dataclass
+
+import aiofiles
+from aiogram import Bot
+
+from src.utils.fingerprint import new_hasher, hash_file
+from src.utils.progress import ProgressCallback
+from src.utils.streaming import CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Таймаут скачивания из облачного Bot API (файлы там не больше 20 МБ)
+DOWNLOAD_TIMEOUT = 300
+
+
+@dataclass
+class FetchedAudio:
+    path: str
+    owned: bool  # False — это файл Bot API сервера, удалять его нельзя
+    content_hash: str | None  # None — не считали, см. need_hash
+
+
+def _local_server_path(bot: Bot, file_path: str | None) -> str | None:
+    """Путь к файлу на локальном Bot API сервере, если он виден из бота."""
+    api = bot.session.api
+    if not api.is_local or not file_path:
+        return None
+
+    try:
+        path = str(api.wrap_local_file.to_local(file_path))
+    except ValueError:
+        return None
+
+    if not os.access(path, os.R_OK):
+        return None
+    return path
+
+
+async def _download_with_hash(
+    bot: Bot,
+    file_path: str,
+    destination: str,
+    size: int = 0,
+    on_progress: ProgressCallback | None = None,
+) -> str:
+    """Скачивает файл из Telegram, считая SHA-256 по ходу записи."""
+    hasher = new_hasher()
+    received = 0
+    url = bot.session.api.file_url(bot.token, file_path)
+    stream = bot.session.stream_content(url=url, timeout=DOWNLOAD_TIMEOUT, chunk_size=CHUNK_SIZE, raise_for_status=True)
+    async with aiofiles.open(destination, "wb") as f:
+        async for chunk in stream:
+            hasher.update(chunk)
+            await f.write(chunk)
+            received += len(chunk)
+            if on_progress is not None:
+                on_progress(received, size)
+    return hasher.hexdigest()
+
+
+async def fetch_audio(
+    bot: Bot,
+    file_id: str,
+    destination: str,
+    file_size: int | None = None,
+    on_progress: ProgressCallback | None = None,
+    need_hash: bool = False,
+) -> FetchedAudio:
+    """
+    Делает файл из Telegram доступным локально.
+    Отпечаток считается при скачивании (это бесплатно), а для файла локального
+    сервера — только с need_hash (лишний полный проход по файлу).
+    on_progress вызывается только при настоящем скачивании из облачного Bot API.
+    """
+    file = await bot.get_file(file_id)
+    server_path = await asyncio.to_thread(_local_server_path, bot, file.file_path)
+
+    if server_path:
+        try:
+            await asyncio.to_thread(os.link, server_path, destination)
+            path, owned = destination, True
+        except FileExistsError:
+            await asyncio.to_thread(os.remove, destination)
+            await asyncio.to_thread(os.link, server_path, destination)
+            path, owned = destination, True
+        except OSError as e:
+            logger.info(f"Hard link to Bot API file failed ({e}), reading it in place")
+            path, owned = server_path, False
+        return FetchedAudio(path, owned, await hash_file(path) if need_hash else None)
+
+    if bot.session.api.is_local:
+        await bot.download_file(file.file_path, destination=destination)
+        return FetchedAudio(destination, True, await hash_file(destination) if need_hash else None)
+
+    content_hash = await _download_with_hash(
+        bot, file.file_path, destination, size=file.file_size or file_size or 0, on_progress=on_progress
+    )
+    return FetchedAudio(destination, True, content_hash)
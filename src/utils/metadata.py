@@ -1,30 +1,71 @@
+import io
 import os
+from dataclasses import dataclass
 from typing import Optional, Tuple
-from mutagen.mp3 import MP3
 from mutagen.id3 import ID3, APIC
 
-def extract_metadata(file_path: str, default_artist: str = "Unknown Artist", default_title: Optional[str] = None) -> Tuple[str, str, Optional[str]]:
+
+@dataclass
+class CoverImage:
+    """Обложка из APIC-фрейма, целиком в памяти."""
+    data: bytes
+    mime: str = "image/jpeg"
+
+
+def _read_tags(
+    tags: Optional[ID3],
+    default_artist: str,
+    default_title: str,
+) -> Tuple[str, str, Optional[CoverImage]]:
+    if not tags:
+        return default_artist, default_title, None
+
+    title = str(tags.get("TIT2", default_title))
+    artist = str(tags.get("TPE1", default_artist))
+
+    cover = None
+    for tag in tags.values():
+        if isinstance(tag, APIC):
+            cover = CoverImage(data=tag.data, mime=tag.mime or "image/jpeg")
+            break
+
+    return artist, title, cover
+
+
+def extract_metadata(
+    file_path: str,
+    default_artist: str = "Unknown Artist",
+    default_title: Optional[str] = None,
+) -> Tuple[str, str, Optional[CoverImage]]:
     """
-    Возвращает: (artist, title, path_to_cover_image)
+    Возвращает: (artist, title, cover)
     Если тегов нет, возвращает переданные дефолты или имя файла.
-    Если обложки нет, path_to_cover_image будет None.
+    Если обложки нет, cover будет None.
+
+    Читается только область ID3v2-тега в начале файла (и ID3v1 в конце, если
+    v2 нет) — MPEG-фреймы не сканируются, обложка не пишется на диск.
     """
+    default_title = default_title or os.path.basename(file_path)
     try:
-        audio = MP3(file_path, ID3=ID3)
+        tags = ID3(file_path)
     except Exception:
-        return default_artist, default_title or os.path.basename(file_path), None
-
-    title = str(audio.get("TIT2", default_title or os.path.basename(file_path)))
-    artist = str(audio.get("TPE1", default_artist))
-
-    cover_path = None
-    if audio.tags:
-        for tag in audio.tags.values():
-            if isinstance(tag, APIC):
-                cover_filename = file_path + ".jpg"
-                with open(cover_filename, "wb") as img:
-                    img.write(tag.data)
-                cover_path = cover_filename
-                break
-
-    return artist, title, cover_path
+        return default_artist, default_title, None
+
+    return _read_tags(tags, default_artist, default_title)
+
+
+def extract_metadata_from_header(
+    header: bytes,
+    default_artist: str = "Unknown Artist",
+    default_title: str = "track.mp3",
+) -> Tuple[str, str, Optional[CoverImage]]:
+    """
+    То же, что extract_metadata, но по первым байтам файла (ID3v2-тегу),
+    когда самого файла на диске нет (потоковый режим).
+    """
+    try:
+        tags = ID3(io.BytesIO(header), load_v1=False)
+    except Exception:
+        return default_artist, default_title, None
+
+    return _read_tags(tags, default_artist, default_title)
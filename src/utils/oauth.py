@@ -9,10 +9,12 @@ OAuth 2.0 Device Flow для Yandex Music.
     YANDEX_CLIENT_SECRET — Client Secret приложения Yandex OAuth
 """
 import os
-import aiohttp
 import asyncio
 import logging
 
+from src.utils.http_session import get_http_session
+from src.utils.retry_policy import ENDPOINT_OAUTH, RETRYABLE_STATUSES, RetryableError, endpoint
+
 logger = logging.getLogger(__name__)
 
 # Загружаем из переменных окружения; значения по умолчанию — публичные
@@ -38,16 +40,21 @@ async def request_device_code() -> dict:
             'interval': int
         }
     """
-    async with aiohttp.ClientSession() as session:
-        data = {
-            'client_id': CLIENT_ID,
-        }
+    session = get_http_session()
+    data = {
+        'client_id': CLIENT_ID,
+    }
+
+    async def request() -> dict:
         async with session.post(DEVICE_CODE_URL, data=data) as resp:
             if resp.status != 200:
                 text = await resp.text()
-                raise Exception(f"Failed to get device code: {text}")
+                error = RetryableError if resp.status in RETRYABLE_STATUSES else Exception
+                raise error(f"Failed to get device code: {text}")
             return await resp.json()
 
+    return await endpoint(ENDPOINT_OAUTH).call(request)
+
 
 async def poll_for_token(device_code: str, interval: int = 5, timeout: int = 300) -> str | None:
     """
@@ -61,41 +68,51 @@ async def poll_for_token(device_code: str, interval: int = 5, timeout: int = 300
     Returns:
         str: access_token при успехе, None при таймауте
     """
-    async with aiohttp.ClientSession() as session:
-        elapsed = 0
-        
-        while elapsed < timeout:
-            data = {
-                'grant_type': 'device_code',
-                'code': device_code,
-                'client_id': CLIENT_ID,
-                'client_secret': CLIENT_SECRET,
-            }
+    session = get_http_session()
+    elapsed = 0
+    
+    while elapsed < timeout:
+        data = {
+            'grant_type': 'device_code',
+            'code': device_code,
+            'client_id': CLIENT_ID,
+            'client_secret': CLIENT_SECRET,
+        }
 
+        async def request() -> tuple[int, dict]:
             async with session.post(TOKEN_URL, data=data) as resp:
-                result = await resp.json()
+                if resp.status in RETRYABLE_STATUSES:
+                    raise RetryableError(f"OAuth token endpoint: HTTP {resp.status}")
+                return resp.status, await resp.json(content_type=None)
+
+        try:
+            status, result = await endpoint(ENDPOINT_OAUTH).call(request)
+        except Exception as e:
+            # Сбой Яндекса не обрывает авторизацию — просто пропускаем этот опрос
+            logger.warning(f"OAuth: token poll failed: {e}")
+            status, result = None, {}
 
-                if resp.status == 200 and 'access_token' in result:
-                    logger.info("OAuth: Token received successfully")
-                    return result['access_token']
+        if status == 200 and 'access_token' in result:
+            logger.info("OAuth: Token received successfully")
+            return result['access_token']
 
-                error = result.get('error', '')
+        error = result.get('error', '')
 
-                if error == 'authorization_pending':
+        if status is None or error == 'authorization_pending':
 
-                    pass
-                elif error == 'slow_down':
+            pass
+        elif error == 'slow_down':
 
-                    interval += 1
-                elif error in ('expired_token', 'access_denied'):
+            interval += 1
+        elif error in ('expired_token', 'access_denied'):
 
-                    logger.warning(f"OAuth: {error}")
-                    return None
-                else:
-                    logger.error(f"OAuth unexpected error: {result}")
+            logger.warning(f"OAuth: {error}")
+            return None
+        else:
+            logger.error(f"OAuth unexpected error: {result}")
 
-            await asyncio.sleep(interval)
-            elapsed += interval
+        await asyncio.sleep(interval)
+        elapsed += interval
 
-        logger.warning("OAuth: Polling timeout")
-        return None
+    logger.warning("OAuth: Polling timeout")
+    return None
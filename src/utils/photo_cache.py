@@ -0,0 +1,94 @@
+"""
+Кеш file_id для фото, которые бот отправляет в ответ на загрузку.
+
+Заглушка `bot_fallback_cover.png` и одинаковые обложки альбома отправляются
+снова и снова. После первой отправки Telegram возвращает file_id — сохраняем
+его по SHA-256 картинки (в памяти и в таблице photo_cache) и дальше шлём
+ссылку вместо байтов. Если Telegram отверг именно сохранённый file_id
+(устарел, неверный идентификатор), запись удаляется и картинка загружается
+заново; остальные ошибки (длинная подпись, разметка) пробрасываются как есть.
+"""
+import hashlib
+import logging
+from collections import OrderedDict
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import BufferedInputFile, Message
+
+from src.database import crud
+from src.database.models import async_session
+
+logger = logging.getLogger(__name__)
+
+# Сколько file_id держать в памяти поверх таблицы
+MEMORY_LIMIT = 1024
+
+_memory: "OrderedDict[str, str]" = OrderedDict()
+
+# Фрагменты ответов Telegram, означающие, что не годится сам file_id
+FILE_ID_ERRORS = (
+    "wrong file identifier",
+    "wrong remote file identifier",
+    "file reference expired",
+    "file_reference_expired",
+    "wrong file_id",
+    "media_empty",
+)
+
+
+def _is_file_id_error(error: TelegramBadRequest) -> bool:
+    text = str(error).lower()
+    return any(marker in text for marker in FILE_ID_ERRORS)
+
+
+def _remember(content_hash: str, file_id: str) -> None:
+    _memory[content_hash] = file_id
+    _memory.move_to_end(content_hash)
+    while len(_memory) > MEMORY_LIMIT:
+        _memory.popitem(last=False)
+
+
+async def _lookup(content_hash: str) -> str | None:
+    file_id = _memory.get(content_hash)
+    if file_id:
+        _memory.move_to_end(content_hash)
+        return file_id
+
+    async with async_session() as session:
+        file_id = await crud.get_photo_file_id(session, content_hash)
+    if file_id:
+        _remember(content_hash, file_id)
+    return file_id
+
+
+async def _forget(content_hash: str) -> None:
+    _memory.pop(content_hash, None)
+    async with async_session() as session:
+        await crud.delete_photo_file_id(session, content_hash)
+
+
+async def answer_cached_photo(message: Message, data: bytes, filename: str = "cover.jpg", **kwargs) -> Message:
+    """
+    Отправляет фото ответом на message, по возможности через сохранённый file_id.
+
+    kwargs передаются в `message.answer_photo` (caption, parse_mode, ...).
+    """
+    content_hash = hashlib.sha256(data).hexdigest()
+
+    file_id = await _lookup(content_hash)
+    if file_id:
+        try:
+            return await message.answer_photo(file_id, **kwargs)
+        except TelegramBadRequest as e:
+            if not _is_file_id_error(e):
+                raise
+            logger.warning(f"Cached photo file_id rejected ({e}), re-uploading")
+            await _forget(content_hash)
+
+    sent = await message.answer_photo(BufferedInputFile(data, filename=filename), **kwargs)
+    if sent.photo:
+        new_file_id = sent.photo[-1].file_id
+        _remember(content_hash, new_file_id)
+        async with async_session() as session:
+            await crud.set_photo_file_id(session, content_hash, new_file_id)
+    return sent
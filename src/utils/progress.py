@@ -0,0 +1,165 @@
+"""
+Статус-сообщения, которые правятся с ограничением частоты.
+
+Каждый `edit_text` тратит лимит Telegram (около одной правки в секунду
+на чат и ~30 запросов в секунду на бота), а промежуточные стадии пользователю
+всё равно не успеть прочитать. `ProgressReporter` хранит только последний
+желаемый текст сообщения и отправляет его не чаще раза в PROGRESS_EDIT_INTERVAL
+секунд; всё, что успело смениться между правками, просто перезаписывается.
+`update` не ждёт сеть, поэтому его можно звать хоть на каждый отправленный
+кусок файла. На `TelegramRetryAfter` репортер замолкает на указанное время
+и потом отправляет самое свежее состояние.
+
+Сверху все репортеры бота делят общий темп PROGRESS_GLOBAL_RATE правок
+в секунду, чтобы статусы не съедали лимит, нужный для настоящих ответов.
+
+Переменные окружения:
+    PROGRESS_EDIT_INTERVAL — минимальный интервал между правками одного сообщения, сек (по умолчанию 2)
+    PROGRESS_GLOBAL_RATE   — максимум правок статусов в секунду на весь бот (по умолчанию 20)
+"""
+import os
+import asyncio
+import logging
+from typing import Callable, Optional
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import Message
+
+logger = logging.getLogger(__name__)
+
+EDIT_INTERVAL = float(os.getenv("PROGRESS_EDIT_INTERVAL", "2"))
+GLOBAL_RATE = float(os.getenv("PROGRESS_GLOBAL_RATE", "20"))
+
+# Сколько раз пытаться показать финальный текст при flood-wait
+CLOSE_ATTEMPTS = 3
+
+# Колбэк побайтового прогресса: (передано байт, всего байт)
+ProgressCallback = Callable[[int, int], None]
+
+
+class _EditPacer:
+    """Раздаёт слоты на правки равномерно, не чаще rate в секунду."""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._next_slot = 0.0
+
+    async def wait(self) -> None:
+        if self.rate <= 0:
+            return
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + 1 / self.rate
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+_pacer = _EditPacer(GLOBAL_RATE)
+
+
+class ProgressReporter:
+    """
+    Одно статус-сообщение с отложенными, склеивающимися правками.
+
+    kwargs конструктора (parse_mode, reply_markup, ...) передаются в каждый
+    `edit_text`; kwargs `update`/`close` их дополняют.
+    """
+
+    def __init__(self, message: Message, interval: float = EDIT_INTERVAL, **edit_kwargs):
+        self.message = message
+        self.interval = interval
+        self._edit_kwargs = edit_kwargs
+        self._wanted: Optional[tuple[str, dict]] = None
+        self._shown: Optional[str] = None
+        self._next_edit = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+
+    def update(self, text: str, **kwargs) -> None:
+        """Запоминает новый текст; до сети дойдёт только последний к моменту правки."""
+        if self._closed:
+            return
+        self._wanted = (text, kwargs)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        while self._wanted is not None:
+            delay = self._next_edit - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            text, kwargs = self._wanted
+            self._wanted = None
+            if not await self._edit(text, kwargs) and self._wanted is None:
+                # Не получилось из-за flood-wait — повторим, если новее ничего не пришло
+                self._wanted = (text, kwargs)
+
+    async def _edit(self, text: str, kwargs: dict) -> bool:
+        """False — правку надо повторить после flood-wait."""
+        if text == self._shown:
+            return True
+        loop = asyncio.get_running_loop()
+        await _pacer.wait()
+        try:
+            await self.message.edit_text(text, **{**self._edit_kwargs, **kwargs})
+        except TelegramRetryAfter as e:
+            logger.warning(f"Progress edit flood-wait {e.retry_after}s (chat {self.message.chat.id})")
+            self._next_edit = loop.time() + e.retry_after
+            return False
+        except TelegramBadRequest as e:
+            # «message is not modified», удалённое сообщение и т.п. — правку пропускаем
+            logger.debug(f"Progress edit skipped: {e}")
+            self._next_edit = loop.time() + self.interval
+            return True
+        self._shown = text
+        self._next_edit = loop.time() + self.interval
+        return True
+
+    async def close(self, text: Optional[str] = None, **kwargs) -> None:
+        """
+        Отменяет отложенные правки. Если передан text — показывает его
+        (с учётом flood-wait), а если сообщение править уже нельзя — шлёт новым.
+        """
+        self._closed = True
+        self._wanted = None
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if text is None or text == self._shown:
+            return
+
+        loop = asyncio.get_running_loop()
+        for _ in range(CLOSE_ATTEMPTS):
+            delay = self._next_edit - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await _pacer.wait()
+            try:
+                await self.message.edit_text(text, **{**self._edit_kwargs, **kwargs})
+                self._shown = text
+                return
+            except TelegramRetryAfter as e:
+                self._next_edit = loop.time() + e.retry_after
+            except TelegramBadRequest as e:
+                if "not modified" in str(e):
+                    return
+                logger.warning(f"Final progress edit failed ({e}), sending as new message")
+                await self.message.answer(text, **{**self._edit_kwargs, **kwargs})
+                return
+        logger.warning(f"Gave up showing final progress text in chat {self.message.chat.id}")
+
+
+def _megabytes(size: int) -> str:
+    return f"{size / 1024 / 1024:.1f}"
+
+
+def format_bytes_progress(done: int, total: int, width: int = 10) -> str:
+    """Полоска вида «▓▓▓▓░░░░░░ 42% · 12.3 / 29.0 МБ»."""
+    if total <= 0:
+        return f"{_megabytes(done)} МБ"
+    share = min(done / total, 1.0)
+    filled = int(share * width)
+    bar = "▓" * filled + "░" * (width - filled)
+    return f"{bar} {int(share * 100)}% · {_megabytes(done)} / {_megabytes(total)} МБ"
@@ -0,0 +1,211 @@
+"""
+Ретраи и circuit breaker для запросов к Яндексу.
+
+Каждый эндпоинт (upload-url, post-target, edit-track-name, edit-track-cover,
+oauth) получает свой `Endpoint`: политику повторов и свой автомат.
+
+Повторы. Ошибка повторяется, только если она временная: таймаут, обрыв
+соединения, 5xx/429 (`RetryableError`), сетевые ошибки yandex_music кроме
+400/404. Всё остальное (401/403, 400, неверные данные) сразу уходит наверх.
+Пауза между попытками — экспонента с full jitter: случайное время от нуля до
+min(max_delay, base_delay * 2^попытка), чтобы параллельные загрузки
+не ретраили синхронно.
+
+Circuit breaker. После failure_threshold временных ошибок подряд эндпоинт
+«открывается»: вызовы reset_timeout секунд сразу падают с `CircuitOpenError`,
+не занимая воркер ожиданием деградировавшего Яндекса. Затем один пробный
+вызов (half-open): успех закрывает автомат, ошибка открывает его снова.
+
+Переменные окружения (общие и для конкретного эндпоинта, например
+RETRY_POST_TARGET_ATTEMPTS перекрывает RETRY_ATTEMPTS):
+    RETRY_ATTEMPTS            — попыток на вызов (по умолчанию 3)
+    RETRY_BASE_DELAY          — базовая пауза, сек (по умолчанию 1)
+    RETRY_MAX_DELAY           — максимальная пауза, сек (по умолчанию 20)
+    BREAKER_FAILURE_THRESHOLD — ошибок подряд до открытия автомата (по умолчанию 5)
+    BREAKER_RESET_TIMEOUT     — сколько секунд автомат открыт (по умолчанию 30)
+"""
+import os
+import time
+import random
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Awaitable, Callable, TypeVar
+
+import aiohttp
+from yandex_music.exceptions import BadRequestError, NetworkError, NotFoundError
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+ENDPOINT_UPLOAD_URL = "upload-url"
+ENDPOINT_POST_TARGET = "post-target"
+ENDPOINT_EDIT_NAME = "edit-track-name"
+ENDPOINT_EDIT_COVER = "edit-track-cover"
+ENDPOINT_OAUTH = "oauth"
+
+# HTTP-статусы, после которых имеет смысл повторить запрос
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class RetryableError(Exception):
+    """Временная ошибка эндпоинта (5xx, 429, неожиданный ответ) — запрос можно повторить."""
+
+
+class CircuitOpenError(Exception):
+    """Автомат эндпоинта открыт: Яндекс сейчас деградировал, запрос не отправлялся."""
+
+
+def _setting(endpoint: str, name: str, default: str) -> float:
+    # RETRY_ATTEMPTS → RETRY_POST_TARGET_ATTEMPTS
+    prefix, _, key = name.partition("_")
+    specific = f"{prefix}_{endpoint.upper().replace('-', '_')}_{key}"
+    return float(os.getenv(specific, os.getenv(name, default)))
+
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, (RetryableError, asyncio.TimeoutError, aiohttp.ClientConnectionError, aiohttp.ClientPayloadError)):
+        return True
+    if isinstance(error, NetworkError):
+        # BadRequestError и NotFoundError — наследники NetworkError, но повторять их бессмысленно
+        return not isinstance(error, (BadRequestError, NotFoundError))
+    return False
+
+
+def check_status(status: int, text: str, what: str) -> None:
+    """Кидает RetryableError для временных HTTP-статусов и обычную ошибку для остальных не-2xx."""
+    if 200 <= status <= 299:
+        return
+    message = f"{what}: HTTP {status}. Response: {text}"
+    if status in RETRYABLE_STATUSES:
+        raise RetryableError(message)
+    raise Exception(message)
+
+
+@dataclass
+class RetryPolicy:
+    attempts: int = 3
+    base_delay: float = 1.0
+    max_delay: float = 20.0
+
+    def delay(self, attempt: int) -> float:
+        """Пауза после неудачной попытки номер attempt (с 1): экспонента с full jitter."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            # Пропускаем ровно один пробный запрос
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+        return self.state == self.CLOSED
+
+    def record_success(self) -> None:
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def release_probe(self) -> None:
+        """Пробный запрос отменён, не дав ответа — следующий вызов станет новой пробой."""
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+
+    def retry_after(self) -> float:
+        """Через сколько секунд автомат пропустит пробный запрос."""
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+
+class Endpoint:
+    def __init__(self, name: str, policy: RetryPolicy, breaker: CircuitBreaker):
+        self.name = name
+        self.policy = policy
+        self.breaker = breaker
+
+    async def call(self, func: Callable[[], Awaitable[T]]) -> T:
+        """
+        Выполняет func() с ретраями временных ошибок через автомат эндпоинта.
+
+        Raises:
+            CircuitOpenError: автомат открыт, запрос не отправлялся.
+            Последнюю ошибку func, если она не временная или попытки кончились.
+        """
+        for attempt in range(1, self.policy.attempts + 1):
+            if not self.breaker.allow():
+                raise CircuitOpenError(
+                    f"{self.name} is temporarily unavailable, retry in {self.breaker.retry_after():.0f}s"
+                )
+            try:
+                result = await func()
+            except asyncio.CancelledError:
+                self.breaker.release_probe()
+                raise
+            except Exception as e:
+                if not is_retryable(e):
+                    # Яндекс ответил осмысленной ошибкой — сам эндпоинт жив
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                if attempt == self.policy.attempts:
+                    raise
+                delay = self.policy.delay(attempt)
+                logger.warning(
+                    f"{self.name}: attempt {attempt}/{self.policy.attempts} failed ({e!r}), retrying in {delay:.1f}s"
+                )
+                await asyncio.sleep(delay)
+            else:
+                self.breaker.record_success()
+                return result
+
+
+def _make_endpoint(name: str) -> Endpoint:
+    policy = RetryPolicy(
+        attempts=max(1, int(_setting(name, "RETRY_ATTEMPTS", "3"))),
+        base_delay=_setting(name, "RETRY_BASE_DELAY", "1"),
+        max_delay=_setting(name, "RETRY_MAX_DELAY", "20"),
+    )
+    breaker = CircuitBreaker(
+        failure_threshold=int(_setting(name, "BREAKER_FAILURE_THRESHOLD", "5")),
+        reset_timeout=_setting(name, "BREAKER_RESET_TIMEOUT", "30"),
+    )
+    return Endpoint(name, policy, breaker)
+
+
+endpoints: dict[str, Endpoint] = {
+    name: _make_endpoint(name)
+    for name in (ENDPOINT_UPLOAD_URL, ENDPOINT_POST_TARGET, ENDPOINT_EDIT_NAME, ENDPOINT_EDIT_COVER, ENDPOINT_OAUTH)
+}
+
+
+def endpoint(name: str) -> Endpoint:
+    return endpoints[name]
+
+
+def breaker_states() -> dict[str, str]:
+    """Состояние автоматов по эндпоинтам — для логов и админки."""
+    return {name: ep.breaker.state for name, ep in endpoints.items()}
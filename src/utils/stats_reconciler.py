@@ -0,0 +1,58 @@
+"""
+Периодическая сверка счётчиков админки с таблицами.
+
+Счётчики пользователей и треков (таблица counters) меняются вместе с
+данными, поэтому админка читает готовые итоги вместо COUNT(*) по растущей
+tracks. Если данные менялись в обход crud (ручные правки, удаления), итоги
+разъедутся — фоновая задача раз в STATS_RECONCILE_INTERVAL секунд
+пересчитывает их и пишет расхождение в лог. Первая сверка — сразу при старте.
+
+Переменные окружения:
+    STATS_RECONCILE_INTERVAL — интервал сверки в секундах (по умолчанию 3600, 0 — только при старте)
+"""
+import os
+import asyncio
+import logging
+
+from src.database import crud
+from src.database.models import async_session
+
+logger = logging.getLogger(__name__)
+
+INTERVAL = float(os.getenv("STATS_RECONCILE_INTERVAL", "3600"))
+
+
+class StatsReconciler:
+    def __init__(self, interval: float = INTERVAL):
+        self.interval = interval
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop(), name="stats-reconciler")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def reconcile(self) -> dict[str, int]:
+        async with async_session() as session:
+            drift = await crud.reconcile_counters(session)
+        if drift:
+            logger.warning(f"Stats counters drifted, fixed: {drift}")
+        return drift
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.reconcile()
+            except Exception:
+                logger.exception("Stats reconciliation failed")
+            if self.interval <= 0:
+                return
+            await asyncio.sleep(self.interval)
+
+
+stats_reconciler = StatsReconciler()
@@ -0,0 +1,216 @@
+"""
+Потоковая передача трека из Telegram сразу в Яндекс, без промежуточного файла.
+
+Обычно трек сначала целиком скачивается в `downloads/`, и только потом начинается
+загрузка в Яндекс: итоговое время = скачивание + загрузка. В потоковом режиме
+куски из Telegram сразу уходят в multipart-тело `post-target`, и оба переноса
+идут одновременно.
+
+    * ID3v2-тег читается из первых байт потока (`read_header`) — для метаданных
+      и обложки не нужен файл на диске.
+    * Тело для повторной отправки при ретрае сохраняется в SpooledTemporaryFile,
+      только если файл не больше STREAM_SPOOL_MAX_SIZE; до STREAM_SPOOL_MEMORY
+      байт он живёт в памяти. Большие файлы при ретрае заново читаются из Telegram.
+      Так пиковое использование диска на задачу ограничено STREAM_SPOOL_MAX_SIZE.
+
+Включается переменной UPLOAD_STREAMING=1. С локальным Bot API сервером
+не используется — там файл и так лежит на диске (см. local_files.py).
+
+Переменные окружения:
+    UPLOAD_STREAMING       — 1, чтобы включить потоковый режим (по умолчанию выключен)
+    STREAM_CHUNK_SIZE      — размер куска из Telegram в байтах (по умолчанию 262144)
+    STREAM_HEADER_LIMIT    — максимум байт под ID3-тег (по умолчанию 16 МБ)
+    STREAM_SPOOL_MEMORY    — сколько держать в памяти для ретрая (по умолчанию 8 МБ)
+    STREAM_SPOOL_MAX_SIZE  — файлы больше этого не спулятся, а перечитываются (по умолчанию 64 МБ)
+    STREAM_TIMEOUT         — таймаут чтения файла из Telegram в секундах (по умолчанию 300)
+"""
+import os
+import asyncio
+import logging
+import tempfile
+from typing import AsyncIterator, Optional
+
+from aiogram import Bot
+from aiohttp.abc import AbstractStreamWriter
+from aiohttp.payload import Payload
+
+from src.utils.fingerprint import new_hasher
+from src.utils.progress import ProgressCallback
+
+logger = logging.getLogger(__name__)
+
+STREAMING_ENABLED = os.getenv("UPLOAD_STREAMING", "0") == "1"
+CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", str(256 * 1024)))
+HEADER_LIMIT = int(os.getenv("STREAM_HEADER_LIMIT", str(16 * 1024 * 1024)))
+SPOOL_MEMORY = int(os.getenv("STREAM_SPOOL_MEMORY", str(8 * 1024 * 1024)))
+SPOOL_MAX_SIZE = int(os.getenv("STREAM_SPOOL_MAX_SIZE", str(64 * 1024 * 1024)))
+STREAM_TIMEOUT = int(os.getenv("STREAM_TIMEOUT", "300"))
+
+
+def is_streaming_available(bot: Bot) -> bool:
+    return STREAMING_ENABLED and not bot.session.api.is_local
+
+
+def id3_tag_size(head: bytes) -> int | None:
+    """Полный размер ID3v2-тега по 10-байтному заголовку, None если тега нет."""
+    if len(head) < 10 or head[:3] != b"ID3":
+        return None
+    size = 0
+    for b in head[6:10]:
+        size = (size << 7) | (b & 0x7F)  # syncsafe integer
+    footer = 10 if head[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+class TelegramFileStream:
+    """Поток байт файла из Telegram с возможностью заглянуть в начало."""
+
+    def __init__(self, bot: Bot, file_path: str):
+        self._bot = bot
+        self._file_path = file_path
+        self._iterator: AsyncIterator[bytes] | None = None
+        self._head = bytearray()
+
+    def open(self) -> AsyncIterator[bytes]:
+        """Новый поток с начала файла."""
+        url = self._bot.session.api.file_url(self._bot.token, self._file_path)
+        return self._bot.session.stream_content(
+            url=url,
+            timeout=STREAM_TIMEOUT,
+            chunk_size=CHUNK_SIZE,
+            raise_for_status=True,
+        )
+
+    async def read_header(self) -> bytes:
+        """
+        Читает из потока ID3v2-тег (или первый кусок, если тега нет).
+
+        Прочитанные байты не теряются: `body()` отдаст их первыми.
+        """
+        self._iterator = self.open()
+        need = 10
+        while len(self._head) < need:
+            try:
+                chunk = await self._iterator.__anext__()
+            except StopAsyncIteration:
+                break
+            self._head.extend(chunk)
+            tag_size = id3_tag_size(bytes(self._head[:10]))
+            if tag_size is not None:
+                need = min(tag_size, HEADER_LIMIT)
+        return bytes(self._head)
+
+    async def body(self) -> AsyncIterator[bytes]:
+        """Остаток первого потока, начиная с уже прочитанного заголовка."""
+        if self._iterator is None:
+            self._iterator = self.open()
+        if self._head:
+            yield bytes(self._head)
+            self._head = bytearray()
+        async for chunk in self._iterator:
+            yield chunk
+        self._iterator = None
+
+    async def aclose(self) -> None:
+        if self._iterator is not None:
+            await self._iterator.aclose()
+            self._iterator = None
+
+
+class PipedAudioPayload(Payload):
+    """
+    Payload для aiohttp, отдающий файл прямо из потока Telegram.
+
+    Первая отправка читает живой поток. Повторная — из спула, если файл
+    был заспулен целиком, иначе из нового потока Telegram.
+    Спул живёт между ретраями, поэтому освобождается явно через `release()`.
+    """
+
+    _autoclose = True  # aiohttp не должен закрывать payload после первой отправки
+
+    def __init__(
+        self,
+        stream: TelegramFileStream,
+        size: int,
+        on_progress: Optional[ProgressCallback] = None,
+        **kwargs,
+    ):
+        kwargs.setdefault("content_type", "application/octet-stream")
+        super().__init__(stream, **kwargs)
+        self._stream = stream
+        self._size = size
+        self._first_send = True
+        self._spool: tempfile.SpooledTemporaryFile | None = None
+        self._spool_complete = False
+        self.on_progress = on_progress
+        # SHA-256 тела, известен после первой полной отправки
+        self.content_hash: str | None = None
+
+    async def _source(self) -> AsyncIterator[bytes]:
+        if self._first_send:
+            self._first_send = False
+            if self._size <= SPOOL_MAX_SIZE:
+                self._spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY)
+            async for chunk in self._stream.body():
+                if self._spool is not None:
+                    await asyncio.to_thread(self._spool.write, chunk)
+                yield chunk
+            return
+
+        if self._spool_complete:
+            await asyncio.to_thread(self._spool.seek, 0)
+            while chunk := await asyncio.to_thread(self._spool.read, CHUNK_SIZE):
+                yield chunk
+            return
+
+        logger.info("Replaying streamed upload body from Telegram")
+        async for chunk in self._stream.open():
+            yield chunk
+
+    async def write(self, writer: AbstractStreamWriter) -> None:
+        await self.write_with_length(writer, None)
+
+    async def write_with_length(self, writer: AbstractStreamWriter, content_length: Optional[int]) -> None:
+        remaining = self._size if content_length is None else min(self._size, content_length)
+        full = content_length is None or content_length >= self._size
+        hasher = new_hasher() if full and self.content_hash is None else None
+        sent = 0
+        source = self._source()
+        try:
+            async for chunk in source:
+                chunk = chunk[:remaining]
+                if hasher is not None:
+                    hasher.update(chunk)
+                await writer.write(chunk)
+                remaining -= len(chunk)
+                sent += len(chunk)
+                if self.on_progress is not None:
+                    self.on_progress(sent, self._size)
+                if remaining <= 0:
+                    break
+        finally:
+            await source.aclose()
+
+        if remaining > 0:
+            raise IOError(f"Telegram stream ended early: {remaining} bytes missing")
+        if hasher is not None:
+            self.content_hash = hasher.hexdigest()
+        if self._spool is not None and full:
+            # Тело целиком прошло через спул — ретрай можно отдать из него
+            self._spool_complete = True
+
+    def decode(self, encoding: str = "utf-8", errors: str = "strict") -> str:
+        raise TypeError("PipedAudioPayload is a streaming payload and cannot be decoded")
+
+    async def release(self) -> None:
+        await self._stream.aclose()
+        if self._spool is not None:
+            self._spool.close()
+            self._spool = None
+            self._spool_complete = False
+
+
+async def open_telegram_stream(bot: Bot, file_id: str) -> tuple[TelegramFileStream, int]:
+    """Открывает поток файла Telegram и возвращает его вместе с размером."""
+    file = await bot.get_file(file_id)
+    return TelegramFileStream(bot, file.file_path), file.file_size
@@ -0,0 +1,83 @@
+"""
+Потоковая отдача файлов в multipart-запросы без блокировки event loop.
+
+`AsyncFilePayload` читает файл кусками фиксированного размера через aiofiles,
+поэтому память остаётся плоской даже для файлов на 2 ГБ, а обработчики
+других пользователей не ждут дисковый I/O. Файл открывается заново
+на каждую отправку — один и тот же payload можно переотправить при ретрае.
+Если задан `on_progress`, он вызывается после каждого куска с числом
+отправленных байт — для побайтового прогресса в статусе (см. progress.py).
+Попутно считается SHA-256 файла: после первой полной отправки он лежит
+в `content_hash`, отдельного прохода по файлу ради отпечатка не нужно.
+
+Переменные окружения:
+    UPLOAD_CHUNK_SIZE — размер куска чтения в байтах (по умолчанию 262144)
+"""
+import os
+import hashlib
+from typing import Optional
+
+import aiofiles
+import aiofiles.os
+from aiohttp.abc import AbstractStreamWriter
+from aiohttp.payload import Payload
+
+from src.utils.progress import ProgressCallback
+
+CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(256 * 1024)))
+
+
+class AsyncFilePayload(Payload):
+    """Payload для aiohttp, стримящий файл с диска через aiofiles."""
+
+    _autoclose = True  # Файл открывается только на время write()
+
+    def __init__(
+        self,
+        path: str,
+        size: int,
+        chunk_size: int = CHUNK_SIZE,
+        on_progress: Optional[ProgressCallback] = None,
+        **kwargs,
+    ):
+        kwargs.setdefault("content_type", "application/octet-stream")
+        super().__init__(path, **kwargs)
+        self._path = path
+        self._size = size
+        self._chunk_size = chunk_size
+        self.on_progress = on_progress
+        # SHA-256 файла, известен после первой полной отправки
+        self.content_hash: Optional[str] = None
+
+    @classmethod
+    async def open(cls, path: str, **kwargs) -> "AsyncFilePayload":
+        """Создаёт payload, узнавая размер файла без блокировки loop."""
+        stat = await aiofiles.os.stat(path)
+        return cls(path, stat.st_size, **kwargs)
+
+    async def write(self, writer: AbstractStreamWriter) -> None:
+        await self.write_with_length(writer, None)
+
+    async def write_with_length(self, writer: AbstractStreamWriter, content_length: Optional[int]) -> None:
+        remaining = self._size if content_length is None else min(self._size, content_length)
+        full = content_length is None or content_length >= self._size
+        hasher = hashlib.sha256() if full and self.content_hash is None else None
+        sent = 0
+        async with aiofiles.open(self._path, "rb") as f:
+            while remaining > 0:
+                chunk = await f.read(min(self._chunk_size, remaining))
+                if not chunk:
+                    break
+                if hasher is not None:
+                    hasher.update(chunk)
+                await writer.write(chunk)
+                remaining -= len(chunk)
+                sent += len(chunk)
+                if self.on_progress is not None:
+                    self.on_progress(sent, self._size)
+        if hasher is not None and remaining <= 0:
+            self.content_hash = hasher.hexdigest()
+
+    def decode(self, encoding: str = "utf-8", errors: str = "strict") -> str:
+        raise TypeError("AsyncFilePayload is a streaming payload and cannot be decoded")
+
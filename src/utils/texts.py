@@ -55,6 +55,7 @@ help_text = (
 
 • Бот сохраняет обложку и название из файла
 • Можно отправлять несколько файлов подряд
+• Повторы в тот же плейлист пропускаются — подпиши файл /force, чтобы загрузить заново
     """
 )
 
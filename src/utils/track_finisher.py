@@ -0,0 +1,218 @@
+"""
+Финальные шаги после загрузки файла: переименование трека и установка обложки.
+
+Оба шага (`edit-track-name` и `edit-track-cover`) выполняются параллельно.
+В отложенном режиме (TRACK_FINISH_DEFERRED=1) они уходят в фоновую очередь
+со своими ретраями, и пользователь получает «✅ Загружено» сразу, как только
+Яндекс принял файл. Ошибки шагов сохраняются по track_id (`FinishResult.errors`,
+`track_finisher.failures`), а не только пишутся в лог.
+
+Переменные окружения:
+    TRACK_FINISH_DEFERRED   — 1, чтобы выполнять шаги в фоне (по умолчанию выключено)
+    TRACK_FINISH_WORKERS    — число фоновых воркеров (по умолчанию 2)
+    TRACK_FINISH_RETRIES    — попыток на шаг в фоновом режиме (по умолчанию 3)
+    TRACK_FINISH_QUEUE_SIZE — размер фоновой очереди (по умолчанию 500)
+"""
+import os
+import asyncio
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional
+
+import aiohttp
+
+from src.utils.metadata import CoverImage
+from src.utils.yandex_clients import get_client, invalidate_client, is_auth_error
+from src.utils.retry_policy import ENDPOINT_EDIT_COVER, ENDPOINT_EDIT_NAME, endpoint
+
+logger = logging.getLogger(__name__)
+
+DEFERRED = os.getenv("TRACK_FINISH_DEFERRED", "0") == "1"
+WORKERS = int(os.getenv("TRACK_FINISH_WORKERS", "2"))
+RETRIES = int(os.getenv("TRACK_FINISH_RETRIES", "3"))
+QUEUE_SIZE = int(os.getenv("TRACK_FINISH_QUEUE_SIZE", "500"))
+
+# Сколько последних треков с ошибками помнить
+FAILURES_LIMIT = 1000
+
+STEP_RENAME = "rename"
+STEP_COVER = "cover"
+
+
+@dataclass
+class FinishJob:
+    token: str
+    track_id: str
+    full_title: Optional[str] = None
+    cover: Optional[CoverImage] = None
+    # Вызывается с окончательным результатом (в отложенном режиме — после всех ретраев)
+    on_done: Optional[Callable[["FinishResult"], Awaitable[None]]] = None
+
+
+@dataclass
+class FinishResult:
+    track_id: Optional[str]
+    errors: dict[str, str] = field(default_factory=dict)
+    deferred: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+
+def make_full_title(title: Optional[str], artist: Optional[str]) -> Optional[str]:
+    if not title:
+        return None
+    return f"{artist} - {title}" if artist and artist != "Unknown Artist" else title
+
+
+async def _rename(token: str, track_id: str, full_title: str) -> None:
+    client = await get_client(token)
+    logger.info(f"Renaming track {track_id} to: {full_title}")
+    await endpoint(ENDPOINT_EDIT_NAME).call(lambda: client.request.post(
+        url="https://music.yandex.ru/api/v2/handlers/edit-track-name",
+        json={"trackId": track_id, "value": full_title},
+        timeout=10,
+    ))
+
+
+async def _set_cover(token: str, track_id: str, cover: CoverImage) -> None:
+    client = await get_client(token)
+    logger.info(f"Uploading cover for track {track_id}")
+    filename = 'cover.png' if cover.mime == 'image/png' else 'cover.jpg'
+
+    async def post_cover():
+        # FormData одноразовая — собираем заново на каждую попытку
+        form_cover = aiohttp.FormData()
+        form_cover.add_field('cover', cover.data, filename=filename, content_type=cover.mime)
+        return await client.request.post(
+            url="https://music.yandex.ru/api/v2/handlers/edit-track-cover",
+            params={"trackId": track_id},
+            data=form_cover,
+            timeout=30,
+        )
+
+    await endpoint(ENDPOINT_EDIT_COVER).call(post_cover)
+
+
+def _steps(job: FinishJob, only: Optional[set[str]] = None) -> dict:
+    steps = {}
+    if job.full_title and (only is None or STEP_RENAME in only):
+        steps[STEP_RENAME] = _rename(job.token, job.track_id, job.full_title)
+    if job.cover and (only is None or STEP_COVER in only):
+        steps[STEP_COVER] = _set_cover(job.token, job.track_id, job.cover)
+    return steps
+
+
+async def run_finish_steps(job: FinishJob, only: Optional[set[str]] = None) -> FinishResult:
+    """Выполняет переименование и обложку параллельно, собирая ошибки по шагам."""
+    result = FinishResult(track_id=job.track_id)
+    steps = _steps(job, only)
+    outcomes = await asyncio.gather(*steps.values(), return_exceptions=True)
+
+    for name, outcome in zip(steps, outcomes):
+        if isinstance(outcome, asyncio.CancelledError):
+            raise outcome
+        if isinstance(outcome, Exception):
+            if is_auth_error(outcome):
+                invalidate_client(job.token)
+            logger.error(f"Track {job.track_id}: step '{name}' failed: {outcome}")
+            result.errors[name] = str(outcome) or type(outcome).__name__
+    return result
+
+
+class TrackFinisher:
+    """Фоновая очередь финальных шагов с ретраями и журналом ошибок по трекам."""
+
+    def __init__(self, workers: int = WORKERS, retries: int = RETRIES, max_size: int = QUEUE_SIZE):
+        self.workers = workers
+        self.retries = retries
+        self.max_size = max_size
+        self.failures: "OrderedDict[str, dict[str, str]]" = OrderedDict()
+        self._queue: asyncio.Queue | None = None
+        self._tasks: list[asyncio.Task] = []
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"track-finisher-{i}")
+            for i in range(self.workers)
+        ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, job: FinishJob) -> bool:
+        """Ставит шаги в фон. False — очередь не запущена или переполнена."""
+        if self._queue is None or not self._tasks:
+            return False
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    def status(self, track_id: str) -> dict[str, str]:
+        """Ошибки шагов трека после всех ретраев (пусто — всё прошло)."""
+        return dict(self.failures.get(track_id, {}))
+
+    async def _complete(self, job: FinishJob, result: FinishResult) -> None:
+        self._record(result)
+        if job.on_done is not None:
+            await job.on_done(result)
+
+    def _record(self, result: FinishResult) -> None:
+        if result.ok:
+            self.failures.pop(result.track_id, None)
+            return
+        self.failures[result.track_id] = result.errors
+        self.failures.move_to_end(result.track_id)
+        while len(self.failures) > FAILURES_LIMIT:
+            self.failures.popitem(last=False)
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                result = await run_finish_steps(job)
+                attempt = 1
+                while result.errors and attempt < self.retries:
+                    await asyncio.sleep(2 ** (attempt - 1))
+                    attempt += 1
+                    retry = await run_finish_steps(job, only=set(result.errors))
+                    result.errors = retry.errors
+                await self._complete(job, result)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception(f"Track finisher crashed on {job.track_id}")
+            finally:
+                self._queue.task_done()
+
+
+track_finisher = TrackFinisher()
+
+
+async def finish_track(job: FinishJob, deferred: bool = DEFERRED) -> FinishResult:
+    """
+    Запускает финальные шаги трека.
+
+    При deferred=True шаги уходят в фоновую очередь и функция сразу возвращает
+    FinishResult(deferred=True); если очередь недоступна — выполняет их на месте.
+    """
+    if deferred and track_finisher.submit(job):
+        return FinishResult(track_id=job.track_id, deferred=True)
+
+    result = await run_finish_steps(job)
+    await track_finisher._complete(job, result)
+    return result
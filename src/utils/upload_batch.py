@@ -0,0 +1,141 @@
+"""
+Пакетная загрузка: альбом или пачка файлов обрабатывается как одна задача.
+
+Когда пользователь пересылает альбом или выбирает сразу 30 файлов, каждое
+аудио приходит отдельным апдейтом. `BatchCollector` собирает их в пакет:
+сообщения одного пользователя, пришедшие с паузой меньше UPLOAD_BATCH_WINDOW
+секунд (альбом — это всегда несколько апдейтов подряд), попадают в одну пачку.
+Хендлеры не ждут: первый файл открывает пакет, и конца окна дожидается уже
+фоновая задача (`wait`), остальные файлы просто добавляются в открытый пакет.
+
+`BatchProgress` вместо статуса на каждый трек ведёт одно сообщение: счётчики
+меняются сколько угодно часто, а `edit_text` уходит не чаще раза
+в UPLOAD_BATCH_PROGRESS_INTERVAL секунд и только с последним состоянием
+(см. progress.py).
+
+Переменные окружения:
+    UPLOAD_BATCH_WINDOW            — пауза между файлами, закрывающая пакет, сек (по умолчанию 1.5)
+    UPLOAD_BATCH_MAX_FILES         — максимум файлов в одном пакете (по умолчанию 50)
+    UPLOAD_BATCH_PROGRESS_INTERVAL — минимальный интервал между правками статуса, сек (по умолчанию 3)
+"""
+import os
+import asyncio
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from aiogram.types import Message
+
+from src.utils.progress import ProgressReporter
+
+BATCH_WINDOW = float(os.getenv("UPLOAD_BATCH_WINDOW", "1.5"))
+BATCH_MAX_FILES = int(os.getenv("UPLOAD_BATCH_MAX_FILES", "50"))
+PROGRESS_INTERVAL = float(os.getenv("UPLOAD_BATCH_PROGRESS_INTERVAL", "3"))
+
+
+@dataclass
+class _OpenBatch:
+    messages: list[Message]
+    touched: float
+
+
+class BatchCollector:
+    """Собирает аудио одного пользователя, пришедшие почти одновременно, в пакет."""
+
+    def __init__(self, window: float = BATCH_WINDOW, max_files: int = BATCH_MAX_FILES):
+        self.window = window
+        self.max_files = max_files
+        self._open: dict[int, _OpenBatch] = {}
+
+    def add(self, user_id: int, message: Message) -> Optional[_OpenBatch]:
+        """
+        Добавляет сообщение в открытый пакет пользователя, не дожидаясь окна.
+
+        Возвращает новый пакет, если сообщение его открыло (его нужно дождаться
+        через `wait`), и None, если файл попал в уже открытый пакет.
+        """
+        loop = asyncio.get_running_loop()
+        batch = self._open.get(user_id)
+        if batch is not None and len(batch.messages) < self.max_files:
+            batch.messages.append(message)
+            batch.touched = loop.time()
+            return None
+
+        batch = _OpenBatch(messages=[message], touched=loop.time())
+        self._open[user_id] = batch
+        return batch
+
+    async def wait(self, user_id: int, batch: _OpenBatch) -> list[Message]:
+        """Ждёт, пока пакет закроется (пауза в окно или максимум файлов), и отдаёт его сообщения."""
+        loop = asyncio.get_running_loop()
+        while len(batch.messages) < self.max_files:
+            wait = batch.touched + self.window - loop.time()
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+
+        # Заполненный пакет мог уже смениться новым — его не трогаем
+        if self._open.get(user_id) is batch:
+            del self._open[user_id]
+        return batch.messages
+
+
+class BatchProgress:
+    """Счётчики пакета и одно общее статус-сообщение (через ProgressReporter)."""
+
+    def __init__(
+        self,
+        status_msg: Message,
+        total: int,
+        render: Callable[["BatchProgress"], str],
+        interval: float = PROGRESS_INTERVAL,
+    ):
+        self.total = total
+        self.render = render
+        self.running = 0
+        self.uploaded: list[str] = []
+        self.duplicates: list[str] = []
+        self.failed: list[tuple[str, str]] = []
+        self.warnings: list[str] = []
+        self._reporter = ProgressReporter(status_msg, interval=interval, parse_mode="HTML")
+
+    @property
+    def done(self) -> int:
+        return len(self.uploaded) + len(self.duplicates) + len(self.failed)
+
+    @property
+    def queued(self) -> int:
+        return self.total - self.done - self.running
+
+    def started(self) -> None:
+        self.running += 1
+        self._touch()
+
+    def add_uploaded(self, name: str, warning: str = "") -> None:
+        self.uploaded.append(name)
+        if warning:
+            self.warnings.append(name)
+        self._finish_one()
+
+    def add_duplicate(self, name: str, was_running: bool = True) -> None:
+        self.duplicates.append(name)
+        self._finish_one(was_running)
+
+    def add_failed(self, name: str, error: str, was_running: bool = True) -> None:
+        self.failed.append((name, error))
+        self._finish_one(was_running)
+
+    def _finish_one(self, was_running: bool = True) -> None:
+        if was_running:
+            self.running -= 1
+        self._touch()
+
+    def _touch(self) -> None:
+        # Промежуточные состояния между правками просто перезаписываются
+        self._reporter.update(self.render(self))
+
+    async def close(self, summary: str) -> None:
+        """Останавливает промежуточные правки и показывает итоговый текст."""
+        await self._reporter.close(summary)
+
+
+batch_collector = BatchCollector()
@@ -0,0 +1,184 @@
+"""
+Журнал загрузок в БД: на какой стадии каждый файл.
+
+Каждый принятый файл получает строку в `upload_jobs`, и по мере работы
+там отмечаются стадии:
+    queued → downloaded (файл на диске, хеш) → uploaded (Яндекс принял файл,
+    есть ugc-track-id) → done (переименование и обложка отработали или
+    окончательно не удались, флаги renamed / cover_set).
+Если бот упал или перезапустился посреди загрузки, незавершённые задачи
+продолжаются с последней пройденной стадии: скачанный файл не качается
+заново, а принятый Яндексом трек не заливается второй раз. Продолжает их
+только та реплика, что забрала аренду (см. upload_worker.py): задачи
+живых реплик не трогаются.
+
+Файлы задачи лежат в `downloads/<id задачи>/` и удаляются, когда задача
+завершилась. Всё остальное в `downloads/` при старте считается мусором
+от прерванных запусков и удаляется (`reclaim_orphans`) — кроме свежих
+записей: их могла только что создать другая реплика на том же диске.
+
+Переменные окружения:
+    UPLOAD_JOB_MAX_AGE — задачи старше стольких секунд не продолжаются (по умолчанию 86400)
+"""
+import os
+import time
+import shutil
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from aiogram.types import Message
+
+from src.database import crud
+from src.database.models import async_session, UploadJob, JOB_DOWNLOADED, JOB_UPLOADED, JOB_DONE, JOB_FAILED
+from src.utils.track_finisher import FinishResult, STEP_RENAME, STEP_COVER
+from src.utils.disk_budget import DOWNLOAD_DIR, disk_budget
+
+logger = logging.getLogger(__name__)
+
+JOB_MAX_AGE = int(os.getenv("UPLOAD_JOB_MAX_AGE", "86400"))
+# Записи в downloads/ моложе стольких секунд мусором не считаются
+ORPHAN_MIN_AGE = 600
+
+
+def job_dir(job_id: int) -> str:
+    return os.path.join(DOWNLOAD_DIR, str(job_id))
+
+
+async def create_job(
+    message: Message,
+    playlist_kind: str,
+    force: bool,
+    status_message_id: Optional[int] = None,
+    owner: Optional[str] = None,
+) -> UploadJob:
+    """
+    Записывает новый файл в журнал до постановки в очередь.
+
+    status_message_id — для воркеров, owner — бот, который выполняет задачу
+    сам и держит на неё аренду (см. upload_worker.py).
+    """
+    audio = message.audio
+    async with async_session() as session:
+        return await crud.create_upload_job(
+            session,
+            tg_id=message.from_user.id,
+            chat_id=message.chat.id,
+            playlist_kind=playlist_kind,
+            force=force,
+            tg_file_id=audio.file_id,
+            tg_file_unique_id=audio.file_unique_id,
+            file_name=audio.file_name or "track.mp3",
+            file_size=audio.file_size,
+            performer=audio.performer,
+            audio_title=audio.title,
+            status_message_id=status_message_id,
+            worker_id=owner,
+            heartbeat_at=datetime.now(timezone.utc) if owner else None,
+        )
+
+
+async def _update(job: UploadJob, **values) -> None:
+    async with async_session() as session:
+        await crud.update_upload_job(session, job.id, **values)
+    for key, value in values.items():
+        setattr(job, key, value)
+
+
+async def mark_downloaded(job: UploadJob, local_path: str, content_hash: str) -> None:
+    await _update(job, stage=JOB_DOWNLOADED, local_path=local_path, content_hash=content_hash)
+
+
+async def mark_uploaded(
+    job: UploadJob,
+    track_id: Optional[str],
+    artist: str,
+    title: str,
+    content_hash: Optional[str],
+) -> None:
+    """Яндекс принял файл: стадия и запись в tracks коммитятся вместе."""
+    values = dict(stage=JOB_UPLOADED, ugc_track_id=track_id, artist=artist, title=title, content_hash=content_hash)
+    async with async_session() as session:
+        await crud.update_upload_job(session, job.id, commit=False, **values)
+        await crud.add_track(
+            session, job.tg_id, artist, title,
+            playlist_kind=job.playlist_kind,
+            content_hash=content_hash,
+            tg_file_unique_id=job.tg_file_unique_id,
+        )
+        await session.commit()
+    for key, value in values.items():
+        setattr(job, key, value)
+
+
+async def finish(job: UploadJob, result: Optional[FinishResult] = None) -> None:
+    """Задача завершена (result — итог переименования и обложки, если они были)."""
+    values = {"stage": JOB_DONE}
+    if result is not None:
+        values.update(
+            renamed=STEP_RENAME not in result.errors,
+            cover_set=STEP_COVER not in result.errors,
+            error="; ".join(f"{step}: {error}" for step, error in result.errors.items()) or None,
+        )
+    await _update(job, **values)
+    await remove_job_files(job.id)
+
+
+async def mark_failed(job: UploadJob, error: str) -> None:
+    try:
+        await _update(job, stage=JOB_FAILED, error=error[:1000])
+    except Exception:
+        logger.exception(f"Failed to mark upload job {job.id} as failed")
+    await remove_job_files(job.id)
+
+
+async def remove_job_files(job_id: int) -> None:
+    path = job_dir(job_id)
+    if os.path.exists(path):
+        await asyncio.to_thread(shutil.rmtree, path, True)
+    await disk_budget.release(job_id)
+
+
+async def unfinished_jobs() -> list[UploadJob]:
+    """Незавершённые задачи для продолжения; слишком старые помечаются проваленными."""
+    expired_before = datetime.now(timezone.utc) - timedelta(seconds=JOB_MAX_AGE)
+    async with async_session() as session:
+        expired = await crud.fail_stale_upload_jobs(session, expired_before, "expired before resume")
+        jobs = await crud.get_unfinished_upload_jobs(session)
+    if expired:
+        logger.info(f"Marked {expired} stale upload jobs as failed")
+    return jobs
+
+
+def _reclaim(keep: set[str], fresh_after: float) -> int:
+    if not os.path.isdir(DOWNLOAD_DIR):
+        return 0
+    removed = 0
+    for name in os.listdir(DOWNLOAD_DIR):
+        if name in keep:
+            continue
+        path = os.path.join(DOWNLOAD_DIR, name)
+        if os.path.getmtime(path) > fresh_after:
+            continue
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            os.remove(path)
+        removed += 1
+    return removed
+
+
+async def reclaim_orphans(jobs: list[UploadJob]) -> int:
+    """Удаляет из downloads/ всё, что не принадлежит незавершённым задачам."""
+    # Задачи, созданные после выборки jobs, в неё не попали — их каталоги моложе ORPHAN_MIN_AGE
+    fresh_after = time.time() - ORPHAN_MIN_AGE
+    removed = await asyncio.to_thread(_reclaim, {str(job.id) for job in jobs}, fresh_after)
+    if removed:
+        logger.info(f"Reclaimed {removed} orphaned entries in {DOWNLOAD_DIR}/")
+
+    # Оставшиеся файлы продолжаемых задач уже занимают место — учитываем их в бюджете
+    for job in jobs:
+        if job.local_path and os.path.exists(job.local_path):
+            await disk_budget.adopt(job.id, job.local_path)
+    return removed
@@ -0,0 +1,151 @@
+"""
+Планировщик загрузок: ограниченная очередь задач и пул async-воркеров.
+
+Хендлер не качает и не заливает файл сам — он ставит задачу в очередь и сразу
+освобождается. Воркеры выполняют задачи с двумя ограничениями:
+    * глобально — не больше UPLOAD_WORKERS задач одновременно;
+    * на пользователя — не больше UPLOAD_PER_USER_LIMIT задач одновременно.
+Пользователи обслуживаются по кругу, поэтому один человек с сотней файлов
+не блокирует остальных. При переполнении очереди `submit` кидает `QueueFullError`.
+
+Переменные окружения:
+    UPLOAD_WORKERS        — число воркеров (по умолчанию 4)
+    UPLOAD_PER_USER_LIMIT — одновременных загрузок на пользователя (по умолчанию 2)
+    UPLOAD_QUEUE_SIZE     — максимум задач в ожидании (по умолчанию 200)
+"""
+import os
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+WORKERS = int(os.getenv("UPLOAD_WORKERS", "4"))
+PER_USER_LIMIT = int(os.getenv("UPLOAD_PER_USER_LIMIT", "2"))
+QUEUE_SIZE = int(os.getenv("UPLOAD_QUEUE_SIZE", "200"))
+
+
+class QueueFullError(Exception):
+    """Очередь загрузок заполнена — задачу нужно отклонить."""
+
+
+@dataclass
+class UploadJob:
+    user_id: int
+    run: Callable[[], Awaitable[None]]
+
+
+class UploadScheduler:
+    def __init__(self, workers: int = WORKERS, per_user_limit: int = PER_USER_LIMIT, max_size: int = QUEUE_SIZE):
+        self.workers = workers
+        self.per_user_limit = per_user_limit
+        self.max_size = max_size
+
+        self._pending: "OrderedDict[int, deque[UploadJob]]" = OrderedDict()
+        self._active: dict[int, int] = {}
+        self._pending_count = 0
+        self._cond: asyncio.Condition | None = None
+        self._tasks: list[asyncio.Task] = []
+
+    @property
+    def pending(self) -> int:
+        return self._pending_count
+
+    @property
+    def running(self) -> int:
+        return sum(self._active.values())
+
+    @property
+    def is_full(self) -> bool:
+        return self._pending_count >= self.max_size
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._cond = asyncio.Condition()
+        self._tasks = [
+            asyncio.create_task(self._worker(i), name=f"upload-worker-{i}")
+            for i in range(self.workers)
+        ]
+        logger.info(
+            f"Upload scheduler started (workers={self.workers}, per_user={self.per_user_limit}, queue={self.max_size})"
+        )
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def estimate_position(self, user_id: int) -> int:
+        """Сколько задач окажется перед новой задачей пользователя (0 — начнётся сразу)."""
+        # Задачи пользователей, упёршихся в свой лимит, свободный воркер не возьмёт
+        ahead = sum(
+            len(jobs) for uid, jobs in self._pending.items()
+            if uid == user_id or self._active.get(uid, 0) < self.per_user_limit
+        )
+        if self._active.get(user_id, 0) >= self.per_user_limit:
+            return max(ahead, 1)
+        free = self.workers - self.running
+        return max(0, ahead - free + 1)
+
+    async def submit(self, user_id: int, run: Callable[[], Awaitable[None]]) -> None:
+        """
+        Ставит задачу в очередь.
+
+        Raises:
+            QueueFullError: если в очереди уже `max_size` задач.
+        """
+        if self._cond is None:
+            raise RuntimeError("UploadScheduler is not started")
+
+        async with self._cond:
+            if self.is_full:
+                raise QueueFullError(f"Upload queue is full ({self.max_size})")
+
+            job = UploadJob(user_id=user_id, run=run)
+            self._pending.setdefault(user_id, deque()).append(job)
+            self._pending_count += 1
+            self._cond.notify()
+
+    def _next_job(self) -> UploadJob | None:
+        """Берёт задачу следующего по кругу пользователя, у которого не исчерпан лимит."""
+        for user_id, jobs in self._pending.items():
+            if self._active.get(user_id, 0) >= self.per_user_limit:
+                continue
+            job = jobs.popleft()
+            if jobs:
+                self._pending.move_to_end(user_id)
+            else:
+                del self._pending[user_id]
+            self._pending_count -= 1
+            self._active[user_id] = self._active.get(user_id, 0) + 1
+            return job
+        return None
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            async with self._cond:
+                job = self._next_job()
+                while job is None:
+                    await self._cond.wait()
+                    job = self._next_job()
+
+            try:
+                await job.run()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception(f"Upload job for user {job.user_id} failed")
+            finally:
+                async with self._cond:
+                    self._active[job.user_id] -= 1
+                    if not self._active[job.user_id]:
+                        del self._active[job.user_id]
+                    # Освободился слот пользователя — его задачи снова доступны
+                    self._cond.notify_all()
+
+
+upload_scheduler = UploadScheduler()
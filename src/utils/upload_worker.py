@@ -0,0 +1,297 @@
+"""
+Вынос загрузок в отдельные процессы-воркеры (worker.py) с общей очередью в Postgres.
+
+Загрузки — самая дорогая часть работы бота: с UPLOAD_BACKEND=local они идут
+в том же процессе, что общается с Telegram, и весь трафик в Яндекс упирается
+в канал одной машины. С UPLOAD_BACKEND=remote бот только записывает задачу
+в upload_jobs, а качают и заливают файлы воркеры на любом количестве машин.
+
+Очередь — сама таблица upload_jobs. Воркер забирает задачи запросом
+UPDATE ... WHERE id IN (SELECT ... FOR UPDATE SKIP LOCKED), записывая себя
+в worker_id, и держит аренду: раз в треть UPLOAD_WORKER_LEASE продлевает
+heartbeat_at. Если воркер упал, через UPLOAD_WORKER_LEASE секунд его задачи
+заберут другие и продолжат с последней пройденной стадии (см. upload_journal.py).
+Задача, которую бросали UPLOAD_WORKER_MAX_ATTEMPTS раз, считается проваленной,
+и воркер правит её сообщение со статусом, чтобы пользователь не ждал вечно.
+Внутри воркера задачи выполняет обычный upload_scheduler: забирается ровно
+столько, сколько у него свободных мест. Лимит на пользователя (UPLOAD_PER_USER_LIMIT)
+проверяет и запрос захвата: у пользователя берётся не больше задач, чем лимит
+минус уже взятые в работу любыми воркерами (см. crud.claim_upload_jobs).
+
+С UPLOAD_BACKEND=local аренда тоже держится: каждая реплика бота записывает
+себя владельцем задач, которые выполняет сама, и продлевает heartbeat_at.
+Упавшую реплику заменяют живые: раз в UPLOAD_WORKER_LEASE каждая забирает
+задачи без живого владельца (`start_local`) и продолжает их; задачи живых
+реплик при старте соседей больше не перезапускаются. При штатной остановке
+реплика отпускает свои задачи, и их сразу подхватывают остальные.
+
+Итог воркер сообщает в строку задачи (стадия, ошибка, артист и название),
+а одиночному файлу ещё и правит сообщение со статусом и присылает результат
+сам — Bot API не привязан к процессу. Итоги пакета собирает бот: `upload_watcher`
+следит за строками задач и отдаёт их по завершении.
+
+Переменные окружения:
+    UPLOAD_BACKEND             — local | remote (по умолчанию local)
+    UPLOAD_WORKER_POLL         — как часто проверять очередь и итоги задач, сек (по умолчанию 1)
+    UPLOAD_WORKER_LEASE        — через сколько секунд без продления задача считается брошенной (по умолчанию 60)
+    UPLOAD_WORKER_MAX_ATTEMPTS — сколько раз можно взять задачу (по умолчанию 3)
+"""
+import os
+import socket
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+
+from src.database import crud
+from src.database.models import async_session, UploadJob, JOB_FINAL_STAGES
+from src.utils.upload_queue import UploadScheduler, QueueFullError, upload_scheduler, PER_USER_LIMIT
+
+logger = logging.getLogger(__name__)
+
+BACKEND = os.getenv("UPLOAD_BACKEND", "local").lower()
+POLL_INTERVAL = float(os.getenv("UPLOAD_WORKER_POLL", "1"))
+LEASE = float(os.getenv("UPLOAD_WORKER_LEASE", "60"))
+MAX_ATTEMPTS = int(os.getenv("UPLOAD_WORKER_MAX_ATTEMPTS", "3"))
+
+
+def is_remote_uploads() -> bool:
+    return BACKEND == "remote"
+
+
+class UploadWorker:
+    """Забирает задачи из upload_jobs в свой upload_scheduler и держит на них аренду."""
+
+    def __init__(
+        self,
+        scheduler: UploadScheduler = upload_scheduler,
+        poll_interval: float = POLL_INTERVAL,
+        lease: float = LEASE,
+        max_attempts: int = MAX_ATTEMPTS,
+    ):
+        self.scheduler = scheduler
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.claimed = 0
+        self.exhausted = 0
+        self._run: Optional[Callable[[UploadJob], Awaitable[None]]] = None
+        self._on_exhausted: Optional[Callable[[UploadJob], Awaitable[None]]] = None
+        self._held: set[int] = set()
+        self._wakeup = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+
+    def start(
+        self,
+        run: Callable[[UploadJob], Awaitable[None]],
+        on_exhausted: Optional[Callable[[UploadJob], Awaitable[None]]] = None,
+    ) -> None:
+        """Запускает воркер; run выполняет одну взятую задачу, on_exhausted сообщает о проваленной по попыткам."""
+        if self._tasks:
+            return
+        self._run = run
+        self._on_exhausted = on_exhausted
+        self.scheduler.start()
+        self._tasks = [
+            asyncio.create_task(self._claim_loop(), name="upload-worker-claim"),
+            asyncio.create_task(self._heartbeat_loop(), name="upload-worker-heartbeat"),
+        ]
+        logger.info(f"Upload worker {self.worker_id} started (lease={self.lease}s)")
+
+    def start_local(self, resume: Callable[[list[UploadJob]], Awaitable[None]]) -> None:
+        """
+        Режим local: задачи выполняет сам бот, здесь только аренда.
+
+        Продлевает аренду задач, взятых через hold(), и раз в аренду забирает
+        задачи без живого владельца — их продолжает resume.
+        """
+        if self._tasks:
+            return
+        self._tasks = [
+            asyncio.create_task(self._adopt_loop(resume), name="upload-worker-adopt"),
+            asyncio.create_task(self._heartbeat_loop(), name="upload-worker-heartbeat"),
+        ]
+        logger.info(f"Upload leases for {self.worker_id} started (lease={self.lease}s)")
+
+    def hold(self, job_id: int) -> None:
+        """Держит аренду задачи, которую бот выполняет сам (UPLOAD_BACKEND=local)."""
+        self._held.add(job_id)
+
+    async def stop(self) -> None:
+        """Перестаёт брать задачи и прерывает текущие; аренду держит до release()."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.scheduler.stop()
+
+    async def release(self) -> None:
+        """Возвращает недоделанные задачи в очередь, чтобы их сразу взяли другие воркеры."""
+        if not self._held:
+            return
+        async with async_session() as session:
+            released = await crud.release_upload_jobs(session, self.worker_id, list(self._held))
+        self._held.clear()
+        if released:
+            logger.info(f"Released {released} unfinished upload jobs")
+
+    def stats(self) -> dict:
+        return {
+            "worker_id": self.worker_id,
+            "held": len(self._held),
+            "claimed": self.claimed,
+            "exhausted": self.exhausted,
+            "running": self.scheduler.running,
+            "pending": self.scheduler.pending,
+        }
+
+    def _free_slots(self) -> int:
+        return self.scheduler.workers - self.scheduler.running - self.scheduler.pending
+
+    async def _claim_loop(self) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                await self._fail_exhausted()
+            except Exception:
+                logger.exception("Failing exhausted upload jobs failed")
+            free = self._free_slots()
+            if free > 0:
+                try:
+                    await self._claim(free)
+                except Exception:
+                    logger.exception("Claiming upload jobs failed")
+            try:
+                # Освободившееся место будит цикл сразу, без ожидания следующего опроса
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _fail_exhausted(self) -> None:
+        async with async_session() as session:
+            jobs = await crud.fail_exhausted_upload_jobs(session, self.lease, self.max_attempts)
+        for job in jobs:
+            self.exhausted += 1
+            logger.warning(f"Upload job {job.id} failed: abandoned {job.attempts} times")
+            if self._on_exhausted is None:
+                continue
+            try:
+                await self._on_exhausted(job)
+            except Exception:
+                logger.exception(f"Failed to notify about exhausted upload job {job.id}")
+
+    async def _claim(self, limit: int) -> None:
+        async with async_session() as session:
+            jobs = await crud.claim_upload_jobs(
+                session, self.worker_id, limit, self.lease, PER_USER_LIMIT, self.max_attempts
+            )
+        for job in jobs:
+            self._held.add(job.id)
+            self.claimed += 1
+            try:
+                await self.scheduler.submit(job.tg_id, lambda job=job: self._execute(job))
+            except QueueFullError:
+                self._held.discard(job.id)
+                async with async_session() as session:
+                    await crud.release_upload_jobs(session, self.worker_id, [job.id])
+        if jobs:
+            logger.info(f"Claimed upload jobs {[job.id for job in jobs]}")
+
+    async def _adopt_loop(self, resume: Callable[[list[UploadJob]], Awaitable[None]]) -> None:
+        while True:
+            try:
+                async with async_session() as session:
+                    jobs = await crud.adopt_upload_jobs(session, self.worker_id, self.lease, list(self._held))
+                if jobs:
+                    self._held.update(job.id for job in jobs)
+                    logger.info(f"Adopted upload jobs {[job.id for job in jobs]}")
+                    await resume(jobs)
+            except Exception:
+                logger.exception("Adopting upload jobs failed")
+            await asyncio.sleep(self.lease)
+
+    async def _execute(self, job: UploadJob) -> None:
+        try:
+            await self._run(job)
+        finally:
+            self._wakeup.set()
+
+    async def _heartbeat_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            if not self._held:
+                continue
+            try:
+                async with async_session() as session:
+                    alive = await crud.heartbeat_upload_jobs(session, self.worker_id, list(self._held))
+            except Exception:
+                logger.exception("Upload jobs heartbeat failed")
+                continue
+            # Завершённые задачи отпускаем; задача может доделываться в фоне
+            # (track_finisher), поэтому аренда держится до конечной стадии, а не до конца run
+            self._held &= set(alive)
+
+
+@dataclass
+class _Waiter:
+    future: asyncio.Future
+    on_claimed: Optional[Callable[[], None]] = None
+    claimed: bool = False
+
+
+class UploadWatcher:
+    """Ждёт в боте завершения задач, которые выполняют воркеры: один опрос БД на все задачи."""
+
+    def __init__(self, poll_interval: float = POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self._waiters: dict[int, _Waiter] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def wait(self, job_id: int, on_claimed: Optional[Callable[[], None]] = None) -> UploadJob:
+        """Строка задачи после конечной стадии; on_claimed — когда её взял воркер."""
+        waiter = _Waiter(future=asyncio.get_running_loop().create_future(), on_claimed=on_claimed)
+        self._waiters[job_id] = waiter
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop(), name="upload-watcher")
+        try:
+            return await waiter.future
+        finally:
+            self._waiters.pop(job_id, None)
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self) -> None:
+        try:
+            while self._waiters:
+                await asyncio.sleep(self.poll_interval)
+                try:
+                    async with async_session() as session:
+                        jobs = await crud.get_upload_jobs(session, list(self._waiters))
+                except Exception:
+                    logger.exception("Polling upload jobs failed")
+                    continue
+                for job in jobs:
+                    self._check(job)
+        finally:
+            self._task = None
+
+    def _check(self, job: UploadJob) -> None:
+        waiter = self._waiters.get(job.id)
+        if waiter is None or waiter.future.done():
+            return
+        finished = job.stage in JOB_FINAL_STAGES
+        if not waiter.claimed and (job.worker_id or finished):
+            waiter.claimed = True
+            if waiter.on_claimed is not None:
+                waiter.on_claimed()
+        if finished:
+            waiter.future.set_result(job)
+
+
+upload_worker = UploadWorker()
+upload_watcher = UploadWatcher()
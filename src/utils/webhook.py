@@ -0,0 +1,228 @@
+"""
+Приём апдейтов через вебхук вместо long polling.
+
+В режиме BOT_MODE=webhook бот поднимает aiohttp-сервер и принимает
+апдейты от Telegram POST-запросами на WEBHOOK_PATH. Реплик может быть
+сколько угодно за балансировщиком: общее состояние лежит в БД и внешнем
+FSM-хранилище (см. fsm_storage.py).
+
+Каждый запрос проверяется по заголовку X-Telegram-Bot-Api-Secret-Token
+(WEBHOOK_SECRET) и сразу получает 200 — ответ не ждёт ни обработчиков,
+ни свободного слота. Апдейт кладётся в ограниченную очередь
+(WEBHOOK_QUEUE_SIZE), её разбирают WEBHOOK_MAX_IN_FLIGHT обработчиков.
+Если очередь полна, запрос получает 503 и Telegram повторит его позже.
+Долгая работа (ожидание пакета файлов, загрузка) из хендлеров уходит
+в фоновые задачи (см. background.py), поэтому обработчики не залипают.
+
+Telegram доставляет апдейт хотя бы один раз: повтор после таймаута или
+503 может прийти, когда первая копия уже в работе. Реплика помнит
+последние WEBHOOK_DEDUP_SIZE update_id и повторы не обрабатывает. Повтор,
+попавший на другую реплику, так не отсеять, но он бывает, только если
+ответ 200 потерялся в сети: принятый апдейт подтверждается сразу.
+
+При остановке новые апдейты получают 503, а очередь дорабатывается
+до WEBHOOK_DRAIN_TIMEOUT секунд.
+
+GET /healthz отвечает счётчиками — для балансировщика и мониторинга.
+
+Переменные окружения:
+    BOT_MODE                — polling | webhook (по умолчанию polling)
+    WEBHOOK_URL             — публичный адрес бота (https://bot.example.com); если задан, вебхук регистрируется при старте
+    WEBHOOK_PATH            — путь для апдейтов (по умолчанию /webhook)
+    WEBHOOK_HOST            — на каком адресе слушать (по умолчанию 0.0.0.0)
+    WEBHOOK_PORT            — на каком порту слушать (по умолчанию 8080)
+    WEBHOOK_SECRET          — секрет для заголовка Telegram, обязателен в режиме webhook
+    WEBHOOK_MAX_IN_FLIGHT   — сколько апдейтов обрабатывается одновременно (по умолчанию 100)
+    WEBHOOK_QUEUE_SIZE      — сколько принятых апдейтов может ждать обработки (по умолчанию 1000)
+    WEBHOOK_DEDUP_SIZE      — сколько последних update_id помнить для отсева повторов (по умолчанию 10000)
+    WEBHOOK_MAX_CONNECTIONS — сколько параллельных запросов разрешить Telegram, 1..100 (по умолчанию 40)
+    WEBHOOK_DRAIN_TIMEOUT   — сколько секунд дорабатывать очередь при остановке (по умолчанию 10)
+"""
+import os
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+logger = logging.getLogger(__name__)
+
+MODE = os.getenv("BOT_MODE", "polling").lower()
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").rstrip("/")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+MAX_IN_FLIGHT = int(os.getenv("WEBHOOK_MAX_IN_FLIGHT", "100"))
+QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+DEDUP_SIZE = int(os.getenv("WEBHOOK_DEDUP_SIZE", "10000"))
+MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", "10"))
+
+
+def is_webhook_mode() -> bool:
+    return MODE == "webhook"
+
+
+class BoundedRequestHandler(SimpleRequestHandler):
+    """SimpleRequestHandler с ограниченной очередью, пулом обработчиков и отсевом повторов."""
+
+    def __init__(
+        self,
+        dispatcher: Dispatcher,
+        bot: Bot,
+        max_in_flight: int = MAX_IN_FLIGHT,
+        queue_size: int = QUEUE_SIZE,
+        dedup_size: int = DEDUP_SIZE,
+        **kwargs: Any,
+    ):
+        super().__init__(dispatcher, bot, handle_in_background=True, **kwargs)
+        self.max_in_flight = max_in_flight
+        self.dedup_size = dedup_size
+        self._queue: asyncio.Queue[tuple[Bot, dict[str, Any]]] = asyncio.Queue(maxsize=queue_size)
+        # update_id -> None в порядке поступления: старые вытесняются первыми
+        self._seen: OrderedDict[int, None] = OrderedDict()
+        self._closing = False
+        self._overflowing = False
+        self.busy = 0
+        self.received = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.duplicates = 0
+        self.overflowed = 0
+
+    @property
+    def in_flight(self) -> int:
+        return self.busy
+
+    def _ensure_workers(self) -> None:
+        # Пул стартует с первым апдейтом — в конструкторе event loop ещё может не работать
+        if not self._background_feed_update_tasks:
+            for i in range(self.max_in_flight):
+                task = asyncio.create_task(self._worker(), name=f"webhook-worker-{i}")
+                self._background_feed_update_tasks.add(task)
+                task.add_done_callback(self._background_feed_update_tasks.discard)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        response = await super().handle(request)
+        if response.status == 401:
+            self.rejected += 1
+            logger.warning(f"Webhook request with a wrong secret token from {request.remote}")
+        return response
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        update = await request.json(loads=bot.session.json_loads)
+        if self._closing:
+            return web.Response(status=503)
+
+        update_id = update.get("update_id")
+        if update_id in self._seen:
+            # Повторная доставка: первая копия уже принята
+            self.duplicates += 1
+            return web.json_response({}, dumps=bot.session.json_dumps)
+
+        self._ensure_workers()
+        try:
+            self._queue.put_nowait((bot, update))
+        except asyncio.QueueFull:
+            # Не запоминаем update_id: Telegram повторит апдейт, и его надо будет принять
+            self.overflowed += 1
+            if not self._overflowing:
+                self._overflowing = True
+                logger.warning(f"Webhook queue is full ({self._queue.maxsize}), answering 503 until it drains")
+            return web.Response(status=503)
+        self._overflowing = False
+
+        if update_id is not None:
+            self._seen[update_id] = None
+            if len(self._seen) > self.dedup_size:
+                self._seen.popitem(last=False)
+        self.received += 1
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    async def _worker(self) -> None:
+        while True:
+            bot, update = await self._queue.get()
+            self.busy += 1
+            try:
+                await self._background_feed_update(bot, update)
+                self.processed += 1
+            except Exception:
+                self.failed += 1
+                logger.exception(f"Webhook update {update.get('update_id')} failed")
+            finally:
+                self.busy -= 1
+                self._queue.task_done()
+
+    async def close(self) -> None:
+        self._closing = True
+        workers = list(self._background_feed_update_tasks)
+        if self._queue.qsize() or self.busy:
+            logger.info(f"Draining {self._queue.qsize() + self.busy} webhook updates")
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout=DRAIN_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.warning(f"{self._queue.qsize() + self.busy} webhook updates left unprocessed at shutdown")
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        await super().close()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queued": self._queue.qsize(),
+            "queue_size": self._queue.maxsize,
+            "received": self.received,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "duplicates": self.duplicates,
+            "overflowed": self.overflowed,
+        }
+
+
+def build_app(bot: Bot, dp: Dispatcher, secret: str | None = WEBHOOK_SECRET) -> tuple[web.Application, BoundedRequestHandler]:
+    app = web.Application()
+    handler = BoundedRequestHandler(dp, bot, secret_token=secret)
+    handler.register(app, path=WEBHOOK_PATH)
+
+    async def healthz(request: web.Request) -> web.Response:
+        return web.json_response(handler.stats())
+
+    app.router.add_get("/healthz", healthz)
+    setup_application(app, dp, bot=bot)
+    return app, handler
+
+
+async def run_webhook(bot: Bot, dp: Dispatcher) -> None:
+    """Поднимает сервер вебхука и работает до отмены."""
+    if not WEBHOOK_SECRET:
+        raise RuntimeError("WEBHOOK_SECRET is required in webhook mode")
+
+    app, _ = build_app(bot, dp)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT)
+    await site.start()
+    logger.info(f"Webhook server listening on {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+
+    try:
+        if WEBHOOK_URL:
+            # Реплики регистрируют один и тот же адрес — повторный вызов безопасен.
+            # Накопившиеся апдейты не сбрасываем: при выкладке их дообработают новые реплики
+            await bot.set_webhook(
+                f"{WEBHOOK_URL}{WEBHOOK_PATH}",
+                secret_token=WEBHOOK_SECRET,
+                max_connections=MAX_CONNECTIONS,
+                allowed_updates=dp.resolve_used_update_types(),
+            )
+            logger.info(f"Webhook registered at {WEBHOOK_URL}{WEBHOOK_PATH}")
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
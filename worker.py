@@ -0,0 +1,73 @@
+"""
+Воркер загрузок: качает файлы из Telegram и заливает их в Яндекс вместо бота.
+
+Бот с UPLOAD_BACKEND=remote только ставит задачи в upload_jobs, а воркеры
+на любом количестве машин забирают их оттуда (см. src/utils/upload_worker.py).
+Воркеру нужны те же BOT_TOKEN, DATABASE_URL и ENCRYPTION_KEY, что и боту;
+число одновременных загрузок — UPLOAD_WORKERS. Схему БД создаёт бот (main.py),
+поэтому первым запускается он.
+
+Запуск:
+    python worker.py
+"""
+import asyncio
+import logging
+import os
+import sys
+import functools
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from src.handlers.upload import run_claimed_job, notify_exhausted_job
+from src.utils.bot_factory import create_bot
+from src.utils.http_session import init_http_session, close_http_session
+from src.utils.track_finisher import track_finisher
+from src.utils.upload_worker import upload_worker
+from src.utils import upload_journal
+
+async def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+    )
+    logger = logging.getLogger(__name__)
+
+    bot_token = os.getenv("BOT_TOKEN")
+    if not bot_token:
+        logger.error("Установите BOT_TOKEN")
+        sys.exit(1)
+
+    bot = create_bot(bot_token)
+
+    try:
+        # Файлы задач, которые ещё не завершены, могли скачать здесь до рестарта — их не трогаем
+        jobs = await upload_journal.unfinished_jobs()
+        await upload_journal.reclaim_orphans(jobs)
+    except Exception as e:
+        logger.error(f"Ошибка подключения к БД: {e}")
+        await bot.session.close()
+        return
+
+    await init_http_session()
+    track_finisher.start()
+    upload_worker.start(
+        functools.partial(run_claimed_job, bot),
+        on_exhausted=functools.partial(notify_exhausted_job, bot),
+    )
+
+    try:
+        logger.info("Воркер загрузок запущен...")
+        await asyncio.Event().wait()
+    finally:
+        await upload_worker.stop()
+        await track_finisher.stop()
+        await upload_worker.release()
+        await close_http_session()
+        await bot.session.close()
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("Воркер остановлен")